@@ -1,13 +1,17 @@
 import os
+import sqlite3
 import logging
-from flask import Flask
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (set LOG_LEVEL=DEBUG for verbose output)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 
@@ -24,15 +28,110 @@ csrf = CSRFProtect()
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "default-dev-key")  # Fallback for development
 app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///schoolhub.db'
+app.config['UPLOAD_CACHE_MAX_AGE'] = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 365 * 24 * 3600))  # Hashed upload URLs
+app.config['UPLOAD_STORAGE'] = os.environ.get('UPLOAD_STORAGE', 'local')  # 'local' or 's3' (see storage.py)
+app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+app.config['S3_PREFIX'] = os.environ.get('S3_PREFIX', '')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+app.config['S3_REGION'] = os.environ.get('S3_REGION')
+app.config['UPLOAD_PUBLIC_URL'] = os.environ.get('UPLOAD_PUBLIC_URL')  # Public bucket or CDN base URL, if any
+app.config['UPLOAD_MULTIPART_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['UPLOAD_PRESIGN_EXPIRES'] = int(os.environ.get('UPLOAD_PRESIGN_EXPIRES', 3600))  # Seconds
+app.config['UPLOAD_DIRECT_MAX_SIZE'] = int(os.environ.get('UPLOAD_DIRECT_MAX_SIZE', 5 * 1024 ** 3))  # Bytes
+# Largest request body; bigger files go through resumable (chunked) or direct uploads
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+# The media forms still take whole files in one POST until the dashboard has a resumable upload client
+app.config['MEDIA_FORM_MAX_CONTENT_LENGTH'] = int(os.environ.get('MEDIA_FORM_MAX_CONTENT_LENGTH', 5 * 1024 ** 3))
+app.config['RESUMABLE_UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'resumable_uploads')
+app.config['RESUMABLE_UPLOAD_CHUNK_SIZE'] = int(os.environ.get('RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['RESUMABLE_UPLOAD_MAX_SIZE'] = int(os.environ.get('RESUMABLE_UPLOAD_MAX_SIZE', 5 * 1024 ** 3))  # Bytes
+app.config['RESUMABLE_UPLOAD_EXPIRY'] = int(os.environ.get('RESUMABLE_UPLOAD_EXPIRY', 24 * 3600))  # Idle seconds
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///schoolhub.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['CREATE_TABLES'] = os.environ.get('CREATE_TABLES', '0') == '1'  # See migrate.py
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms to wait on a locked database
 app.config['WTF_CSRF_ENABLED'] = True  # Enable CSRF protection
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 60))  # Bounds staleness across workers
+app.config['NEWS_PER_PAGE'] = 20
+app.config['TC_PER_PAGE'] = 50
+app.config['REGISTRATION_CODES_PER_PAGE'] = 50
+# Public TC lookups per client IP per minute (0 disables), and seconds a "no TC found" answer is reused
+app.config['TC_RETRIEVAL_RATE_LIMIT'] = int(os.environ.get('TC_RETRIEVAL_RATE_LIMIT', 10))
+app.config['TC_NEGATIVE_CACHE_TTL'] = int(os.environ.get('TC_NEGATIVE_CACHE_TTL', 60))
+# Proxies in front of the app that append to X-Forwarded-For (Replit's is one); 0 trusts none
+app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 1))
+# werkzeug hash method and cost, e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000 (see bench_login.py)
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Seconds a logged-in identity is reused without a query; 0 disables. Other workers may lag by this much.
+app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 10))
+app.config['DASHBOARD_CACHE_TTL'] = int(os.environ.get('DASHBOARD_CACHE_TTL', 30))  # Seconds dashboard counts may lag
+app.config['ATTENDANCE_CHRONIC_ABSENCE'] = 0.10  # Share of marked days missed that flags a student
+app.config['SCHOOL_NAME'] = os.environ.get('SCHOOL_NAME', 'SchoolHub')
+app.config['ACADEMIC_YEAR_START_MONTH'] = int(os.environ.get('ACADEMIC_YEAR_START_MONTH', 4))  # April
+app.config['REPORT_CARD_WORKERS'] = int(os.environ.get('REPORT_CARD_WORKERS', 0)) or None  # Default: all cores
+app.config['IMPORT_HASH_WORKERS'] = int(os.environ.get('IMPORT_HASH_WORKERS', 0)) or None  # Default: all cores
+app.config['JOBS_RUN_INLINE'] = os.environ.get('JOBS_RUN_INLINE', '0') == '1'  # Run jobs in-request (no worker)
+# 'per_student' keeps one Assignment row per student; 'normalized' stores it once plus submission rows
+app.config['ASSIGNMENT_STORAGE'] = os.environ.get('ASSIGNMENT_STORAGE', 'per_student')
+
+# Take the client address from X-Forwarded-For, so per-IP rate limits see clients, not the proxy
+if app.config['PROXY_FIX_X_FOR']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 
 # Ensure instance folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 logger.info(f"Instance path: {app.instance_path}")
 
 # Configure database
+def database_engine_options(uri):
+    """Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS, tunable per deployment."""
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',  # Drop connections the server closed
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),  # Seconds before a connection is replaced
+    }
+    if uri.startswith('sqlite'):
+        # Let Python's sqlite3 wait for the lock too, instead of failing with "database is locked"
+        options['connect_args'] = {'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    else:
+        # Per gunicorn worker; keep workers * (pool_size + max_overflow) below the server's max_connections
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+        options['pool_timeout'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    return options
+
+
+# Hosting providers hand out postgres:// URLs without a driver; use psycopg2 from requirements.txt
+for scheme in ('postgres://', 'postgresql://'):
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith(scheme):
+        app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace(
+            scheme, 'postgresql+psycopg2://', 1)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+logger.info(f"Database backend: {app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0]}")
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """WAL lets readers run while a gunicorn worker writes; busy_timeout makes writers queue
+    for the lock rather than erroring out."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, and avoids an fsync per commit
+    cursor.close()
+
+
+MEDIA_FORM_ENDPOINTS = ('dashboard.new_media', 'dashboard.edit_media')
+
+
+# Registered before CSRFProtect's hook, which is the first to read the form
+@app.before_request
+def allow_large_media_forms():
+    if request.endpoint in MEDIA_FORM_ENDPOINTS:
+        request.max_content_length = app.config['MEDIA_FORM_MAX_CONTENT_LENGTH']
+
 
 # Initialize extensions with app
 db.init_app(app)
@@ -59,56 +158,22 @@ with app.app_context():
     for rule in app.url_map.iter_rules():
         logger.info(f"Route: {rule.rule} [{', '.join(rule.methods)}] -> {rule.endpoint}")
 
-    # Import models and create tables
     import models
 
-    try:
+    # The schema is built and upgraded by `python migrate.py`. CREATE_TABLES=1 creates missing
+    # tables straight from the models instead, for throwaway development databases only.
+    if app.config['CREATE_TABLES']:
         db.create_all()
-        logger.info("Database tables created successfully")
-    except Exception as e:
-        logger.error(f"Error creating database tables: {str(e)}")
+        logger.info("Database tables created from the models")
 
 
-# Add logging for the user_loader function
 @login_manager.user_loader
 def load_user(id):
     from flask import session
+    from identity import load_identity
 
-    # Check if we have a user_type in session to help determine the correct model
-    user_type = session.get('user_type')
-
-    if user_type == 'teacher':
-        # Load teacher directly if we know it's a teacher
-        from models import Teacher
-        teacher = Teacher.query.get(int(id))
-        if teacher:
-            logger.info(f"Loaded Teacher: {teacher.username}, ID: {id}, Type: {type(teacher).__name__}")
-            return teacher
-    elif user_type == 'user':
-        # Load user directly if we know it's a regular user
-        from models import User
-        user = User.query.get(int(id))
-        if user:
-            logger.info(f"Loaded User: {user.username}, ID: {id}, Type: {type(user).__name__}")
-            return user
-    else:
-        # Fallback to the original behavior if session doesn't have user_type
-        # Try to load a user first
-        from models import User, Teacher
-
-        # Check if the ID matches a Teacher first
-        teacher = Teacher.query.get(int(id))
-        if teacher:
-            logger.info(f"Loaded Teacher (fallback): {teacher.username}, ID: {id}, Type: {type(teacher).__name__}")
-            return teacher
-
-        # Then check if it's a User
-        user = User.query.get(int(id))
-        if user:
-            logger.info(f"Loaded User (fallback): {user.username}, ID: {id}, Type: {type(user).__name__}")
-            return user
-
-    return None
+    # session['user_type'] only exists in sessions created before ids were typed ("teacher:12")
+    return load_identity(id, legacy_type=session.get('user_type'))
 
 
 # Add after existing routes
@@ -0,0 +1,117 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, select, literal, union_all
+
+from app import db
+from models import Assignment, AssignmentSubmission, User
+from uploads import retain_upload
+
+
+def _value(column, value):
+    """A bound literal typed like `column`, so dates and NULLs are stored the way the ORM would."""
+    return literal(value, type_=column.type)
+
+
+def _class_students(class_name):
+    return select(User.id).where(User.role == 'student', User.class_name == class_name)
+
+
+def create_class_assignment(title, description, due_date, file_url, teacher_id, class_name, subject):
+    """Assign work to every student in a class with set-based INSERT ... SELECT statements.
+
+    With ASSIGNMENT_STORAGE = 'per_student' (the default) one Assignment row is written per
+    student, as before. With 'normalized', the assignment is stored once and each student
+    gets a lightweight AssignmentSubmission row pointing at it. Returns the number of
+    students the assignment was created for. The caller commits.
+    """
+    now = datetime.utcnow()
+    students = _class_students(class_name).subquery()
+
+    if current_app.config.get('ASSIGNMENT_STORAGE') == 'normalized':
+        assignment = Assignment(title=title, description=description, due_date=due_date, file_url=file_url,
+                                teacher_id=teacher_id, class_name=class_name, subject=subject)
+        db.session.add(assignment)
+        db.session.flush()
+
+        result = db.session.execute(
+            insert(AssignmentSubmission).from_select(
+                ['assignment_id', 'student_id', 'status', 'created_at', 'updated_at'],
+                select(literal(assignment.id), students.c.id, literal('pending'),
+                       _value(AssignmentSubmission.created_at, now), _value(AssignmentSubmission.updated_at, now))
+            )
+        )
+        return result.rowcount
+
+    result = db.session.execute(
+        insert(Assignment).from_select(
+            ['title', 'description', 'due_date', 'file_url', 'teacher_id', 'student_id', 'class_name',
+             'subject', 'status', 'created_at', 'updated_at'],
+            select(_value(Assignment.title, title), _value(Assignment.description, description),
+                   _value(Assignment.due_date, due_date), _value(Assignment.file_url, file_url),
+                   _value(Assignment.teacher_id, teacher_id), students.c.id,
+                   _value(Assignment.class_name, class_name), _value(Assignment.subject, subject),
+                   literal('pending'), _value(Assignment.created_at, now), _value(Assignment.updated_at, now))
+        )
+    )
+    # The caller's save_upload() counted one reference to the attachment; every row holds one
+    if file_url:
+        retain_upload(file_url, result.rowcount - 1)
+    return result.rowcount
+
+
+def student_submission(assignment, student_id):
+    """Return the AssignmentSubmission of a normalized assignment for one student, or None."""
+    return AssignmentSubmission.query.filter_by(assignment_id=assignment.id, student_id=student_id).first()
+
+
+def student_work(name='student_work'):
+    """A subquery with one row per student per class assignment, however it is stored.
+
+    Columns: assignment_id, teacher_id, title, subject, class_name, due_date, created_at,
+    student_id, status, grade, feedback. Per-student Assignment rows carry the student's
+    own status and grade; assignments stored once take them from AssignmentSubmission.
+    """
+    per_student = (select(Assignment.id.label('assignment_id'), Assignment.teacher_id, Assignment.title,
+                          Assignment.subject, Assignment.class_name, Assignment.due_date, Assignment.created_at,
+                          Assignment.student_id.label('student_id'), Assignment.status, Assignment.grade,
+                          Assignment.feedback)
+                   .where(Assignment.student_id.isnot(None)))
+    normalized = (select(Assignment.id, Assignment.teacher_id, Assignment.title, Assignment.subject,
+                         Assignment.class_name, Assignment.due_date, Assignment.created_at,
+                         AssignmentSubmission.student_id, AssignmentSubmission.status, AssignmentSubmission.grade,
+                         AssignmentSubmission.feedback)
+                  .join(AssignmentSubmission, AssignmentSubmission.assignment_id == Assignment.id))
+    return union_all(per_student, normalized).subquery(name)
+
+
+def class_work(assignment):
+    """[(student, work)] for every student given `assignment`, ordered by name.
+
+    `work` is the row holding that student's status, grade, feedback and file: their
+    AssignmentSubmission for an assignment stored once, or their own Assignment row. Rows
+    written per student for one class assignment share teacher, class, title and due date,
+    which is how the rest of the class is found from any one of them.
+    """
+    if assignment.student_id is None:
+        query = (db.session.query(User, AssignmentSubmission)
+                 .join(AssignmentSubmission, AssignmentSubmission.student_id == User.id)
+                 .filter(AssignmentSubmission.assignment_id == assignment.id))
+    else:
+        query = (db.session.query(User, Assignment)
+                 .join(Assignment, Assignment.student_id == User.id)
+                 .filter(Assignment.teacher_id == assignment.teacher_id,
+                         Assignment.class_name == assignment.class_name,
+                         Assignment.title == assignment.title,
+                         Assignment.due_date == assignment.due_date))
+    return query.order_by(User.last_name, User.first_name, User.id).all()
+
+
+def work_for(assignment, student_id):
+    """The row holding one student's work on `assignment` (see class_work()), or None."""
+    if assignment.student_id is None:
+        return student_submission(assignment, student_id)
+    for student, work in class_work(assignment):
+        if student.id == student_id:
+            return work
+    return None
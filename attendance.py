@@ -0,0 +1,252 @@
+from datetime import datetime
+
+from sqlalchemy import select, delete, insert, func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+from app import db
+from models import Attendance, AttendanceRollup, User
+
+# Compact status codes accepted by the attendance API
+STATUS_CODES = {'P': 'present', 'A': 'absent', 'L': 'late'}
+STATUSES = set(STATUS_CODES.values())
+
+
+def class_names():
+    rows = db.session.query(User.class_name).filter(
+        User.role == 'student',
+        User.class_name != None,
+        User.class_name != ''
+    ).distinct().order_by(User.class_name).all()
+    return [row[0] for row in rows]
+
+
+def teacher_class_names(teacher):
+    """Classes of the students assigned to a teacher, or every class if none are assigned."""
+    rows = db.session.query(User.class_name).filter(
+        User.role == 'student',
+        User.teacher_id == teacher.id,
+        User.class_name != None,
+        User.class_name != ''
+    ).distinct().order_by(User.class_name).all()
+    return [row[0] for row in rows] or class_names()
+
+
+def class_students(class_name):
+    return User.query.filter_by(role='student', class_name=class_name).order_by(
+        User.last_name, User.first_name, User.id).all()
+
+
+def _dialect_insert(model):
+    """An INSERT that supports ON CONFLICT on this database, or None if it has none."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return sqlite_insert(model)
+    if dialect == 'postgresql':
+        return postgresql_insert(model)
+    return None
+
+
+def _upsert_statement():
+    stmt = _dialect_insert(Attendance)
+    if stmt is None:
+        return None
+    return stmt.on_conflict_do_update(
+        index_elements=['student_id', 'date'],
+        set_={'status': stmt.excluded.status, 'marked_by': stmt.excluded.marked_by,
+              'created_at': stmt.excluded.created_at}
+    )
+
+
+def _write_marks(date, rows):
+    """Write `rows` and return {student_id: status before} for the students already marked.
+
+    The previous statuses feed the rollups, so they must be the ones actually replaced
+    even when two teachers submit the same class and day at once. New marks go in first
+    with ON CONFLICT DO NOTHING: a concurrent insert of the same mark makes that wait
+    for the other transaction, and the mark then counts as existing. Existing marks are
+    read with SELECT ... FOR UPDATE, which waits for and then locks the latest version,
+    and overwritten. SQLite runs one writer at a time, and the first INSERT makes this
+    transaction the writer before anything is read.
+    """
+    stmt = _dialect_insert(Attendance)
+    if stmt is None:
+        # Portable fallback: lock and replace the class's rows for the day
+        student_ids = [row['student_id'] for row in rows]
+        previous = dict(db.session.execute(
+            select(Attendance.student_id, Attendance.status)
+            .where(Attendance.date == date, Attendance.student_id.in_(student_ids)).with_for_update()
+        ).all())
+        db.session.execute(delete(Attendance).where(Attendance.date == date,
+                                                    Attendance.student_id.in_(student_ids)))
+        db.session.execute(insert(Attendance), rows)
+        return previous
+
+    inserted = set(db.session.scalars(
+        stmt.values(rows).on_conflict_do_nothing(index_elements=['student_id', 'date'])
+        .returning(Attendance.student_id)
+    ).all())
+    existing = [row for row in rows if row['student_id'] not in inserted]
+    if not existing:
+        return {}
+
+    previous = dict(db.session.execute(
+        select(Attendance.student_id, Attendance.status)
+        .where(Attendance.date == date, Attendance.student_id.in_([row['student_id'] for row in existing]))
+        .with_for_update()
+    ).all())
+    db.session.execute(_upsert_statement(), existing)
+    return previous
+
+
+def record_attendance(class_name, date, statuses, marked_by, default_status='absent'):
+    """Write one day's attendance for a whole class with bulk upserts.
+
+    `statuses` maps student id to 'present'/'absent'/'late'; students of the class that
+    are missing from it get `default_status`, and ids from other classes are ignored.
+    Re-submitting the same day overwrites the earlier marks instead of duplicating them.
+    The students' monthly AttendanceRollup rows are adjusted by the difference in the
+    same transaction. Returns the number of students recorded. The caller commits.
+    """
+    student_ids = db.session.scalars(
+        select(User.id).where(User.role == 'student', User.class_name == class_name)
+    ).all()
+    if not student_ids:
+        return 0
+
+    now = datetime.utcnow()
+    rows = []
+    for student_id in student_ids:
+        status = statuses.get(student_id, default_status)
+        if status not in STATUSES:
+            raise ValueError(f"Invalid attendance status '{status}' for student {student_id}")
+        rows.append({'student_id': student_id, 'date': date, 'status': status,
+                     'marked_by': marked_by, 'created_at': now})
+
+    previous = _write_marks(date, rows)
+    _update_rollups(date, previous, {row['student_id']: row['status'] for row in rows})
+    return len(rows)
+
+
+def month_key(date):
+    return date.strftime('%Y-%m')
+
+
+def _update_rollups(date, previous, current):
+    """Apply the change from `previous` to `current` statuses on `date` to the monthly rollups."""
+    deltas = []
+    for student_id, status in current.items():
+        old_status = previous.get(student_id)
+        if old_status == status:
+            continue
+        delta = {'student_id': student_id, 'month': month_key(date),
+                 'present': 0, 'late': 0, 'absent': 0, 'days': 0 if old_status else 1}
+        delta[status] += 1
+        if old_status in STATUSES:
+            delta[old_status] -= 1
+        deltas.append(delta)
+    if not deltas:
+        return
+
+    stmt = _dialect_insert(AttendanceRollup)
+    if stmt is not None:
+        counters = ('present', 'late', 'absent', 'days')
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['student_id', 'month'],
+            set_={name: getattr(AttendanceRollup, name) + getattr(stmt.excluded, name) for name in counters}
+        ), deltas)
+        return
+
+    existing = {rollup.student_id: rollup for rollup in AttendanceRollup.query.filter(
+        AttendanceRollup.month == month_key(date),
+        AttendanceRollup.student_id.in_([delta['student_id'] for delta in deltas]))}
+    for delta in deltas:
+        rollup = existing.get(delta['student_id'])
+        if rollup is None:
+            db.session.add(AttendanceRollup(**delta))
+            continue
+        for name in ('present', 'late', 'absent', 'days'):
+            setattr(rollup, name, getattr(rollup, name) + delta[name])
+
+
+def _rollup_totals(month):
+    """SELECT of monthly totals per student computed from the Attendance rows themselves."""
+    return (
+        select(Attendance.student_id.label('student_id'), month.label('month'),
+               func.sum(case((Attendance.status == 'present', 1), else_=0)).label('present'),
+               func.sum(case((Attendance.status == 'late', 1), else_=0)).label('late'),
+               func.sum(case((Attendance.status == 'absent', 1), else_=0)).label('absent'),
+               func.count().label('days'))
+        .group_by(Attendance.student_id, month)
+    )
+
+
+def month_of(column):
+    """'YYYY-MM' of a date column, in the database's own date functions (matches month_key)."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the Attendance table in one INSERT ... SELECT. The caller commits."""
+    db.session.execute(delete(AttendanceRollup))
+    result = db.session.execute(insert(AttendanceRollup).from_select(
+        ['student_id', 'month', 'present', 'late', 'absent', 'days'], _rollup_totals(month_of(Attendance.date))))
+    return result.rowcount
+
+
+def check_rollups():
+    """Compare the rollups with totals recomputed from Attendance.
+
+    Returns a list of {student_id, month, expected, actual} for every mismatch,
+    where expected/actual are (present, late, absent, days) or None when missing.
+    """
+    expected = {(row.student_id, row.month): (row.present, row.late, row.absent, row.days)
+                for row in db.session.execute(_rollup_totals(month_of(Attendance.date)))}
+    actual = {(row.student_id, row.month): (row.present, row.late, row.absent, row.days)
+              for row in db.session.execute(select(AttendanceRollup.student_id, AttendanceRollup.month,
+                                                   AttendanceRollup.present, AttendanceRollup.late,
+                                                   AttendanceRollup.absent, AttendanceRollup.days))}
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        if expected.get(key) != actual.get(key):
+            mismatches.append({'student_id': key[0], 'month': key[1],
+                               'expected': expected.get(key), 'actual': actual.get(key)})
+    return mismatches
+
+
+def parse_compact_payload(payload):
+    """Turn an API payload into {student_id: status}.
+
+    Accepts either {"statuses": {"12": "P", "13": "A"}} or a positional form,
+    {"student_ids": [12, 13], "codes": "PA"}. Codes are P/A/L (or the full status names).
+    Raises ValueError for anything else.
+    """
+    def to_status(code):
+        status = STATUS_CODES.get(str(code).upper(), str(code).lower())
+        if status not in STATUSES:
+            raise ValueError(f"Unknown attendance code '{code}'")
+        return status
+
+    def to_student_id(value):
+        # JSON object keys are strings; list entries should be integers
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+            raise ValueError(f"Student ids must be whole numbers, not {value!r}")
+        return int(value)
+
+    if not isinstance(payload, dict):
+        raise ValueError('The payload must be a JSON object')
+
+    if 'statuses' in payload:
+        if not isinstance(payload['statuses'], dict):
+            raise ValueError('statuses must be an object of student id to code')
+        return {to_student_id(student_id): to_status(code) for student_id, code in payload['statuses'].items()}
+
+    student_ids = payload.get('student_ids') or []
+    codes = payload.get('codes') or ''
+    if not isinstance(student_ids, list) or not isinstance(codes, (str, list)):
+        raise ValueError('student_ids must be a list and codes a string or list')
+    if len(student_ids) != len(codes):
+        raise ValueError('student_ids and codes must have the same length')
+    return {to_student_id(student_id): to_status(code) for student_id, code in zip(student_ids, codes)}
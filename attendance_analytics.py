@@ -0,0 +1,199 @@
+"""Attendance rates, streaks and chronic-absence flags, computed in SQL.
+
+A day counts as attended when the student was marked present or late. Rates are
+over the days a student was marked, and a student is flagged as chronically absent
+when they missed at least ATTENDANCE_CHRONIC_ABSENCE (default 10%) of them.
+All functions return plain dicts, ready for templates or jsonify.
+
+Counts come from the monthly AttendanceRollup table whenever the requested range
+covers whole months (including no range at all), so they cost one row per student
+per month instead of one per school day. Other ranges, and streaks, read Attendance.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import select, func, case
+
+from app import db
+from attendance import month_of, month_key
+from models import Attendance, AttendanceRollup, User
+
+ATTENDED = ('present', 'late')
+
+
+# Where counts are read from: the table, its student id and month columns, the count
+# columns, and the WHERE criteria for the requested class/student/range
+Source = namedtuple('Source', 'table student_id month tallies criteria')
+
+
+def covers_whole_months(start, end):
+    return (start is None or start.day == 1) and (end is None or (end + timedelta(days=1)).day == 1)
+
+
+def _source(class_name=None, student_id=None, start=None, end=None):
+    if covers_whole_months(start, end):
+        rollup = AttendanceRollup
+        tallies = [func.sum(rollup.days).label('days'), func.sum(rollup.present).label('present'),
+                   func.sum(rollup.late).label('late'), func.sum(rollup.absent).label('absent')]
+        criteria = []
+        if start:
+            criteria.append(rollup.month >= month_key(start))
+        if end:
+            criteria.append(rollup.month <= month_key(end))
+        source = Source(rollup, rollup.student_id, rollup.month, tallies, criteria)
+    else:
+        source = Source(Attendance, Attendance.student_id, month_of(Attendance.date), _tallies(),
+                        _date_filters(start, end))
+    if class_name:
+        source.criteria.append(User.class_name == class_name)
+    if student_id:
+        source.criteria.append(source.student_id == student_id)
+    return source
+
+
+def _tallies():
+    return [
+        func.count().label('days'),
+        func.sum(case((Attendance.status == 'present', 1), else_=0)).label('present'),
+        func.sum(case((Attendance.status == 'late', 1), else_=0)).label('late'),
+        func.sum(case((Attendance.status == 'absent', 1), else_=0)).label('absent'),
+    ]
+
+
+def _date_filters(start=None, end=None):
+    criteria = []
+    if start:
+        criteria.append(Attendance.date >= start)
+    if end:
+        criteria.append(Attendance.date <= end)
+    return criteria
+
+
+def _with_rates(row):
+    data = dict(row)
+    days = data['days'] or 0
+    attended = (data['present'] or 0) + (data['late'] or 0)
+    data['rate'] = round(100.0 * attended / days, 1) if days else None
+    threshold = current_app.config.get('ATTENDANCE_CHRONIC_ABSENCE', 0.10)
+    data['chronic_absence'] = bool(days) and (data['absent'] or 0) / days >= threshold
+    return data
+
+
+def student_rates(class_name=None, student_id=None, start=None, end=None):
+    """One row per student: days marked, present/late/absent counts, rate, streaks and flag."""
+    source = _source(class_name, student_id, start, end)
+    statement = (
+        select(User.id.label('student_id'), User.first_name, User.last_name, User.class_name, *source.tallies)
+        .select_from(source.table)
+        .join(User, source.student_id == User.id)
+        .where(*source.criteria)
+        .group_by(User.id, User.first_name, User.last_name, User.class_name)
+        .order_by(User.class_name, User.last_name, User.first_name)
+    )
+    rows = [_with_rates(row) for row in db.session.execute(statement).mappings()]
+    streaks = student_streaks(class_name, student_id, start, end)
+    for row in rows:
+        row.update(streaks.get(row['student_id'], {}))
+    return rows
+
+
+def class_rates(start=None, end=None):
+    """One row per class, plus how many of its students are chronically absent."""
+    source = _source(start=start, end=end)
+    per_student = (
+        select(User.class_name, source.student_id.label('student_id'), *source.tallies)
+        .select_from(source.table)
+        .join(User, source.student_id == User.id)
+        .where(*source.criteria)
+        .group_by(User.class_name, source.student_id)
+        .subquery()
+    )
+    threshold = current_app.config.get('ATTENDANCE_CHRONIC_ABSENCE', 0.10)
+    statement = (
+        select(per_student.c.class_name,
+               func.count().label('students'),
+               func.sum(per_student.c.days).label('days'),
+               func.sum(per_student.c.present).label('present'),
+               func.sum(per_student.c.late).label('late'),
+               func.sum(per_student.c.absent).label('absent'),
+               func.sum(case((per_student.c.absent >= threshold * per_student.c.days, 1), else_=0))
+               .label('chronically_absent_students'))
+        .group_by(per_student.c.class_name)
+        .order_by(per_student.c.class_name)
+    )
+    rows = []
+    for row in db.session.execute(statement).mappings():
+        data = _with_rates(row)
+        # A class-wide flag would be misleading; the per-student count above is what matters
+        data.pop('chronic_absence')
+        rows.append(data)
+    return rows
+
+
+def monthly_rates(class_name=None, student_id=None, start=None, end=None):
+    """One row per month ('YYYY-MM') for a class, a student, or the whole school."""
+    source = _source(class_name, student_id, start, end)
+    month = source.month.label('month')
+    statement = (
+        select(month, *source.tallies)
+        .select_from(source.table)
+        .join(User, source.student_id == User.id)
+        .where(*source.criteria)
+        .group_by(month)
+        .order_by(month)
+    )
+    return [_with_rates(row) for row in db.session.execute(statement).mappings()]
+
+
+def _streak_filters(class_name, student_id, start, end):
+    criteria = _date_filters(start, end)
+    if class_name:
+        criteria.append(User.class_name == class_name)
+    if student_id:
+        criteria.append(Attendance.student_id == student_id)
+    return criteria
+
+
+def student_streaks(class_name=None, student_id=None, start=None, end=None):
+    """{student_id: {current_streak, current_streak_attended, longest_absence_streak}}.
+
+    Streaks count consecutive marked school days. They are found with the
+    gaps-and-islands method: within each student's days in date order, the row number
+    minus the row number among days of the same outcome is constant along a run.
+    """
+    attended = case((Attendance.status.in_(ATTENDED), 1), else_=0)
+    marks = (
+        select(Attendance.student_id, Attendance.date, attended.label('attended'),
+               (func.row_number().over(partition_by=Attendance.student_id, order_by=Attendance.date)
+                - func.row_number().over(partition_by=(Attendance.student_id, attended),
+                                         order_by=Attendance.date)).label('island'))
+        .join(User, Attendance.student_id == User.id)
+        .where(*_streak_filters(class_name, student_id, start, end))
+        .subquery()
+    )
+    runs = (
+        select(marks.c.student_id, marks.c.attended, func.count().label('length'),
+               func.max(marks.c.date).label('last_date'))
+        .group_by(marks.c.student_id, marks.c.attended, marks.c.island)
+        .subquery()
+    )
+    latest = (
+        select(marks.c.student_id, func.max(marks.c.date).label('last_date'))
+        .group_by(marks.c.student_id)
+        .subquery()
+    )
+    is_current = runs.c.last_date == latest.c.last_date
+    statement = (
+        select(runs.c.student_id,
+               func.max(case((is_current, runs.c.length))).label('current_streak'),
+               func.max(case((is_current, runs.c.attended))).label('current_streak_attended'),
+               func.coalesce(func.max(case((runs.c.attended == 0, runs.c.length))), 0)
+               .label('longest_absence_streak'))
+        .join(latest, runs.c.student_id == latest.c.student_id)
+        .group_by(runs.c.student_id)
+    )
+    return {row['student_id']: {'current_streak': row['current_streak'],
+                                'current_streak_attended': bool(row['current_streak_attended']),
+                                'longest_absence_streak': row['longest_absence_streak']}
+            for row in db.session.execute(statement).mappings()}
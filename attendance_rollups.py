@@ -0,0 +1,36 @@
+"""Maintain the monthly attendance rollups.
+
+    python attendance_rollups.py check      # report rollups that disagree with Attendance
+    python attendance_rollups.py rebuild    # recompute every rollup (after imports or manual edits)
+
+`check` exits non-zero when it finds a mismatch, so it can run from cron.
+"""
+import sys
+import argparse
+
+from app import app, db
+from attendance import rebuild_rollups, check_rollups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check or rebuild the monthly attendance rollups.')
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'rebuild':
+            count = rebuild_rollups()
+            db.session.commit()
+            print(f"Rebuilt {count} rollup rows.")
+            return 0
+
+        mismatches = check_rollups()
+        for mismatch in mismatches:
+            print(f"student {mismatch['student_id']} {mismatch['month']}: expected (present, late, absent, days) "
+                  f"{mismatch['expected']}, found {mismatch['actual']}")
+        print(f"{len(mismatches)} mismatched rollup row(s).")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+from app import app, db
+from models import Banner, PopupBanner, GalleryItem, Media
+from storage import get_storage, upload_key
+from upload_tasks import build_variants
+
+# Run this script (after `python migrate.py`) to generate responsive variants for
+# images uploaded before the pipeline existed.
+
+
+def backfill():
+    storage = get_storage()
+    count = 0
+    for model, attr in [(Banner, 'image_url'), (PopupBanner, 'image_url'), (GalleryItem, 'image_url'),
+                        (Media, 'thumbnail_url'), (Media, 'file_url')]:
+        for obj in model.query.filter(model.image_variants.is_(None)).all():
+            url = getattr(obj, attr)
+            if not url or not url.startswith('/uploads/'):
+                continue
+            if model is Media and attr == 'file_url' and (obj.media_type != 'photo' or obj.thumbnail_url):
+                continue
+            # Works from a local copy and stores the variants next to the image, in any storage backend
+            if storage.exists(upload_key(url)):
+                build_variants(obj, url)
+                count += 1
+        db.session.commit()
+    print(f"Generated variants for {count} images.")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        backfill()
@@ -0,0 +1,90 @@
+"""Measure login cost per gunicorn worker for each password hash setting.
+
+    python bench_login.py
+    python bench_login.py --method scrypt:16384:8:1 --method pbkdf2:sha256:600000 --workers 4 --peak 30
+
+For each method it times the bare hash check and a full POST /auth/login (user lookup,
+hash check, session cookie) through the Flask test client against a throwaway SQLite
+database. A gunicorn sync worker handles one login at a time, so logins/s per worker
+is roughly 1 / login time; multiply by the worker count for the site's ceiling and
+compare it with the expected peak (e.g. the 8 a.m. rush).
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+DEFAULT_METHODS = ['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:1000000', 'pbkdf2:sha256:600000']
+PASSWORD = 'correct horse battery staple'
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark login latency for password hash settings.')
+    parser.add_argument('--method', action='append', help='werkzeug hash method (repeatable)')
+    parser.add_argument('--iterations', type=int, default=20, help='logins timed per method')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 2)),
+                        help='gunicorn workers serving logins')
+    parser.add_argument('--peak', type=float, help='expected peak logins per second, to flag settings below it')
+    args = parser.parse_args(argv)
+
+    # Never touch the real database: point the app at a scratch SQLite file before importing it
+    scratch = tempfile.mkdtemp(prefix='bench_login_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app import app, db
+    from models import User
+    from migrate import upgrade
+    import passwords
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        upgrade()  # The scratch database starts empty
+
+    print(f"{'method':<26}{'hash ms':>10}{'login ms':>10}{'logins/s/worker':>17}{'site logins/s':>15}")
+    below_peak = False
+    for method in args.method or DEFAULT_METHODS:
+        with app.app_context():
+            app.config['PASSWORD_HASH_METHOD'] = method
+            User.query.filter_by(username='bench').delete()
+            user = User(username='bench', email='bench@example.com', role='student')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+            password_hash = user.password_hash
+
+        hash_time = timed(lambda: passwords.check_password(password_hash, PASSWORD), args.iterations)
+
+        def login():
+            # A fresh client per login, so no session from the previous one is reused
+            response = app.test_client().post('/auth/login', data={'username': 'bench', 'password': PASSWORD})
+            assert response.status_code == 302, f"login failed with {response.status_code}"
+
+        login_time = timed(login, args.iterations)
+        per_worker = 1 / login_time
+        site = per_worker * args.workers
+        flag = ''
+        if args.peak and site < args.peak:
+            flag = '  < peak'
+            below_peak = True
+        print(f"{method:<26}{hash_time * 1000:>10.1f}{login_time * 1000:>10.1f}{per_worker:>17.1f}{site:>15.1f}{flag}")
+
+    print(f"\nsite logins/s assumes {args.workers} worker(s) doing nothing but logins.")
+    return 1 if below_peak else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
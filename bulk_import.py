@@ -0,0 +1,417 @@
+"""Bulk import of students, teachers and registration codes from CSV or Excel.
+
+    python bulk_import.py students students.csv
+    python bulk_import.py teachers staff.xlsx --dry-run
+
+Rows are streamed from the file, validated like the registration forms (required
+fields, username length, email syntax, password length, and username/email/code
+uniqueness against both the database and the rest of the file), and inserted in
+chunks. Passwords are hashed on a process pool because that is where nearly all the
+time goes. Rows without a password get a generated one, returned in the results so
+it can be handed out. Invalid rows are reported and skipped; valid rows are imported.
+
+The dashboard queues a 'bulk_import' job (see jobs.py), which saves the results CSV in
+upload storage before each chunk commits. A run that is interrupted and retried keeps
+the results, and generated passwords, of the rows it had already imported.
+"""
+import io
+import os
+import sys
+import csv
+import codecs
+import zipfile
+import contextlib
+import secrets
+import uuid
+import string
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from email_validator import validate_email, EmailNotValidError
+from flask import current_app
+from werkzeug.utils import secure_filename
+from sqlalchemy import select, insert, or_
+
+from app import app, db
+from jobs import job, enqueue
+from models import User, Teacher, RegistrationCode
+from storage import get_storage
+import passwords
+from registration_codes import new_code
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+# Columns per import kind: (required, optional). Header names are matched case-insensitively.
+COLUMNS = {
+    'students': (['username', 'email', 'first_name', 'last_name', 'class_name'], ['password']),
+    'teachers': (['username', 'email', 'first_name', 'last_name', 'subject', 'qualification'], ['password']),
+    'registration_codes': (['role'], ['code']),
+}
+
+CODE_ROLES = ('student', 'teacher')
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown format, missing columns, unreadable)."""
+
+
+def _check_csv_encoding(file):
+    """Decode the whole file once before importing, so a bad byte fails before any chunk is committed."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        for block in iter(lambda: file.read(64 * 1024), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ImportFileError('The CSV file is not UTF-8 text; save it as "CSV UTF-8" and upload it again.')
+    file.seek(0)
+
+
+def _check_xlsx_archive(file):
+    """Read every member of the workbook once, so a corrupt file fails before any chunk is committed."""
+    try:
+        with zipfile.ZipFile(file) as archive:
+            damaged = archive.testzip()
+    except (zipfile.BadZipFile, OSError):
+        damaged = True
+    if damaged:
+        raise ImportFileError('The Excel file is damaged or is not an .xlsx workbook.')
+    file.seek(0)
+
+
+def read_rows(file, filename):
+    """Yield one dict per data row, keyed by lower-cased header, from a CSV or XLSX upload.
+
+    The whole file is checked first, so an unreadable one raises ImportFileError
+    before the caller imports anything.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        _check_csv_encoding(file)
+        reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    elif extension == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+            from openpyxl.utils.exceptions import InvalidFileException
+        except ImportError:
+            raise ImportFileError('Excel import needs the openpyxl package; upload a CSV file instead.')
+        _check_xlsx_archive(file)
+        try:
+            workbook = load_workbook(file, read_only=True, data_only=True)
+        except (InvalidFileException, KeyError, ValueError):
+            raise ImportFileError('The Excel file is damaged or is not an .xlsx workbook.')
+        reader = workbook.active.iter_rows(values_only=True)
+    else:
+        raise ImportFileError('Upload a .csv or .xlsx file.')
+
+    header = next(reader, None)
+    if not header:
+        raise ImportFileError('The file is empty.')
+    header = [str(name or '').strip().lower().replace(' ', '_') for name in header]
+    for values in reader:
+        if values is None or not any(value not in (None, '') for value in values):
+            continue
+        yield {name: '' if value is None else str(value).strip() for name, value in zip(header, values) if name}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _account_errors(row, kind):
+    errors = []
+    required, _ = COLUMNS[kind]
+    for name in required:
+        if not row.get(name):
+            errors.append(f"{name} is required")
+    if row.get('username') and not 4 <= len(row['username']) <= 20:
+        errors.append('username must be between 4 and 20 characters')
+    if row.get('email'):
+        try:
+            validate_email(row['email'], check_deliverability=False)
+        except EmailNotValidError:
+            errors.append('email is not a valid email address')
+    if row.get('password') and len(row['password']) < 6:
+        errors.append('password must be at least 6 characters')
+    return errors
+
+
+class BulkImport:
+    """One import run; call run() with the rows, then read `results`."""
+
+    def __init__(self, kind, dry_run=False, workers=None, checkpoint=None, previous=None):
+        """`checkpoint(bulk_import)` is called before each chunk commits, to save the results so
+        far; `previous` is {row: result} from an interrupted run of the same file."""
+        if kind not in COLUMNS:
+            raise ImportFileError(f"Unknown import type '{kind}'.")
+        self.kind = kind
+        self.dry_run = dry_run
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.previous = previous or {}
+        self.results = []  # {row, status, username/code, password, errors}
+        self.imported = 0
+        self._seen = set()  # usernames, emails and codes already used earlier in the file
+
+    def run(self, rows):
+        executor = None
+        workers = self.workers or current_app.config.get('IMPORT_HASH_WORKERS') or os.cpu_count()
+        if self.kind != 'registration_codes' and not self.dry_run:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            for chunk in _chunks(enumerate(rows, start=2), CHUNK_SIZE):  # Row 1 is the header
+                if not self.results:
+                    self._check_columns(chunk[0][1])
+                self._import_chunk(chunk, executor, workers)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result['errors']]
+
+    def _check_columns(self, row):
+        missing = [name for name in COLUMNS[self.kind][0] if name not in row]
+        if missing:
+            raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+
+    def _import_chunk(self, chunk, executor, workers):
+        if self.kind == 'registration_codes':
+            valid = self._validate_codes(chunk)
+        else:
+            valid = self._validate_accounts(chunk)
+        if not valid or self.dry_run:
+            return
+
+        if self.kind == 'registration_codes':
+            db.session.execute(insert(RegistrationCode), [
+                {'code': result['code'], 'role': row['role'], 'is_used': False, 'created_at': datetime.utcnow()}
+                for row, result in valid])
+            self._save_checkpoint(valid)
+        else:
+            hasher = partial(passwords.hash_password, method=passwords.hash_method())
+            hashes = executor.map(hasher, [result['password'] or row['password'] for row, result in valid],
+                                  chunksize=max(1, len(valid) // (workers * 4)))
+            model = Teacher if self.kind == 'teachers' else User
+            values = [self._account_values(row, password_hash) for (row, _), password_hash in zip(valid, hashes)]
+            self._save_checkpoint(valid)
+            db.session.execute(insert(model), values)
+        db.session.commit()
+        for _, result in valid:
+            result['status'] = 'imported'
+        self.imported += len(valid)
+        logger.info(f"Bulk import of {self.kind}: {self.imported} rows imported so far")
+
+    def _save_checkpoint(self, valid):
+        # Generated passwords are saved before the accounts using them exist
+        if self.checkpoint is not None:
+            for _, result in valid:
+                result['status'] = 'importing'
+            self.checkpoint(self)
+
+    def _carry_forward(self, line, value, taken):
+        """Keep an earlier run's result for a row it imported, so a generated password is not lost."""
+        previous = self.previous.get(line)
+        if previous is None or previous['status'] not in ('importing', 'imported') or value not in taken:
+            return False
+        self.results.append(dict(previous, status='imported', errors=[]))
+        self.imported += 1
+        return True
+
+    def _validate_accounts(self, chunk):
+        usernames = {row.get('username') for _, row in chunk} - {''}
+        emails = {row.get('email') for _, row in chunk} - {''}
+        # One query per chunk for everything that already exists
+        taken = set()
+        for username, email in db.session.execute(
+                select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))):
+            taken.update((username, email))
+
+        valid = []
+        for line, row in chunk:
+            if self._carry_forward(line, row.get('username'), taken):
+                self._seen.update((row['username'], row.get('email')))
+                continue
+            errors = _account_errors(row, self.kind)
+            for field in ('username', 'email'):
+                value = row.get(field)
+                if value in taken:
+                    errors.append(f"{field} {value} is already registered")
+                elif value in self._seen:
+                    errors.append(f"{field} {value} appears earlier in the file")
+            result = {'row': line, 'username': row.get('username', ''), 'errors': errors,
+                      'password': '' if row.get('password') else _generate_password()}
+            if errors:
+                result['status'] = 'error'
+                result['password'] = ''
+            else:
+                result['status'] = 'validated' if self.dry_run else 'imported'
+                self._seen.update((row['username'], row['email']))
+                valid.append((row, result))
+            self.results.append(result)
+        return valid
+
+    def _account_values(self, row, password_hash):
+        values = {
+            'username': row['username'], 'email': row['email'], 'password_hash': password_hash,
+            'first_name': row['first_name'], 'last_name': row['last_name'],
+            'registration_code_used': 'IMPORT', 'created_at': datetime.utcnow(),
+        }
+        if self.kind == 'teachers':
+            values.update(role='teacher', account_type='teacher', subject=row['subject'],
+                          qualification=row['qualification'])
+        else:
+            values.update(role='student', account_type='user', class_name=row['class_name'])
+        return values
+
+    def _validate_codes(self, chunk):
+        codes = {row.get('code', '').upper() for _, row in chunk} - {''}
+        codes.update(self.previous[line]['code'] for line, _ in chunk if line in self.previous)
+        taken = set(db.session.scalars(select(RegistrationCode.code).where(RegistrationCode.code.in_(codes))))
+
+        valid = []
+        for line, row in chunk:
+            if self._carry_forward(line, self.previous.get(line, {}).get('code'), taken):
+                self._seen.add(self.previous[line]['code'])
+                continue
+            errors = []
+            role = row.get('role', '').lower()
+            if role not in CODE_ROLES:
+                errors.append(f"role must be one of: {', '.join(CODE_ROLES)}")
+            code = row.get('code', '').upper()
+            if not code:
+                code = new_code() if not errors else ''
+            elif code in taken:
+                errors.append(f"code {code} already exists")
+            elif code in self._seen:
+                errors.append(f"code {code} appears earlier in the file")
+            elif len(code) > 20:
+                errors.append('code must be at most 20 characters')
+            result = {'row': line, 'code': code, 'errors': errors,
+                      'status': 'error' if errors else ('validated' if self.dry_run else 'imported')}
+            if not errors:
+                self._seen.add(code)
+                valid.append(({'role': role}, result))
+            self.results.append(result)
+        return valid
+
+
+def _generate_password():
+    return ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
+
+
+def results_csv(bulk_import):
+    """The per-row results as CSV text, including generated passwords."""
+    output = io.StringIO()
+    key = 'code' if bulk_import.kind == 'registration_codes' else 'username'
+    fields = ['row', 'status', key] + ([] if key == 'code' else ['password']) + ['errors']
+    writer = csv.DictWriter(output, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for result in bulk_import.results:
+        writer.writerow(dict(result, errors='; '.join(result['errors'])))
+    return output.getvalue()
+
+
+def read_results(text):
+    """{row: result} from a results_csv() text, for rows that were imported or being imported."""
+    results = {}
+    for result in csv.DictReader(io.StringIO(text)):
+        if result['status'] in ('importing', 'imported'):
+            results[int(result['row'])] = dict(result, row=int(result['row']), errors=[])
+    return results
+
+
+def _save_results(storage, key, bulk_import):
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='') as out:
+            out.write(results_csv(bulk_import))
+        storage.put_file(key, path, content_type='text/csv')
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def queue_import(kind, file, dry_run=False, requested_by=None):
+    """Save an uploaded file (a werkzeug FileStorage) in upload storage and queue its import; returns the Job."""
+    if kind not in COLUMNS:
+        raise ImportFileError(f"Unknown import type '{kind}'.")
+    filename = secure_filename(file.filename or '') or 'import'
+    prefix = f"imports/{uuid.uuid4().hex}"
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            file.save(out)
+        get_storage().put_file(f"{prefix}/{filename}", path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return enqueue('bulk_import', import_type=kind, key=f"{prefix}/{filename}", filename=filename,
+                   results_key=f"{prefix}/{kind}_import_results.csv", dry_run=dry_run, requested_by=requested_by)
+
+
+@job('bulk_import')
+def import_file(import_type, key, filename, results_key, dry_run=False, requested_by=None):
+    """Job handler: import a file saved in upload storage, keeping the per-row results (with
+    generated passwords) at `results_key` for the admin to download."""
+    storage = get_storage()
+    previous = None
+    if storage.exists(results_key):
+        # A retry: an earlier attempt stopped part way
+        with contextlib.closing(storage.open(results_key)) as f:
+            previous = read_results(f.read().decode())
+    bulk_import = BulkImport(import_type, dry_run=dry_run, previous=previous,
+                             checkpoint=lambda run: _save_results(storage, results_key, run))
+    try:
+        with storage.local_copy(key) as path, open(path, 'rb') as f:
+            bulk_import.run(read_rows(f, filename))
+    except ImportFileError as e:
+        storage.delete(key)
+        return {'error': str(e)}
+    _save_results(storage, results_key, bulk_import)
+    storage.delete(key)
+    return {'imported': bulk_import.imported, 'errors': len(bulk_import.errors), 'results': results_key}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import students, teachers or registration codes.')
+    parser.add_argument('kind', choices=sorted(COLUMNS))
+    parser.add_argument('path', help='.csv or .xlsx file')
+    parser.add_argument('--dry-run', action='store_true', help='validate only, import nothing')
+    parser.add_argument('--workers', type=int, help='password hashing processes (default: all cores)')
+    parser.add_argument('-o', '--output', help='write per-row results (and generated passwords) to this CSV')
+    args = parser.parse_args(argv)
+
+    with app.app_context(), open(args.path, 'rb') as f:
+        try:
+            bulk_import = BulkImport(args.kind, dry_run=args.dry_run, workers=args.workers)
+            bulk_import.run(read_rows(f, args.path))
+        except ImportFileError as e:
+            print(f"Error: {e}")
+            return 2
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            out.write(results_csv(bulk_import))
+    for result in bulk_import.errors:
+        print(f"row {result['row']}: {'; '.join(result['errors'])}")
+    print(f"{bulk_import.imported} {args.kind} imported, {len(bulk_import.errors)} row(s) with errors.")
+    return 1 if bulk_import.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import time
+import logging
+import threading
+from functools import wraps
+
+from flask import request, session, current_app
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """A small thread-safe in-process cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # Drop the entry closest to expiry to make room
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[oldest]
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Rendered public pages, keyed by (endpoint, view args, query string)
+page_cache = TTLCache()
+
+# Maps a model class name to the names of the views whose rendered pages depend on it
+_dependencies = {}
+
+
+def cached_page(*models):
+    """Cache the rendered response of a public GET view until one of `models` is committed.
+
+    Only anonymous requests without pending flash messages are served from or stored in
+    the cache, so per-user navigation and one-off messages are never shared.
+    """
+    model_names = [m if isinstance(m, str) else m.__name__ for m in models]
+
+    def decorator(view):
+        for name in model_names:
+            _dependencies.setdefault(name, set()).add(view.__name__)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _is_cacheable_request():
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, tuple(sorted(kwargs.items())), request.query_string)
+            cached = page_cache.get(key)
+            if cached is not None:
+                body, status, headers = cached
+                response = current_app.response_class(body, status=status, headers=headers)
+                return response.make_conditional(request)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                if not response.get_etag()[0]:
+                    response.add_etag()
+                page_cache.set(key, (response.get_data(), response.status_code, list(response.headers)),
+                               ttl=current_app.config.get('PAGE_CACHE_TTL'))
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_models(model_names):
+    views = set()
+    for name in model_names:
+        views |= _dependencies.get(name, set())
+    if views:
+        page_cache.delete_where(lambda key: key[0].rsplit('.', 1)[-1] in views)
+        logger.debug(f"Page cache invalidated for views: {sorted(views)}")
+
+
+def _is_cacheable_request():
+    if not current_app.config.get('PAGE_CACHE_ENABLED', True):
+        return False
+    if request.method != 'GET':
+        return False
+    if current_user.is_authenticated:
+        return False
+    return '_flashes' not in session
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_changed_models(db_session, flush_context):
+    changed = db_session.info.setdefault('changed_models', set())
+    for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        changed.add(type(obj).__name__)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(db_session):
+    changed = db_session.info.pop('changed_models', None)
+    if changed:
+        invalidate_models(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(db_session):
+    db_session.info.pop('changed_models', None)
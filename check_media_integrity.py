@@ -0,0 +1,121 @@
+"""Offline integrity scan for uploaded files.
+
+Checks every upload URL stored in the database against the files in upload storage
+(see storage.py) and writes a report of missing or mislocated files. Run it from cron
+or by hand:
+
+    python check_media_integrity.py --report integrity_report.json
+    python check_media_integrity.py --fix
+
+With --fix, the existing fix_file_paths and fix_gallery_paths repairs are applied first
+and the report lists whatever is still broken afterwards.
+"""
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from app import app
+from models import (Media, GalleryItem, GalleryCategory, Banner, PopupBanner, Document, Announcement,
+                    FeeStructure, PublicDisclosure, TransferCertificate, Assignment)
+from fix_file_paths import fix_paths, upload_exists, find_relocated_url
+from fix_gallery_paths import fix_gallery_paths
+from uploads import blob_hash
+
+logger = logging.getLogger(__name__)
+
+# (model, URL column, upload subfolder the file is expected in)
+UPLOAD_FIELDS = [
+    (Media, 'file_url', 'media'),
+    (Media, 'thumbnail_url', 'thumbnails'),
+    (GalleryItem, 'image_url', 'gallery'),
+    (Banner, 'image_url', 'banners'),
+    (PopupBanner, 'image_url', 'popups'),
+    (Document, 'file_url', 'documents'),
+    (Announcement, 'file_url', 'announcements'),
+    (FeeStructure, 'file_url', 'fees'),
+    (PublicDisclosure, 'file_url', 'disclosures'),
+    (TransferCertificate, 'file_url', 'tc'),
+    (Assignment, 'file_url', 'assignments'),
+]
+
+
+def scan():
+    """Return a list of problems found, one dict per broken upload reference."""
+    problems = []
+
+    for model, field, subfolder in UPLOAD_FIELDS:
+        column = getattr(model, field)
+        rows = model.query.with_entities(model.id, column).filter(column.isnot(None)).yield_per(500)
+        for row_id, url in rows:
+            if not url or url.startswith('http') or not url.lstrip('/').startswith('uploads/'):
+                continue
+            url = '/' + url.lstrip('/')
+            if upload_exists(url):
+                continue
+            new_url = find_relocated_url(url, subfolder)
+            problems.append({
+                'model': model.__name__,
+                'id': row_id,
+                'field': field,
+                'url': url,
+                'status': 'relocatable' if new_url else 'missing',
+                'suggested_url': new_url,
+            })
+
+    # Gallery photos from before the blob store are expected under a folder named after their category
+    folders = {c.id: secure_filename(c.name.lower().replace(' ', '_'))
+               for c in GalleryCategory.query.all()}
+    rows = GalleryItem.query.with_entities(GalleryItem.id, GalleryItem.image_url, GalleryItem.category_id)
+    for row_id, url, category_id in rows.yield_per(500):
+        folder = folders.get(category_id)
+        if not url or url.startswith('http') or folder is None or blob_hash(url):
+            continue
+        if not url.startswith(f'/uploads/gallery/{folder}/'):
+            problems.append({
+                'model': 'GalleryItem',
+                'id': row_id,
+                'field': 'image_url',
+                'url': url,
+                'status': 'mislocated',
+                'suggested_url': f'/uploads/gallery/{folder}/{url.rsplit("/", 1)[-1]}',
+            })
+
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check uploaded files referenced by the database.')
+    parser.add_argument('--fix', action='store_true', help='apply the fix_file_paths/fix_gallery_paths repairs first')
+    parser.add_argument('--report', help='write the JSON report to this path instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.fix:
+        fix_paths()
+        fix_gallery_paths()
+
+    with app.app_context():
+        problems = scan()
+
+    report = {
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'fixed': args.fix,
+        'problem_count': len(problems),
+        'problems': problems,
+    }
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Wrote integrity report with {len(problems)} problems to {args.report}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
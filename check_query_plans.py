@@ -0,0 +1,120 @@
+"""Check that the hot queries in routes.py are served by the indexes in models.py.
+
+Runs EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (PostgreSQL, with sequential scans
+disabled so the planner reports an index whenever one is usable) for each query
+shape and exits non-zero if an expected index is not used. Run it after
+`python migrate.py`:
+
+    python check_query_plans.py
+"""
+import sys
+
+from sqlalchemy import text
+
+from app import app, db
+from models import (User, Announcement, Assignment, AssignmentSubmission, TransferCertificate, Attendance,
+                    Banner, Media, PopupBanner, GalleryItem, FeeStructure, PublicDisclosure, Job, RegistrationCode)
+
+
+def query_shapes():
+    """(description, query, index that should serve it) for the filters routes.py runs per request."""
+    return [
+        ('home: latest announcements',
+         Announcement.query.order_by(Announcement.created_at.desc(), Announcement.id.desc()).limit(20),
+         'ix_announcement_created_at_id'),
+        ('home: active banners',
+         Banner.query.filter_by(is_active=True).order_by(Banner.order.asc()),
+         'ix_banner_is_active_order'),
+        ('home: active popup banner',
+         PopupBanner.query.filter_by(is_active=True).order_by(PopupBanner.created_at.desc()),
+         'ix_popup_banner_is_active_created_at'),
+        ('gallery_photos: category',
+         GalleryItem.query.filter_by(category_id=1, is_active=True).order_by(GalleryItem.created_at.desc()),
+         'ix_gallery_item_category_active_created_at'),
+        ('gallery_photos: all',
+         GalleryItem.query.filter_by(is_active=True).order_by(GalleryItem.created_at.desc()),
+         'ix_gallery_item_active_created_at'),
+        ('gallery_videos: category',
+         Media.query.filter_by(gallery_category='Sports', media_type='video', is_active=True)
+         .order_by(Media.created_at.desc()),
+         'ix_media_type_active_category_created_at'),
+        ('disclosure',
+         PublicDisclosure.query.filter_by(category='general', is_active=True)
+         .order_by(PublicDisclosure.display_order.asc()),
+         'ix_public_disclosure_category_active_order'),
+        ('fee_structure: years',
+         db.session.query(FeeStructure.academic_year).filter_by(is_active=True).distinct()
+         .order_by(FeeStructure.academic_year.desc()),
+         'ix_fee_structure_active_year'),
+        ('fee_structure: fees',
+         FeeStructure.query.filter_by(academic_year='2024-2025', is_active=True)
+         .order_by(FeeStructure.class_name, FeeStructure.fee_type),
+         'ix_fee_structure_year_active_class_type'),
+        ('attendance: class roster',
+         User.query.filter_by(role='student', class_name='10A'),
+         'ix_user_role_class_name'),
+        ('attendance: student history',
+         Attendance.query.filter_by(student_id=1).order_by(Attendance.date.desc()),
+         'uq_attendance_student_date'),
+        ('student_assignments',
+         Assignment.query.filter_by(student_id=1).order_by(Assignment.due_date.desc()),
+         'ix_assignment_student_due_date'),
+        ('student_assignments: submissions',
+         AssignmentSubmission.query.filter_by(student_id=1),
+         'ix_assignment_submission_student_id'),
+        ('teacher assignments',
+         Assignment.query.filter_by(teacher_id=1).order_by(Assignment.created_at.desc()),
+         'ix_assignment_teacher_created_at'),
+        ('my_tc',
+         TransferCertificate.query.filter_by(student_id=1).order_by(TransferCertificate.created_at.desc()),
+         'ix_tc_student_status_created_at'),
+        ('tc_retrieval: approved TC',
+         TransferCertificate.query.filter_by(admission_number='S123', status='approved')
+         .order_by(TransferCertificate.created_at.desc()).limit(1),
+         'ix_tc_admission_status_created_at'),
+        ('manage_tc: status filter',
+         TransferCertificate.query.filter_by(status='pending')
+         .order_by(TransferCertificate.created_at.desc(), TransferCertificate.id.desc()).limit(50),
+         'ix_tc_status_created_at'),
+        ('manage_registration_codes: role and used filter',
+         RegistrationCode.query.filter_by(role='student', is_used=False)
+         .order_by(RegistrationCode.created_at.desc(), RegistrationCode.id.desc()).limit(50),
+         'ix_registration_code_role_used_created_at'),
+        ('job worker: next job',
+         db.session.query(Job.id).filter_by(status='queued').order_by(Job.run_after, Job.id),
+         'ix_job_status_run_after'),
+    ]
+
+
+def explain(conn, query):
+    sql = str(query.statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return '\n'.join(row[-1] for row in rows)
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    return '\n'.join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}")))
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for description, query, index in query_shapes():
+                plan = explain(conn, query)
+                ok = index in plan
+                failures += not ok
+                print(f"[{'ok' if ok else 'MISSING'}] {description}: expected {index}")
+                if not ok:
+                    print('    ' + plan.replace('\n', '\n    '))
+            # Leave the planner settings untouched
+            conn.rollback()
+
+    if failures:
+        print(f"{failures} query shape(s) are not using their index. Did you run `python migrate.py`?")
+        return 1
+    print("All hot queries use their indexes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
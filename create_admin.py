@@ -9,7 +9,11 @@ def create_admin():
             # Check if admin already exists
             admin = User.query.filter_by(username='admin').first()
             if admin:
-                print("Admin user already exists!")
+                # Teachers share the user table, so the name may belong to one of them
+                if admin.role == 'admin':
+                    print("Admin user already exists!")
+                else:
+                    print(f"The username 'admin' is already used by a {admin.role} account.")
                 return
 
             # Create admin user with empty registration_code
@@ -0,0 +1,154 @@
+"""Counts and recent lists for the dashboard home pages.
+
+Each role's summary is built from a fixed handful of grouped queries, whatever the
+table sizes, and handed to the templates as plain dicts and lists, so rendering
+runs no queries. Summaries are cached for DASHBOARD_CACHE_TTL seconds: the admin one
+is shared by all admins, teacher and student ones are per user.
+"""
+import time
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, func, literal, union_all
+
+from app import db
+from cache import TTLCache
+from attendance import teacher_class_names
+from assignments import student_work
+from models import (User, Teacher, Announcement, Attendance, AttendanceRollup,
+                    StudentProgress, TransferCertificate, Document, Media, Banner, Content, PublicDisclosure,
+                    GalleryItem, PopupBanner, ContactMessage, RegistrationCode)
+
+logger = logging.getLogger(__name__)
+
+dashboard_cache = TTLCache(ttl=30, max_entries=2048)
+
+
+def _count(name, model, *criteria):
+    return select(literal(name).label('name'), func.count().label('n')).select_from(model).where(*criteria)
+
+
+def _counts(*selects):
+    """Run several labelled COUNT(*) selects as one UNION ALL query: {name: n}."""
+    return {name: n for name, n in db.session.execute(union_all(*selects))}
+
+
+def _grouped(column, *criteria):
+    return {key: n for key, n in db.session.execute(
+        select(column, func.count()).where(*criteria).group_by(column))}
+
+
+def _rows(statement):
+    return [dict(row) for row in db.session.execute(statement).mappings()]
+
+
+def admin_summary():
+    counts = _counts(
+        _count('documents', Document),
+        _count('photos', Media, Media.media_type == 'photo'),
+        _count('videos', Media, Media.media_type == 'video'),
+        _count('banners', Banner),
+        _count('active_banners', Banner, Banner.is_active == True),
+        _count('announcements', Announcement),
+        _count('contents', Content),
+        _count('disclosures', PublicDisclosure),
+        _count('gallery_items', GalleryItem),
+        _count('popup_banners', PopupBanner),
+        _count('pending_messages', ContactMessage, ContactMessage.status == 'pending'),
+        _count('unused_codes', RegistrationCode, RegistrationCode.is_used == False),
+    )
+    return {
+        'counts': counts,
+        'users_by_role': _grouped(User.role),
+        'tcs_by_status': _grouped(TransferCertificate.status),
+        'recent_announcements': _rows(
+            select(Announcement.id, Announcement.title, Announcement.created_at,
+                   User.username.label('author'))
+            .outerjoin(User, Announcement.author_id == User.id)
+            .order_by(Announcement.created_at.desc(), Announcement.id.desc()).limit(5)),
+        'pending_tcs': _rows(
+            select(TransferCertificate.id, TransferCertificate.tc_number, TransferCertificate.created_at,
+                   User.first_name, User.last_name, User.class_name)
+            .outerjoin(User, TransferCertificate.student_id == User.id)
+            .where(TransferCertificate.status == 'pending')
+            .order_by(TransferCertificate.created_at.desc()).limit(5)),
+        'recent_users': _rows(
+            select(User.id, User.username, User.first_name, User.last_name, User.role, User.created_at)
+            .order_by(User.created_at.desc()).limit(5)),
+    }
+
+
+def teacher_summary(teacher):
+    today = datetime.utcnow().date()
+    # One row per student per assignment, whether assignments are stored per student or once
+    work = student_work()
+    counts = _counts(
+        _count('students', User, User.teacher_id == teacher.id),
+        _count('assignments', work, work.c.teacher_id == teacher.id),
+        _count('attendance_marked_today', Attendance, Attendance.marked_by == teacher.id, Attendance.date == today),
+    )
+    return {
+        'counts': counts,
+        'assignments_by_status': _grouped(work.c.status, work.c.teacher_id == teacher.id),
+        'class_names': teacher_class_names(teacher),
+        'recent_assignments': _rows(
+            select(work.c.assignment_id.label('id'), work.c.title, work.c.class_name, work.c.subject,
+                   work.c.due_date, work.c.status)
+            .where(work.c.teacher_id == teacher.id)
+            .order_by(work.c.created_at.desc()).limit(5)),
+    }
+
+
+def _attendance_totals(student):
+    # From the monthly rollups: one row per month rather than one per school day
+    totals = db.session.execute(
+        select(func.sum(AttendanceRollup.present), func.sum(AttendanceRollup.late), func.sum(AttendanceRollup.absent))
+        .where(AttendanceRollup.student_id == student.id)
+    ).one()
+    return {status: n for status, n in zip(('present', 'late', 'absent'), totals) if n}
+
+
+def student_summary(student):
+    now = datetime.utcnow()
+    # Per-student assignment rows and normalized submissions alike
+    work = student_work()
+    return {
+        'assignments_by_status': _grouped(work.c.status, work.c.student_id == student.id),
+        'attendance_by_status': _attendance_totals(student),
+        'upcoming_assignments': _rows(
+            select(work.c.assignment_id.label('id'), work.c.title, work.c.subject, work.c.due_date, work.c.status)
+            .where(work.c.student_id == student.id, work.c.due_date >= now)
+            .order_by(work.c.due_date).limit(5)),
+        'recent_progress': _rows(
+            select(StudentProgress.subject, StudentProgress.grade, StudentProgress.term,
+                   StudentProgress.academic_year, StudentProgress.remarks)
+            .where(StudentProgress.student_id == student.id)
+            .order_by(StudentProgress.created_at.desc()).limit(5)),
+        'transfer_certificates': _rows(
+            select(TransferCertificate.id, TransferCertificate.tc_number, TransferCertificate.status,
+                   TransferCertificate.created_at)
+            .where(TransferCertificate.student_id == student.id)
+            .order_by(TransferCertificate.created_at.desc()).limit(3)),
+        'recent_announcements': _rows(
+            select(Announcement.id, Announcement.title, Announcement.created_at)
+            .order_by(Announcement.created_at.desc(), Announcement.id.desc()).limit(3)),
+    }
+
+
+def dashboard_summary(user):
+    """The summary for `user`'s dashboard, from the cache when it is fresh enough."""
+    if isinstance(user, Teacher):
+        key, build = ('teacher', user.id), lambda: teacher_summary(user)
+    elif user.role == 'admin':
+        key, build = ('admin',), admin_summary
+    else:
+        key, build = ('student', user.id), lambda: student_summary(user)
+
+    summary = dashboard_cache.get(key)
+    if summary is None:
+        start = time.perf_counter()
+        summary = build()
+        dashboard_cache.set(key, summary, ttl=current_app.config.get('DASHBOARD_CACHE_TTL'))
+        logger.debug(f"Dashboard summary {key} built in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return summary
@@ -0,0 +1,211 @@
+"""Streaming CSV/XLSX exports of attendance, assignments, progress and contact messages.
+
+    python exports.py attendance --from 2024-04-01 --to 2025-03-31 --class 5A -o attendance.csv
+
+Rows are fetched with yield_per (a server-side cursor on PostgreSQL) and written out
+as they arrive, so memory stays flat however large the table is. CSV is streamed
+straight into the response; XLSX needs openpyxl and is spooled through its
+write-only mode into a temporary file, then streamed from there.
+"""
+import io
+import os
+import sys
+import csv
+import argparse
+import tempfile
+from collections import namedtuple
+from datetime import datetime, date, time
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from app import app, db
+from models import User, Attendance, StudentProgress, ContactMessage
+from assignments import student_work
+
+# Rows fetched per round trip, and CSV rows per chunk handed to the response
+FETCH_SIZE = 1000
+ROWS_PER_CHUNK = 500
+
+# Spreadsheet apps run a cell starting with one of these as a formula, and contact messages come from the public
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# statement(): a SELECT of the export's columns; date_column/class_column are filtered on (None: no such filter)
+Export = namedtuple('Export', 'headers statement date_column class_column')
+
+Student = aliased(User, name='student')
+
+
+def _attendance():
+    marker = aliased(User, name='marker')
+    return (select(Attendance.date, Student.id, Student.username, Student.first_name, Student.last_name,
+                   Student.class_name, Attendance.status, marker.username)
+            .join(Student, Student.id == Attendance.student_id)
+            .outerjoin(marker, marker.id == Attendance.marked_by)
+            .order_by(Attendance.date, Student.class_name, Student.last_name, Student.id))
+
+
+def _assignments():
+    # Class assignments can be stored per student or once with AssignmentSubmission rows
+    # (ASSIGNMENT_STORAGE); export both as one row per student
+    rows = student_work('assignment_rows')
+    return (select(rows.c.assignment_id, rows.c.title, rows.c.subject, rows.c.class_name, rows.c.due_date,
+                   Student.username, Student.first_name, Student.last_name, rows.c.status, rows.c.grade)
+            .join(Student, Student.id == rows.c.student_id)
+            .order_by(rows.c.due_date, rows.c.assignment_id, Student.last_name, Student.id)), rows
+
+
+def _progress():
+    return (select(StudentProgress.academic_year, StudentProgress.term, Student.username, Student.first_name,
+                   Student.last_name, Student.class_name, StudentProgress.subject, StudentProgress.grade,
+                   StudentProgress.remarks, StudentProgress.created_at)
+            .join(Student, Student.id == StudentProgress.student_id)
+            .order_by(StudentProgress.academic_year, StudentProgress.term, Student.class_name,
+                      Student.last_name, Student.id, StudentProgress.subject))
+
+
+def _messages():
+    return (select(ContactMessage.created_at, ContactMessage.name, ContactMessage.email, ContactMessage.subject,
+                   ContactMessage.message, ContactMessage.status, ContactMessage.responded_at,
+                   ContactMessage.response)
+            .order_by(ContactMessage.created_at, ContactMessage.id))
+
+
+def _export(name):
+    if name == 'attendance':
+        return Export(['date', 'student_id', 'username', 'first_name', 'last_name', 'class', 'status', 'marked_by'],
+                      _attendance(), Attendance.date, Student.class_name)
+    if name == 'assignments':
+        statement, rows = _assignments()
+        return Export(['assignment_id', 'title', 'subject', 'class', 'due_date', 'username', 'first_name',
+                       'last_name', 'status', 'grade'], statement, rows.c.due_date, rows.c.class_name)
+    if name == 'progress':
+        return Export(['academic_year', 'term', 'username', 'first_name', 'last_name', 'class', 'subject', 'grade',
+                       'remarks', 'recorded_at'], _progress(), StudentProgress.created_at, Student.class_name)
+    if name == 'messages':
+        return Export(['received_at', 'name', 'email', 'subject', 'message', 'status', 'responded_at', 'response'],
+                      _messages(), ContactMessage.created_at, None)
+    raise KeyError(name)
+
+
+EXPORTS = ('attendance', 'assignments', 'progress', 'messages')
+FORMATS = ('csv', 'xlsx')
+
+
+def _bound(column, value, end=False):
+    """Compare date filters against DateTime columns as whole days."""
+    if isinstance(column.type, db.DateTime) and not isinstance(value, datetime):
+        return datetime.combine(value, time.max if end else time.min)
+    return value
+
+
+def export_statement(name, start=None, end=None, class_name=None):
+    """The export's SELECT with the date range (inclusive) and class filters applied."""
+    export = _export(name)
+    statement = export.statement
+    if start:
+        statement = statement.where(export.date_column >= _bound(export.date_column, start))
+    if end:
+        statement = statement.where(export.date_column <= _bound(export.date_column, end, end=True))
+    if class_name and export.class_column is not None:
+        statement = statement.where(export.class_column == class_name)
+    return export.headers, statement
+
+
+def _rows(statement):
+    return db.session.execute(statement.execution_options(yield_per=FETCH_SIZE))
+
+
+def _text(value):
+    """`value`, with a leading ' on text a spreadsheet would otherwise read as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return _text(value)
+
+
+def stream_csv(headers, statement):
+    """Yield the export as CSV text, a few hundred rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(_rows(statement), start=1):
+        writer.writerow([_cell(value) for value in row])
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_xlsx(headers, statement, chunk_size=64 * 1024):
+    """Yield the export as an XLSX workbook, built in write-only mode on disk.
+
+    Raises RuntimeError straight away (not once streaming has started) without openpyxl.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError('XLSX export needs the openpyxl package; export as CSV instead.')
+
+    def chunks():
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Export')
+        sheet.append(headers)
+        for row in _rows(statement):
+            sheet.append([_text(value) for value in row])
+        os.makedirs(current_app.instance_path, exist_ok=True)  # Not created on PostgreSQL deployments
+        with tempfile.TemporaryFile(dir=current_app.instance_path) as f:
+            workbook.save(f)
+            f.seek(0)
+            while chunk := f.read(chunk_size):
+                yield chunk
+    return chunks()
+
+
+MIMETYPES = {'csv': 'text/csv',
+             'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+
+
+def stream_export(name, fmt='csv', start=None, end=None, class_name=None):
+    headers, statement = export_statement(name, start, end, class_name)
+    if fmt == 'xlsx':
+        return stream_xlsx(headers, statement)
+    return stream_csv(headers, statement)
+
+
+def export_filename(name, fmt, start=None, end=None, class_name=None):
+    parts = [name, class_name, start and start.isoformat(), end and end.isoformat()]
+    return '_'.join(part for part in parts if part) + f'.{fmt}'
+
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export attendance, assignments, progress or contact messages.')
+    parser.add_argument('name', choices=EXPORTS)
+    parser.add_argument('--from', dest='start', type=_date, help='first day, YYYY-MM-DD')
+    parser.add_argument('--to', dest='end', type=_date, help='last day, YYYY-MM-DD')
+    parser.add_argument('--class', dest='class_name', help='only this class')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help='file to write (default: derived from the filters)')
+    args = parser.parse_args(argv)
+
+    output = args.output or export_filename(args.name, args.format, args.start, args.end, args.class_name)
+    with app.app_context(), open(output, 'wb') as f:
+        for chunk in stream_export(args.name, args.format, args.start, args.end, args.class_name):
+            f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import xml.etree.ElementTree as ET
+
+from flask import url_for
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+FEED_TITLE = 'School News & Events'
+
+
+def _author_name(announcement):
+    if announcement.author:
+        return f"{announcement.author.first_name or ''} {announcement.author.last_name or ''}".strip()
+    return None
+
+
+def _attachment_url(announcement):
+    if not announcement.file_url:
+        return None
+    if announcement.file_url.startswith('http'):
+        return announcement.file_url
+    return url_for('static', filename=announcement.file_url.lstrip('/'), _external=True)
+
+
+def build_json_feed(page):
+    """Render a page of announcements as a JSON Feed 1.1 document."""
+    feed = {
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': FEED_TITLE,
+        'home_page_url': url_for('main.news', _external=True),
+        'feed_url': url_for('main.news_json', _external=True),
+        'items': [],
+    }
+    if page.has_next:
+        feed['next_url'] = url_for('main.news_json', cursor=page.next_cursor, _external=True)
+
+    for announcement in page.items:
+        item = {
+            'id': str(announcement.id),
+            'url': url_for('main.news', _external=True) + f'#announcement-{announcement.id}',
+            'title': announcement.title,
+            'content_html': announcement.content,
+            'date_published': announcement.created_at.isoformat() + 'Z',
+        }
+        author = _author_name(announcement)
+        if author:
+            item['authors'] = [{'name': author}]
+        attachment = _attachment_url(announcement)
+        if attachment:
+            item['attachments'] = [{'url': attachment, 'mime_type': 'application/octet-stream'}]
+        feed['items'].append(item)
+    return feed
+
+
+def build_atom_feed(page):
+    """Render a page of announcements as an Atom 1.0 document."""
+    ET.register_namespace('', ATOM_NS)
+    feed = ET.Element(f'{{{ATOM_NS}}}feed')
+
+    def sub(parent, tag, text=None, **attrs):
+        element = ET.SubElement(parent, f'{{{ATOM_NS}}}{tag}', attrs)
+        if text is not None:
+            element.text = text
+        return element
+
+    sub(feed, 'title', FEED_TITLE)
+    sub(feed, 'id', url_for('main.news', _external=True))
+    sub(feed, 'link', href=url_for('main.news_atom', _external=True), rel='self')
+    sub(feed, 'link', href=url_for('main.news', _external=True), rel='alternate')
+    if page.has_next:
+        sub(feed, 'link', href=url_for('main.news_atom', cursor=page.next_cursor, _external=True), rel='next')
+    updated = page.items[0].created_at if page.items else None
+    sub(feed, 'updated', (updated.isoformat() + 'Z') if updated else '1970-01-01T00:00:00Z')
+
+    for announcement in page.items:
+        entry = sub(feed, 'entry')
+        sub(entry, 'id', url_for('main.news', _external=True) + f'#announcement-{announcement.id}')
+        sub(entry, 'title', announcement.title)
+        sub(entry, 'updated', announcement.created_at.isoformat() + 'Z')
+        sub(entry, 'published', announcement.created_at.isoformat() + 'Z')
+        sub(entry, 'content', announcement.content, type='html')
+        author = _author_name(announcement)
+        if author:
+            sub(sub(entry, 'author'), 'name', author)
+        attachment = _attachment_url(announcement)
+        if attachment:
+            sub(entry, 'link', href=attachment, rel='enclosure')
+
+    return ET.tostring(feed, encoding='utf-8', xml_declaration=True)
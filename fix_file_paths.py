@@ -1,5 +1,6 @@
 from app import app, db
 from models import Media, GalleryItem, Banner, Document, PopupBanner
+from storage import get_storage, upload_key
 import os
 import logging
 
@@ -14,6 +15,24 @@ def ensure_directory_exists(directory):
         logger.info(f"Created directory: {directory}")
 
 
+def upload_exists(url):
+    """Return True if an /uploads/... URL points at a stored file (other URLs: a file under the static folder)."""
+    url = '/' + url.lstrip('/')
+    if url.startswith('/uploads/'):
+        return get_storage().exists(upload_key(url))
+    return os.path.exists(os.path.join(app.static_folder, url.lstrip('/')))
+
+
+def find_relocated_url(url, subfolder):
+    """Look for a missing upload in uploads/<subfolder>/ and then uploads/, returning its corrected URL."""
+    filename = os.path.basename(url)
+    storage = get_storage()
+    for new_url in (f"/uploads/{subfolder}/{filename}", f"/uploads/{filename}"):
+        if storage.exists(upload_key(new_url)):
+            return new_url
+    return None
+
+
 def fix_paths():
     with app.app_context():
         logger.info("Checking and fixing file paths...")
@@ -36,40 +55,21 @@ def fix_paths():
                     # Skip external videos
                     continue
 
-                if item.file_url.startswith('/uploads/'):
-                    static_path = os.path.join(app.static_folder, item.file_url.lstrip('/'))
-                    if not os.path.exists(static_path):
-                        logger.info(f"Media file not found: {static_path}")
-                        # Try to determine if it's in a different location
-                        filename = os.path.basename(item.file_url)
-                        possible_locations = [
-                            os.path.join(app.static_folder, 'uploads', 'media', filename),
-                            os.path.join(app.static_folder, 'uploads', filename)
-                        ]
-
-                        for loc in possible_locations:
-                            if os.path.exists(loc):
-                                new_url = f"/uploads/media/{filename}" if 'media' in loc else f"/uploads/{filename}"
-                                logger.info(f"Updating media URL from {item.file_url} to {new_url}")
-                                item.file_url = new_url
-                                break
+                if item.file_url.startswith('/uploads/') and not upload_exists(item.file_url):
+                    logger.info(f"Media file not found: {item.file_url}")
+                    # Try to determine if it's in a different location
+                    new_url = find_relocated_url(item.file_url, 'media')
+                    if new_url:
+                        logger.info(f"Updating media URL from {item.file_url} to {new_url}")
+                        item.file_url = new_url
 
             # Fix thumbnail_url
-            if item.thumbnail_url and item.thumbnail_url.startswith('/uploads/'):
-                static_path = os.path.join(app.static_folder, item.thumbnail_url.lstrip('/'))
-                if not os.path.exists(static_path):
-                    filename = os.path.basename(item.thumbnail_url)
-                    possible_locations = [
-                        os.path.join(app.static_folder, 'uploads', 'thumbnails', filename),
-                        os.path.join(app.static_folder, 'uploads', filename)
-                    ]
-
-                    for loc in possible_locations:
-                        if os.path.exists(loc):
-                            new_url = f"/uploads/thumbnails/{filename}" if 'thumbnails' in loc else f"/uploads/{filename}"
-                            logger.info(f"Updating thumbnail URL from {item.thumbnail_url} to {new_url}")
-                            item.thumbnail_url = new_url
-                            break
+            if item.thumbnail_url and item.thumbnail_url.startswith('/uploads/') and \
+                    not upload_exists(item.thumbnail_url):
+                new_url = find_relocated_url(item.thumbnail_url, 'thumbnails')
+                if new_url:
+                    logger.info(f"Updating thumbnail URL from {item.thumbnail_url} to {new_url}")
+                    item.thumbnail_url = new_url
 
         # Fix GalleryItem paths
         gallery_items = GalleryItem.query.all()
@@ -79,24 +79,12 @@ def fix_paths():
             if item.image_url:
                 # First handle URLs with relative paths
                 if item.image_url.startswith('/uploads/'):
-                    static_path = os.path.join(app.static_folder, item.image_url.lstrip('/'))
-                    if not os.path.exists(static_path):
-                        filename = os.path.basename(item.image_url)
-                        possible_locations = [
-                            os.path.join(app.static_folder, 'uploads', 'gallery', filename),
-                            os.path.join(app.static_folder, 'uploads', filename)
-                        ]
-
-                        found = False
-                        for loc in possible_locations:
-                            if os.path.exists(loc):
-                                new_url = f"/uploads/gallery/{filename}" if 'gallery' in loc else f"/uploads/{filename}"
-                                logger.info(f"Updating gallery image URL from {item.image_url} to {new_url}")
-                                item.image_url = new_url
-                                found = True
-                                break
-
-                        if not found:
+                    if not upload_exists(item.image_url):
+                        new_url = find_relocated_url(item.image_url, 'gallery')
+                        if new_url:
+                            logger.info(f"Updating gallery image URL from {item.image_url} to {new_url}")
+                            item.image_url = new_url
+                        else:
                             logger.warning(f"Could not find image file for gallery item {item.id}: {item.title}")
 
                 # Handle URLs without leading slash
@@ -107,85 +95,46 @@ def fix_paths():
                         logger.info(f"Added leading slash to URL: {item.image_url}")
 
                     # Check if the file exists
-                    static_path = os.path.join(app.static_folder, item.image_url.lstrip('/'))
-                    if not os.path.exists(static_path):
-                        logger.warning(f"Image file does not exist at {static_path} for gallery item {item.id}")
+                    if not upload_exists(item.image_url):
+                        logger.warning(f"Image file does not exist for gallery item {item.id}: {item.image_url}")
                         # Try to find the file in common locations
-                        filename = os.path.basename(item.image_url)
-                        possible_locations = [
-                            os.path.join(app.static_folder, 'uploads', 'gallery', filename),
-                            os.path.join(app.static_folder, 'uploads', filename)
-                        ]
-
-                        for loc in possible_locations:
-                            if os.path.exists(loc):
-                                new_url = f"/uploads/gallery/{filename}" if 'gallery' in loc else f"/uploads/{filename}"
-                                logger.info(f"Found and updated gallery image URL to {new_url}")
-                                item.image_url = new_url
-                                break
+                        new_url = find_relocated_url(item.image_url, 'gallery')
+                        if new_url:
+                            logger.info(f"Found and updated gallery image URL to {new_url}")
+                            item.image_url = new_url
 
         # Fix Banner paths
         banners = Banner.query.all()
         logger.info(f"Processing {len(banners)} banners...")
 
         for banner in banners:
-            if banner.image_url and banner.image_url.startswith('/uploads/'):
-                static_path = os.path.join(app.static_folder, banner.image_url.lstrip('/'))
-                if not os.path.exists(static_path):
-                    filename = os.path.basename(banner.image_url)
-                    possible_locations = [
-                        os.path.join(app.static_folder, 'uploads', 'banners', filename),
-                        os.path.join(app.static_folder, 'uploads', filename)
-                    ]
-
-                    for loc in possible_locations:
-                        if os.path.exists(loc):
-                            new_url = f"/uploads/banners/{filename}" if 'banners' in loc else f"/uploads/{filename}"
-                            logger.info(f"Updating banner image URL from {banner.image_url} to {new_url}")
-                            banner.image_url = new_url
-                            break
+            if banner.image_url and banner.image_url.startswith('/uploads/') and not upload_exists(banner.image_url):
+                new_url = find_relocated_url(banner.image_url, 'banners')
+                if new_url:
+                    logger.info(f"Updating banner image URL from {banner.image_url} to {new_url}")
+                    banner.image_url = new_url
 
         # Fix PopupBanner paths
         popups = PopupBanner.query.all()
         logger.info(f"Processing {len(popups)} popup banners...")
 
         for popup in popups:
-            if popup.image_url and popup.image_url.startswith('/uploads/'):
-                static_path = os.path.join(app.static_folder, popup.image_url.lstrip('/'))
-                if not os.path.exists(static_path):
-                    filename = os.path.basename(popup.image_url)
-                    possible_locations = [
-                        os.path.join(app.static_folder, 'uploads', 'popups', filename),
-                        os.path.join(app.static_folder, 'uploads', filename)
-                    ]
-
-                    for loc in possible_locations:
-                        if os.path.exists(loc):
-                            new_url = f"/uploads/popups/{filename}" if 'popups' in loc else f"/uploads/{filename}"
-                            logger.info(f"Updating popup image URL from {popup.image_url} to {new_url}")
-                            popup.image_url = new_url
-                            break
+            if popup.image_url and popup.image_url.startswith('/uploads/') and not upload_exists(popup.image_url):
+                new_url = find_relocated_url(popup.image_url, 'popups')
+                if new_url:
+                    logger.info(f"Updating popup image URL from {popup.image_url} to {new_url}")
+                    popup.image_url = new_url
 
         # Fix Document paths
         documents = Document.query.all()
         logger.info(f"Processing {len(documents)} documents...")
 
         for doc in documents:
-            if doc.file_url and doc.file_url.startswith('/uploads/'):
-                static_path = os.path.join(app.static_folder, doc.file_url.lstrip('/'))
-                if not os.path.exists(static_path):
-                    filename = os.path.basename(doc.file_url)
-                    possible_locations = [
-                        os.path.join(app.static_folder, 'uploads', 'documents', filename),
-                        os.path.join(app.static_folder, 'uploads', filename)
-                    ]
-
-                    for loc in possible_locations:
-                        if os.path.exists(loc):
-                            new_url = f"/uploads/documents/{filename}" if 'documents' in loc else f"/uploads/{filename}"
-                            logger.info(f"Updating document URL from {doc.file_url} to {new_url}")
-                            doc.file_url = new_url
-                            break
+            if doc.file_url and doc.file_url.startswith('/uploads/') and not upload_exists(doc.file_url):
+                new_url = find_relocated_url(doc.file_url, 'documents')
+                if new_url:
+                    logger.info(f"Updating document URL from {doc.file_url} to {new_url}")
+                    doc.file_url = new_url
 
         # Save changes to database
         try:
@@ -3,6 +3,7 @@ import logging
 from app import app, db
 from models import GalleryItem, GalleryCategory, Media
 from werkzeug.utils import secure_filename
+from image_variants import remove_variants
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,9 +17,8 @@ def fix_gallery_paths():
         logger.info(f"Found {len(items)} gallery items to process")
 
         for item in items:
-            if not item.image_url.startswith('/uploads/gallery/') and not item.image_url.startswith('http'):
-                logger.info(f"Processing item {item.id}: {item.title}")
-
+            # Files in the shared blob store (uploads.py) stay where they are
+            if not item.image_url.startswith(('/uploads/blobs/', 'http')):
                 # Get category
                 category = GalleryCategory.query.get(item.category_id)
                 if not category:
@@ -27,6 +27,12 @@ def fix_gallery_paths():
 
                 folder_name = secure_filename(category.name.lower().replace(' ', '_'))
 
+                # Already in its category's folder; others, including files directly
+                # under /uploads/gallery/, are what check_media_integrity reports as mislocated
+                if item.image_url.startswith(f'/uploads/gallery/{folder_name}/'):
+                    continue
+                logger.info(f"Processing item {item.id}: {item.title}")
+
                 # Extract filename from existing path
                 old_filename = os.path.basename(item.image_url)
 
@@ -51,7 +57,9 @@ def fix_gallery_paths():
                         except Exception as e:
                             logger.error(f"Error moving file: {str(e)}")
 
-                    # Update database
+                    # Update database; variants next to the old file are dropped and
+                    # recreated by backfill_image_variants.py
+                    remove_variants(item)
                     item.image_url = new_path
                     db.session.commit()
                     logger.info(f"Updated database record for item {item.id}")
@@ -1,14 +1,32 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SelectField, TextAreaField, SubmitField, BooleanField, FileField, IntegerField, DateField, FloatField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, URL, Optional, ValidationError
-from models import RegistrationCode, User, Teacher
+from wtforms import StringField, PasswordField, SelectField, TextAreaField, SubmitField, BooleanField, FileField, HiddenField, IntegerField, DateField, FloatField
+from wtforms.validators import DataRequired, Email, Length, EqualTo, URL, Optional, ValidationError, NumberRange
+from sqlalchemy import or_
+from models import RegistrationCode, User
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     password = PasswordField('Password', validators=[DataRequired()])
     submit = SubmitField('Login')
 
-class RegistrationForm(FlaskForm):
+class AccountAvailabilityMixin:
+    """Checks username and email against every account (students, admins and teachers) in one query."""
+
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        taken = User.query.with_entities(User.username, User.email).filter(
+            or_(User.username == self.username.data, User.email == self.email.data)
+        ).all()
+        for username, email in taken:
+            if username == self.username.data:
+                self.username.errors.append('Username already taken. Please choose a different one.')
+                valid = False
+            if email == self.email.data:
+                self.email.errors.append('Email already registered. Please use a different email.')
+                valid = False
+        return valid
+
+class RegistrationForm(AccountAvailabilityMixin, FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=20)])
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
@@ -20,24 +38,12 @@ class RegistrationForm(FlaskForm):
     registration_code = StringField('Registration Code', validators=[DataRequired()])
     submit = SubmitField('Register')
 
-    def validate_email(self, field):
-        user = User.query.filter_by(email=field.data).first()
-        teacher = Teacher.query.filter_by(email=field.data).first()
-        if user or teacher:
-            raise ValidationError('Email already registered. Please use a different email.')
-
-    def validate_username(self, field):
-        user = User.query.filter_by(username=field.data).first()
-        teacher = Teacher.query.filter_by(username=field.data).first()
-        if user or teacher:
-            raise ValidationError('Username already taken. Please choose a different one.')
-
     def validate_registration_code(self, field):
         code = RegistrationCode.query.filter_by(code=field.data, is_used=False).first()
         if not code:
             raise ValidationError('Invalid or already used registration code')
 
-class TeacherRegistrationForm(FlaskForm):
+class TeacherRegistrationForm(AccountAvailabilityMixin, FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=20)])
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
@@ -50,18 +56,6 @@ class TeacherRegistrationForm(FlaskForm):
     registration_code = StringField('Registration Code', validators=[DataRequired()])
     submit = SubmitField('Register as Teacher')
 
-    def validate_email(self, field):
-        user = User.query.filter_by(email=field.data).first()
-        teacher = Teacher.query.filter_by(email=field.data).first()
-        if user or teacher:
-            raise ValidationError('Email already registered. Please use a different email.')
-
-    def validate_username(self, field):
-        user = User.query.filter_by(username=field.data).first()
-        teacher = Teacher.query.filter_by(username=field.data).first()
-        if user or teacher:
-            raise ValidationError('Username already taken. Please choose a different one.')
-
     def validate_registration_code(self, field):
         code = RegistrationCode.query.filter_by(code=field.data, is_used=False, role='teacher').first()
         if not code:
@@ -69,8 +63,14 @@ class TeacherRegistrationForm(FlaskForm):
 
 class RegistrationCodeForm(FlaskForm):
     role = SelectField('Role', choices=[('student', 'Student'), ('teacher', 'Teacher')])
+    count = IntegerField('Number of codes', default=1, validators=[DataRequired(), NumberRange(min=1, max=1000)])
     submit = SubmitField('Generate Code')
 
+class BulkImportForm(FlaskForm):
+    file = FileField('CSV or Excel file', validators=[DataRequired()])
+    dry_run = BooleanField('Validate only (import nothing)')
+    submit = SubmitField('Import')
+
 class AssignmentForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired()])
     description = TextAreaField('Description', validators=[DataRequired()])
@@ -85,7 +85,13 @@ class SubmitAssignmentForm(FlaskForm):
     comments = TextAreaField('Comments')
     submit = SubmitField('Submit Assignment')
 
+class GradeAssignmentForm(FlaskForm):
+    grade = StringField('Grade', validators=[DataRequired(), Length(max=5)])
+    feedback = TextAreaField('Feedback')
+    submit = SubmitField('Save Grade')
+
 class AttendanceForm(FlaskForm):
+    class_name = SelectField('Class', validators=[DataRequired()], choices=[])
     date = DateField('Date', validators=[DataRequired()])
     status = SelectField('Status', choices=[
         ('present', 'Present'),
@@ -153,6 +159,8 @@ class MediaForm(FlaskForm):
         ('video', 'Video')
     ], validators=[DataRequired()])
     media_file = FileField('Media File')
+    direct_upload_url = HiddenField()  # Set by the page after uploading straight to object storage
+    upload_id = HiddenField()  # Set by the page after a resumable upload (see resumable_uploads.py) completes
     video_url = StringField('Video URL (YouTube/Facebook)')
     video_platform = SelectField('Video Platform', choices=[
         ('youtube', 'YouTube'),
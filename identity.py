@@ -0,0 +1,82 @@
+"""Typed login identities for Flask-Login.
+
+The id stored in the session names the account type as well as the id: "user:34" or
+"teacher:12". All accounts live in the user table, so loading one costs a single
+primary-key query, and an account whose type doesn't match is rejected. That includes
+sessions issued before teachers moved out of their own table, whose ids were
+renumbered. With IDENTITY_CACHE_TTL > 0 the row is kept in a short-lived in-process
+cache so most dashboard requests need no query at all.
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app import db
+from cache import TTLCache
+from models import User, Teacher
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_MODELS = {'user': User, 'teacher': Teacher}
+
+# (kind, id) -> column values of the principal's row
+identity_cache = TTLCache(ttl=10, max_entries=4096)
+
+
+def parse_identity(value, legacy_type=None):
+    """Split "teacher:12" into ('teacher', 12). Returns None for anything malformed.
+
+    Sessions created before typed identities hold a bare id; `legacy_type` (the old
+    session['user_type'] marker) says which table it belongs to.
+    """
+    kind, _, raw_id = str(value).rpartition(':')
+    kind = kind or legacy_type
+    if kind not in PRINCIPAL_MODELS or not raw_id.isdigit():
+        return None
+    return kind, int(raw_id)
+
+
+def _snapshot(principal):
+    return {attr.key: getattr(principal, attr.key) for attr in inspect(type(principal)).column_attrs}
+
+
+def _from_snapshot(model, values):
+    principal = model(**values)
+    make_transient_to_detached(principal)
+    # Attach to this request's session without a query, so relationships still lazy-load
+    return db.session.merge(principal, load=False)
+
+
+def load_identity(value, legacy_type=None):
+    parsed = parse_identity(value, legacy_type)
+    if parsed is None:
+        return None
+    kind, principal_id = parsed
+    model = PRINCIPAL_MODELS[kind]
+
+    ttl = current_app.config.get('IDENTITY_CACHE_TTL', 0)
+    if ttl:
+        values = identity_cache.get(parsed)
+        if values is not None:
+            return _from_snapshot(model, values)
+
+    principal = db.session.get(User, principal_id)
+    if principal is None or type(principal) is not model:
+        logger.debug(f"No {kind} with id {principal_id}")
+        return None
+    if ttl:
+        identity_cache.set(parsed, _snapshot(principal), ttl=ttl)
+    return principal
+
+
+def forget_identity(principal):
+    identity_cache.delete((principal.get_id().split(':', 1)[0], principal.id))
+
+
+# Password changes, role/class edits and deletions must not be served from the cache
+@event.listens_for(User, 'after_update', propagate=True)
+@event.listens_for(User, 'after_delete', propagate=True)
+def _forget_changed_identity(mapper, connection, target):
+    forget_identity(target)
@@ -0,0 +1,104 @@
+import os
+import logging
+
+from flask import url_for
+from PIL import Image, ImageOps, features
+
+from storage import get_storage, upload_key
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for each uploaded image; originals are never upscaled
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+
+# Output formats in order of preference, with the Pillow encoder options used for each
+VARIANT_FORMATS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+def supported_formats():
+    return [fmt for fmt in VARIANT_FORMATS if features.check(fmt)]
+
+
+def generate_variants(file_path, url):
+    """Write resized WebP/AVIF copies next to an uploaded image.
+
+    `url` is the /uploads/... URL of the original. Returns a dict with the original's
+    pixel dimensions and a list of variants ({url, width, height, format}), or None if
+    the file is not an image Pillow can read.
+    """
+    try:
+        with Image.open(file_path) as img:
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+            stem, _ = os.path.splitext(file_path)
+            url_stem, _ = os.path.splitext(url)
+            variants = []
+            widths = [w for w in VARIANT_WIDTHS if w < width] + [width]
+            for target_width in widths:
+                target_height = max(1, round(height * target_width / width))
+                resized = img if target_width == width else img.resize((target_width, target_height),
+                                                                      Image.LANCZOS)
+                for fmt in supported_formats():
+                    variant_path = f'{stem}-{target_width}w.{fmt}'
+                    resized.save(variant_path, fmt.upper(), **VARIANT_FORMATS[fmt])
+                    variants.append({
+                        'url': f'{url_stem}-{target_width}w.{fmt}',
+                        'width': target_width,
+                        'height': target_height,
+                        'format': fmt,
+                    })
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not generate image variants for {file_path}: {str(e)}")
+        return None
+
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def apply_variants(obj, file_path, url):
+    """Generate variants for an uploaded image and record them on a model with image_* columns."""
+    result = generate_variants(file_path, url)
+    if result is None:
+        obj.image_width = obj.image_height = None
+        obj.image_variants = None
+        return
+    obj.image_width = result['width']
+    obj.image_height = result['height']
+    obj.image_variants = result['variants']
+    logger.info(f"Generated {len(result['variants'])} image variants for {url}")
+
+
+def remove_variants(obj):
+    """Delete the variant files recorded on a model and clear its image_* columns.
+
+    Call this before deleting or replacing the image so stale variants are never served.
+    Variants of a shared upload blob are left for uploads.py to delete with the blob.
+    """
+    for variant in obj.image_variants or []:
+        if variant['url'].startswith('/uploads/blobs/'):
+            continue
+        try:
+            get_storage().delete(upload_key(variant['url']))
+        except Exception as e:
+            logger.error(f"Failed to delete image variant {variant['url']}: {str(e)}")
+    obj.image_width = obj.image_height = None
+    obj.image_variants = None
+
+
+def image_sources(obj):
+    """Template helper: return [(mime_type, srcset)] for each variant format of a model's image."""
+    sources = []
+    for fmt in VARIANT_FORMATS:
+        entries = [v for v in (obj.image_variants or []) if v['format'] == fmt]
+        if entries:
+            srcset = ', '.join(f"{url_for('static', filename=v['url'].lstrip('/'))} {v['width']}w"
+                               for v in sorted(entries, key=lambda v: v['width']))
+            sources.append((MIME_TYPES[fmt], srcset))
+    return sources
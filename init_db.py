@@ -1,5 +1,6 @@
 
 from app import app, db
+from migrate import upgrade
 from models import User, RegistrationCode, Announcement, Assignment, StudentProgress
 from models import TransferCertificate, Attendance, Banner, Document, Media, Content
 from models import PopupBanner, GalleryCategory, GalleryItem, FeeStructure, PublicDisclosure, ContactMessage
@@ -12,7 +13,7 @@ def initialize_database():
     with app.app_context():
         try:
             logger.info("Creating database tables...")
-            db.create_all()
+            upgrade()
             logger.info("Database tables created successfully!")
             
             # Create a sample registration code for admin
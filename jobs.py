@@ -0,0 +1,119 @@
+import os
+import time
+import socket
+import logging
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update, or_, and_
+
+from app import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Maps a job kind to the function that runs it
+_handlers = {}
+
+# A running job whose worker has not finished it within this window is assumed dead and retried
+STALE_LOCK_AFTER = timedelta(minutes=15)
+
+
+def job(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Queue a job and commit it.
+
+    Call this after the rows the job refers to have been committed. With
+    JOBS_RUN_INLINE set (useful in development without a worker), the job runs
+    immediately in the current request instead.
+    """
+    new_job = Job(kind=kind, payload=payload)
+    db.session.add(new_job)
+    db.session.commit()
+    logger.info(f"Enqueued job {new_job.id}: {kind} {payload}")
+
+    if current_app.config.get('JOBS_RUN_INLINE'):
+        claimed = _claim(new_job.id, 'inline')
+        if claimed:
+            run_job(db.session.get(Job, new_job.id))
+    return new_job
+
+
+def _claim(job_id, worker_id):
+    """Atomically move a queued job to running. Returns False if another worker got it first."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, or_(Job.status == 'queued',
+                                     and_(Job.status == 'running', Job.locked_at < now - STALE_LOCK_AFTER)))
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def claim_next(worker_id):
+    """Claim the oldest runnable job, or return None if the queue is empty."""
+    now = datetime.utcnow()
+    candidates = db.session.query(Job.id).filter(
+        or_(and_(Job.status == 'queued', Job.run_after <= now),
+            and_(Job.status == 'running', Job.locked_at < now - STALE_LOCK_AFTER))
+    ).order_by(Job.run_after, Job.id).limit(5).all()
+
+    for (job_id,) in candidates:
+        if _claim(job_id, worker_id):
+            return db.session.get(Job, job_id)
+    return None
+
+
+def run_job(claimed):
+    handler = _handlers.get(claimed.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{claimed.kind}'")
+        claimed.result = handler(**(claimed.payload or {}))
+        claimed.status = 'done'
+        claimed.finished_at = datetime.utcnow()
+        claimed.last_error = None
+        db.session.commit()
+        logger.info(f"Job {claimed.id} ({claimed.kind}) finished")
+    except Exception as e:
+        db.session.rollback()
+        claimed = db.session.get(Job, claimed.id)
+        claimed.last_error = traceback.format_exc()
+        if claimed.attempts >= claimed.max_attempts:
+            claimed.status = 'failed'
+            claimed.finished_at = datetime.utcnow()
+        else:
+            # Back off exponentially before the next attempt
+            claimed.status = 'queued'
+            claimed.run_after = datetime.utcnow() + timedelta(seconds=30 * 2 ** (claimed.attempts - 1))
+        db.session.commit()
+        logger.error(f"Job {claimed.id} ({claimed.kind}) failed on attempt {claimed.attempts}: {str(e)}")
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(poll_interval=2.0, once=False):
+    """Process jobs until interrupted (or until the queue is empty when `once` is set)."""
+    me = worker_id()
+    logger.info(f"Job worker {me} started")
+    while True:
+        claimed = claim_next(me)
+        if claimed is not None:
+            run_job(claimed)
+            continue
+        if once:
+            return
+        db.session.remove()
+        time.sleep(poll_interval)
@@ -0,0 +1,95 @@
+"""Apply the numbered schema migrations in migrations/ to the configured database.
+
+    python migrate.py           # apply pending migrations
+    python migrate.py --list    # show applied and pending migrations
+
+Applied versions are recorded in the schema_migrations table; each migration
+runs in its own transaction. Migration 0001 builds the original schema, so this is
+also how a new database is created; deployments run it before starting the app.
+"""
+import argparse
+import importlib
+import pkgutil
+from datetime import datetime
+from contextlib import contextmanager
+
+from sqlalchemy import Table, Column, String, DateTime, MetaData, select, insert, text
+
+from app import app, db
+import migrations
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def available_migrations():
+    """[(version, module name)] sorted by version, e.g. ('0003', 'migrations.0003_hot_query_indexes')."""
+    found = []
+    for module in pkgutil.iter_modules(migrations.__path__):
+        version = module.name.split('_', 1)[0]
+        if version.isdigit():
+            found.append((version, f"{migrations.__name__}.{module.name}"))
+    return sorted(found)
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+# pg_advisory_lock key held while migrating, so instances starting together take turns
+MIGRATION_LOCK_KEY = 0x5C400109
+
+
+@contextmanager
+def migration_lock():
+    if db.engine.dialect.name != 'postgresql':
+        yield
+        return
+    with db.engine.connect() as conn:
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def upgrade():
+    with migration_lock():
+        with db.engine.begin() as conn:
+            applied = applied_versions(conn)
+
+        pending = [(version, name) for version, name in available_migrations() if version not in applied]
+        for version, name in pending:
+            print(f"Applying {name}...")
+            module = importlib.import_module(name)
+            with db.engine.begin() as conn:
+                module.upgrade(conn)
+                conn.execute(insert(schema_migrations).values(version=version, applied_at=datetime.utcnow()))
+    print(f"Applied {len(pending)} migration(s); database is up to date.")
+
+
+def show():
+    with db.engine.begin() as conn:
+        applied = applied_versions(conn)
+    for version, name in available_migrations():
+        print(f"[{'x' if version in applied else ' '}] {name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply database schema migrations.')
+    parser.add_argument('--list', action='store_true', help='list migrations instead of applying them')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.list:
+            show()
+        else:
+            upgrade()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""The original schema, plus the columns previously added by the update_db*.py scripts and
+the image pipeline, and the job and assignment_submission tables.
+
+Tables are spelled out as they stood at this migration rather than taken from models.py,
+so replaying the migrations on an empty or old database always builds the same history;
+later migrations make every change since.
+"""
+from sqlalchemy import (MetaData, Table, Column, ForeignKey, UniqueConstraint, Integer, String, Text, Boolean,
+                        DateTime, Date, Float, JSON)
+
+from migrations import add_column
+
+metadata = MetaData()
+
+Table('registration_code', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('code', String(20), unique=True, nullable=False),
+      Column('role', String(20), nullable=False),
+      Column('is_used', Boolean),
+      Column('created_at', DateTime),
+      Column('used_by', Integer))
+
+Table('teacher', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(64), unique=True, nullable=False),
+      Column('email', String(120), unique=True, nullable=False),
+      Column('password_hash', String(256)),
+      Column('first_name', String(64)),
+      Column('last_name', String(64)),
+      Column('created_at', DateTime),
+      Column('registration_code_used', String(20)),
+      Column('subject', String(100)),
+      Column('qualification', String(100)),
+      Column('role', String(20)))
+
+Table('user', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(64), unique=True, nullable=False),
+      Column('email', String(120), unique=True, nullable=False),
+      Column('password_hash', String(256)),
+      Column('role', String(20), nullable=False),
+      Column('first_name', String(64)),
+      Column('last_name', String(64)),
+      Column('created_at', DateTime),
+      Column('registration_code_used', String(20)),
+      Column('class_name', String(20)),
+      Column('teacher_id', Integer, ForeignKey('teacher.id')))
+
+Table('announcement', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(200), nullable=False),
+      Column('content', Text, nullable=False),
+      Column('author_id', Integer, ForeignKey('user.id')),
+      Column('created_at', DateTime),
+      Column('file_url', String(255)))
+
+Table('assignment', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('description', Text),
+      Column('due_date', DateTime),
+      Column('file_url', String(255)),
+      Column('teacher_id', Integer, ForeignKey('teacher.id')),
+      Column('student_id', Integer, ForeignKey('user.id')),
+      Column('class_name', String(20)),
+      Column('subject', String(50)),
+      Column('status', String(20)),
+      Column('grade', String(5)),
+      Column('feedback', Text),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('assignment_submission', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('assignment_id', Integer, ForeignKey('assignment.id'), nullable=False),
+      Column('student_id', Integer, ForeignKey('user.id'), nullable=False),
+      Column('status', String(20)),
+      Column('grade', String(5)),
+      Column('feedback', Text),
+      Column('file_url', String(255)),
+      Column('submitted_at', DateTime),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime),
+      UniqueConstraint('assignment_id', 'student_id', name='uq_submission_assignment_student'))
+
+Table('student_progress', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('student_id', Integer, ForeignKey('user.id')),
+      Column('subject', String(100)),
+      Column('grade', String(5)),
+      Column('remarks', Text),
+      Column('term', String(20)),
+      Column('academic_year', String(9)),
+      Column('created_at', DateTime))
+
+Table('transfer_certificate', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('student_id', Integer, ForeignKey('user.id')),
+      Column('tc_number', String(50), unique=True),
+      Column('issue_date', DateTime),
+      Column('reason', Text),
+      Column('file_url', String(255)),
+      Column('status', String(20)),
+      Column('created_at', DateTime))
+
+Table('attendance', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('student_id', Integer, ForeignKey('user.id')),
+      Column('date', Date, nullable=False),
+      Column('status', String(20)),
+      Column('marked_by', Integer, ForeignKey('teacher.id')),
+      Column('created_at', DateTime))
+
+Table('banner', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('description', Text),
+      Column('image_url', String(255), nullable=False),
+      Column('link_url', String(255)),
+      Column('is_active', Boolean),
+      Column('order', Integer),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('document', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('description', Text),
+      Column('document_type', String(50), nullable=False),
+      Column('file_url', String(255), nullable=False),
+      Column('is_public', Boolean),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('media', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('description', Text),
+      Column('media_type', String(50), nullable=False),
+      Column('file_url', String(255), nullable=False),
+      Column('thumbnail_url', String(255)),
+      Column('gallery_category', String(50)),
+      Column('is_featured', Boolean),
+      Column('is_active', Boolean),
+      Column('video_platform', String(50)),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('content', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('content', Text, nullable=False),
+      Column('page_key', String(50), nullable=False, unique=True),
+      Column('is_published', Boolean),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('popup_banner', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('content', Text),
+      Column('image_url', String(255)),
+      Column('is_active', Boolean),
+      Column('start_date', DateTime),
+      Column('end_date', DateTime),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('gallery_category', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(50), nullable=False),
+      Column('description', Text))
+
+Table('gallery_item', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('description', Text),
+      Column('image_url', String(255), nullable=False),
+      Column('category_id', Integer, ForeignKey('gallery_category.id')),
+      Column('is_featured', Boolean),
+      Column('is_active', Boolean),
+      Column('created_at', DateTime))
+
+Table('fee_structure', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(100), nullable=False),
+      Column('class_name', String(50), nullable=False),
+      Column('fee_type', String(50), nullable=False),
+      Column('amount', Float, nullable=False),
+      Column('academic_year', String(9), nullable=False),
+      Column('payment_frequency', String(20)),
+      Column('notes', Text),
+      Column('is_active', Boolean),
+      Column('file_url', String(255)),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('public_disclosure', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('title', String(200), nullable=False),
+      Column('category', String(50), nullable=False),
+      Column('content', Text, nullable=False),
+      Column('file_url', String(255)),
+      Column('is_active', Boolean),
+      Column('display_order', Integer),
+      Column('created_at', DateTime),
+      Column('updated_at', DateTime))
+
+Table('contact_message', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('email', String(120), nullable=False),
+      Column('subject', String(200), nullable=False),
+      Column('message', Text, nullable=False),
+      Column('status', String(20)),
+      Column('created_at', DateTime),
+      Column('response', Text),
+      Column('responded_at', DateTime),
+      Column('responded_by', Integer, ForeignKey('user.id')))
+
+Table('job', metadata,
+      Column('id', Integer, primary_key=True),
+      Column('kind', String(50), nullable=False),
+      Column('payload', JSON),
+      Column('status', String(20), nullable=False),
+      Column('attempts', Integer, nullable=False),
+      Column('max_attempts', Integer, nullable=False),
+      Column('run_after', DateTime, nullable=False),
+      Column('locked_by', String(100)),
+      Column('locked_at', DateTime),
+      Column('result', JSON),
+      Column('last_error', Text),
+      Column('created_at', DateTime),
+      Column('finished_at', DateTime))
+
+COLUMNS = [
+    ('teacher', 'role', "VARCHAR(20) DEFAULT 'teacher'"),
+    ('user', 'class_name', 'VARCHAR(20)'),
+    ('assignment', 'class_name', 'VARCHAR(20)'),
+    ('assignment', 'subject', 'VARCHAR(50)'),
+    ('media', 'is_active', 'BOOLEAN DEFAULT TRUE'),
+    ('media', 'video_platform', 'VARCHAR(50)'),
+    ('gallery_item', 'is_active', 'BOOLEAN DEFAULT TRUE'),
+]
+
+for table in ('banner', 'popup_banner', 'gallery_item', 'media'):
+    COLUMNS += [(table, 'image_width', 'INTEGER'), (table, 'image_height', 'INTEGER'),
+                (table, 'image_variants', 'JSON')]
+
+
+def upgrade(conn):
+    # Whatever is missing: everything on an empty database, job and assignment_submission on an old one
+    metadata.create_all(conn, checkfirst=True)
+    for table, name, ddl in COLUMNS:
+        add_column(conn, table, name, ddl)
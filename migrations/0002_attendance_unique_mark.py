@@ -0,0 +1,13 @@
+"""One attendance mark per student per day, which the attendance upsert relies on."""
+from sqlalchemy import text
+
+from migrations import create_index
+
+
+def upgrade(conn):
+    # Keep the most recent mark for each student and day
+    result = conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN (SELECT MAX(id) FROM attendance GROUP BY student_id, date)"))
+    if result.rowcount:
+        print(f"Removed {result.rowcount} duplicate attendance rows")
+    create_index(conn, 'uq_attendance_student_date', 'attendance', ['student_id', 'date'], unique=True)
@@ -0,0 +1,35 @@
+"""Composite indexes matching the filters and sort orders used by routes.py.
+
+Column order follows the query shapes: equality filters first, then the
+ORDER BY column, so SQLite/PostgreSQL can both filter and sort from the index.
+"""
+from migrations import create_index
+
+INDEXES = [
+    ('ix_user_role_class_name', 'user', ['role', 'class_name']),
+    ('ix_user_teacher_id', 'user', ['teacher_id']),
+    ('ix_announcement_created_at_id', 'announcement', ['created_at', 'id']),
+    ('ix_assignment_student_due_date', 'assignment', ['student_id', 'due_date']),
+    ('ix_assignment_teacher_created_at', 'assignment', ['teacher_id', 'created_at']),
+    ('ix_assignment_class_due_date', 'assignment', ['class_name', 'due_date']),
+    ('ix_assignment_submission_student_id', 'assignment_submission', ['student_id']),
+    ('ix_tc_student_status_created_at', 'transfer_certificate', ['student_id', 'status', 'created_at']),
+    ('ix_tc_status_created_at', 'transfer_certificate', ['status', 'created_at']),
+    ('ix_banner_is_active_order', 'banner', ['is_active', 'order']),
+    ('ix_media_type_active_category_created_at', 'media',
+     ['media_type', 'is_active', 'gallery_category', 'created_at']),
+    ('ix_media_type_active_created_at', 'media', ['media_type', 'is_active', 'created_at']),
+    ('ix_popup_banner_is_active_created_at', 'popup_banner', ['is_active', 'created_at']),
+    ('ix_gallery_item_category_active_created_at', 'gallery_item', ['category_id', 'is_active', 'created_at']),
+    ('ix_gallery_item_active_created_at', 'gallery_item', ['is_active', 'created_at']),
+    ('ix_fee_structure_year_active_class_type', 'fee_structure',
+     ['academic_year', 'is_active', 'class_name', 'fee_type']),
+    ('ix_fee_structure_active_year', 'fee_structure', ['is_active', 'academic_year']),
+    ('ix_public_disclosure_category_active_order', 'public_disclosure', ['category', 'is_active', 'display_order']),
+    ('ix_job_status_run_after', 'job', ['status', 'run_after']),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
@@ -0,0 +1,81 @@
+"""Move teachers into the user table (single-table inheritance on user.account_type).
+
+Teacher ids overlapped user ids, so each teacher gets a new id of old id + offset, where
+the offset is above every existing user and teacher id. The columns that referenced
+teacher.id are remapped the same way. Because no new teacher id equals an old one, a
+"teacher:<old id>" session cannot resolve to a different teacher afterwards. The old
+table is kept as teacher_legacy, or dropped if it held no teachers. Foreign keys that
+pointed at teacher point at user afterwards, on SQLite too.
+"""
+from sqlalchemy import inspect, text
+
+from migrations import add_column, table_names, repoint_foreign_keys, check_no_foreign_keys_to
+
+TEACHER_REFERENCES = [
+    ('user', 'teacher_id'),
+    ('assignment', 'teacher_id'),
+    ('attendance', 'marked_by'),
+]
+
+
+def _foreign_keys_to_teacher(conn):
+    inspector = inspect(conn)
+    return [(table, fk['name'], fk['constrained_columns'][0])
+            for table, _ in TEACHER_REFERENCES
+            for fk in inspector.get_foreign_keys(table)
+            if fk['referred_table'] == 'teacher' and fk['name']]
+
+
+def upgrade(conn):
+    add_column(conn, 'user', 'account_type', "VARCHAR(20) NOT NULL DEFAULT 'user'")
+    add_column(conn, 'user', 'subject', 'VARCHAR(100)')
+    add_column(conn, 'user', 'qualification', 'VARCHAR(100)')
+
+    if 'teacher' not in table_names(conn):
+        return
+
+    conflicts = conn.execute(text(
+        'SELECT t.username, t.email FROM teacher t JOIN "user" u ON u.username = t.username OR u.email = t.email'
+    )).all()
+    if conflicts:
+        raise RuntimeError("These teachers share a username or email with a user; rename them and re-run: "
+                           + ', '.join(f"{username} <{email}>" for username, email in conflicts))
+
+    offset = conn.execute(text(
+        'SELECT MAX(m) FROM (SELECT MAX(id) AS m FROM "user" UNION ALL SELECT MAX(id) FROM teacher) ids'
+    )).scalar() or 0
+
+    # SQLite does not enforce these; PostgreSQL must point them at "user" before ids are remapped
+    postgres = conn.dialect.name == 'postgresql'
+    if postgres:
+        for table, name, column in _foreign_keys_to_teacher(conn):
+            conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"'))
+
+    conn.execute(text(f"""
+        INSERT INTO "user" (id, username, email, password_hash, role, account_type, first_name, last_name,
+                            created_at, registration_code_used, subject, qualification)
+        SELECT id + {offset}, username, email, password_hash, COALESCE(role, 'teacher'), 'teacher', first_name,
+               last_name, created_at, registration_code_used, subject, qualification
+        FROM teacher
+    """))
+    for table, column in TEACHER_REFERENCES:
+        conn.execute(text(f'UPDATE "{table}" SET "{column}" = "{column}" + {offset} WHERE "{column}" IS NOT NULL'
+                          + (" AND account_type = 'user'" if table == 'user' else '')))
+    conn.execute(text(f"UPDATE registration_code SET used_by = used_by + {offset} "
+                      f"WHERE role = 'teacher' AND used_by IS NOT NULL"))
+
+    if postgres:
+        for table, column in TEACHER_REFERENCES:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD FOREIGN KEY ("{column}") REFERENCES "user" (id)'))
+        conn.execute(text("""SELECT setval(pg_get_serial_sequence('"user"', 'id'), (SELECT MAX(id) FROM "user"))"""))
+    else:
+        # SQLite never enforced them, but would carry them over to teacher_legacy on the rename
+        repoint_foreign_keys(conn, ['teacher'], 'user')
+    check_no_foreign_keys_to(conn, ['teacher'])
+
+    if conn.execute(text('SELECT COUNT(*) FROM teacher')).scalar():
+        conn.execute(text('ALTER TABLE teacher RENAME TO teacher_legacy'))
+        check_no_foreign_keys_to(conn, ['teacher', 'teacher_legacy'])
+    else:
+        conn.execute(text('DROP TABLE teacher'))
+    print(f"Moved teachers into the user table (ids offset by {offset})")
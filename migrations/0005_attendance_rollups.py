@@ -0,0 +1,36 @@
+"""Monthly attendance rollups, backfilled from the existing Attendance rows."""
+from sqlalchemy import MetaData, Table, Column, ForeignKey, UniqueConstraint, Integer, String, text
+
+metadata = MetaData()
+Table('user', metadata, Column('id', Integer, primary_key=True))  # Only for the foreign key
+
+# As AttendanceRollup stood at this migration
+attendance_rollup = Table(
+    'attendance_rollup', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('student_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('month', String(7), nullable=False),
+    Column('present', Integer, nullable=False),
+    Column('late', Integer, nullable=False),
+    Column('absent', Integer, nullable=False),
+    Column('days', Integer, nullable=False),
+    UniqueConstraint('student_id', 'month', name='uq_attendance_rollup_student_month'),
+)
+
+
+def upgrade(conn):
+    attendance_rollup.create(conn, checkfirst=True)
+    month = "to_char(date, 'YYYY-MM')" if conn.dialect.name == 'postgresql' else "strftime('%Y-%m', date)"
+    conn.execute(text("DELETE FROM attendance_rollup"))
+    result = conn.execute(text(f"""
+        INSERT INTO attendance_rollup (student_id, month, present, late, absent, days)
+        SELECT student_id, {month},
+               SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END),
+               COUNT(*)
+        FROM attendance
+        WHERE student_id IS NOT NULL
+        GROUP BY student_id, {month}
+    """))
+    print(f"Built {result.rowcount} attendance rollup rows")
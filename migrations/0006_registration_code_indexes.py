@@ -0,0 +1,27 @@
+"""Unique registration codes and an index for the filtered code list.
+
+Batch generation relies on the unique index to reject codes inserted concurrently.
+Tables built by db.create_all() already have a unique constraint on code; anything
+else gets a unique index, provided the existing codes are unique.
+"""
+from sqlalchemy import inspect, text
+
+from migrations import create_index
+
+
+def _code_is_unique(conn):
+    inspector = inspect(conn)
+    constraints = inspector.get_unique_constraints('registration_code')
+    indexes = [index for index in inspector.get_indexes('registration_code') if index['unique']]
+    return any(entry['column_names'] == ['code'] for entry in constraints + indexes)
+
+
+def upgrade(conn):
+    if not _code_is_unique(conn):
+        duplicates = conn.execute(text(
+            "SELECT code FROM registration_code GROUP BY code HAVING COUNT(*) > 1")).scalars().all()
+        if duplicates:
+            raise RuntimeError(f"Duplicate registration codes must be removed first: {', '.join(duplicates)}")
+        create_index(conn, 'uq_registration_code_code', 'registration_code', ['code'], unique=True)
+    create_index(conn, 'ix_registration_code_role_used_created_at', 'registration_code',
+                 ['role', 'is_used', 'created_at'])
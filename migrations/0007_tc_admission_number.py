@@ -0,0 +1,32 @@
+"""TransferCertificate.admission_number, backfilled, so tc_retrieval is one indexed lookup.
+
+Admin-issued TCs carry the admission number in tc_number ('TC-<admission>-<timestamp>');
+student requests ('TC<id>-<timestamp>') take it from the student's username, which
+is what tc_retrieval used to fall back to.
+"""
+from sqlalchemy import text
+
+from migrations import add_column, create_index
+
+
+def _admission_number(tc_number):
+    # As tc_lookup.admission_number_from_tc_number() parsed it when this migration was written
+    if not tc_number or not tc_number.startswith('TC-') or tc_number.count('-') < 2:
+        return None
+    return tc_number[len('TC-'):].rsplit('-', 1)[0] or None
+
+
+def upgrade(conn):
+    add_column(conn, 'transfer_certificate', 'admission_number', 'VARCHAR(64)')
+    rows = conn.execute(text(
+        'SELECT tc.id, tc.tc_number, u.username FROM transfer_certificate tc '
+        'LEFT JOIN "user" u ON u.id = tc.student_id WHERE tc.admission_number IS NULL')).all()
+    updates = [{'id': tc_id, 'admission_number': _admission_number(tc_number) or username}
+               for tc_id, tc_number, username in rows]
+    updates = [update for update in updates if update['admission_number']]
+    if updates:
+        conn.execute(text('UPDATE transfer_certificate SET admission_number = :admission_number WHERE id = :id'),
+                     updates)
+        print(f"Backfilled admission_number on {len(updates)} transfer certificates")
+    create_index(conn, 'ix_tc_admission_status_created_at', 'transfer_certificate',
+                 ['admission_number', 'status', 'created_at'])
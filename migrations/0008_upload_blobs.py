@@ -0,0 +1,17 @@
+"""The content-addressed upload store's blob table (see uploads.py)."""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, DateTime
+
+# As UploadBlob stood at this migration
+upload_blob = Table(
+    'upload_blob', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('sha256', String(64), unique=True, nullable=False),
+    Column('url', String(255), nullable=False),
+    Column('size', BigInteger, nullable=False),
+    Column('ref_count', Integer, nullable=False),
+    Column('created_at', DateTime),
+)
+
+
+def upgrade(conn):
+    upload_blob.create(conn, checkfirst=True)
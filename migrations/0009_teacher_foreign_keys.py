@@ -0,0 +1,13 @@
+"""Point foreign keys left on teacher_legacy back at user.
+
+On SQLite, 0004 as first released renamed teacher to teacher_legacy after moving the
+teachers, and SQLite rewrote user.teacher_id, assignment.teacher_id and
+attendance.marked_by to reference teacher_legacy, whose ids no longer match. Databases
+migrated since then already point them at user.
+"""
+from migrations import repoint_foreign_keys, check_no_foreign_keys_to
+
+
+def upgrade(conn):
+    repoint_foreign_keys(conn, ['teacher', 'teacher_legacy'], 'user')
+    check_no_foreign_keys_to(conn, ['teacher', 'teacher_legacy'])
@@ -0,0 +1,91 @@
+"""Numbered schema migrations, applied in order by `python migrate.py`.
+
+Each module is named NNNN_description.py and defines `upgrade(conn)`, which gets a
+SQLAlchemy connection inside a transaction. Define the tables a migration creates
+in the migration itself, as they stand at that point, never from models.py, so the
+history replays the same way later. Migrations must still be safe to run against a
+database that `db.create_all()` already built (CREATE_TABLES=1), so use the helpers
+below rather than bare ALTER/CREATE statements.
+"""
+import re
+
+from sqlalchemy import inspect, text
+
+
+def table_names(conn):
+    return inspect(conn).get_table_names()
+
+
+def column_names(conn, table):
+    return [column['name'] for column in inspect(conn).get_columns(table)]
+
+
+def add_column(conn, table, name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if table not in table_names(conn) or name in column_names(conn, table):
+        return False
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(name)} {ddl}"))
+    print(f"Added column {table}.{name}")
+    return True
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """CREATE INDEX IF NOT EXISTS, quoting reserved names such as "user" and "order"."""
+    quote = conn.dialect.identifier_preparer.quote
+    column_list = ', '.join(quote(column) for column in columns)
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {quote(name)} "
+                      f"ON {quote(table)} ({column_list})"))
+
+
+def foreign_keys_to(conn, referred_tables):
+    """[(table, constraint name, column)] of every foreign key pointing at one of `referred_tables`."""
+    inspector = inspect(conn)
+    return [(table, fk['name'], fk['constrained_columns'][0])
+            for table in inspector.get_table_names()
+            for fk in inspector.get_foreign_keys(table)
+            if fk['referred_table'] in referred_tables]
+
+
+def repoint_foreign_keys(conn, old_tables, new_table):
+    """Make every foreign key that references one of `old_tables` reference `new_table` instead.
+
+    PostgreSQL constraints are dropped and added again. SQLite cannot alter a foreign key,
+    so each affected table is rebuilt from its own CREATE TABLE statement with the
+    REFERENCES clause rewritten, and its rows and indexes copied over.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    found = foreign_keys_to(conn, old_tables)
+    if conn.dialect.name != 'sqlite':
+        for table, name, column in found:
+            conn.execute(text(f"ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}"))
+            conn.execute(text(f"ALTER TABLE {quote(table)} ADD FOREIGN KEY ({quote(column)}) "
+                              f"REFERENCES {quote(new_table)} (id)"))
+        return
+
+    references = re.compile(r'REFERENCES\s+["`\[]?(?:%s)["`\]]?\s*\(' % '|'.join(map(re.escape, old_tables)),
+                            re.IGNORECASE)
+    for table in sorted({table for table, _, _ in found}):
+        create_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {'name': table}).scalar()
+        index_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name "
+                                      "AND sql IS NOT NULL"), {'name': table}).scalars().all()
+        rebuilt = f"{table}__rebuild"
+        create_sql = references.sub(f'REFERENCES {quote(new_table)} (', create_sql)
+        create_sql = re.sub(r'^\s*CREATE TABLE\s+("[^"]+"|`[^`]+`|\[[^\]]+\]|\S+)', f'CREATE TABLE {quote(rebuilt)}',
+                            create_sql, count=1, flags=re.IGNORECASE)
+        conn.execute(text(create_sql))
+        conn.execute(text(f"INSERT INTO {quote(rebuilt)} SELECT * FROM {quote(table)}"))
+        conn.execute(text(f"DROP TABLE {quote(table)}"))
+        conn.execute(text(f"ALTER TABLE {quote(rebuilt)} RENAME TO {quote(table)}"))
+        for sql in index_sql:
+            conn.execute(text(sql))
+        print(f"Rebuilt {table} with its foreign keys pointing at {new_table}")
+
+
+def check_no_foreign_keys_to(conn, referred_tables):
+    """Fail the migration if any foreign key still points at one of `referred_tables`."""
+    left = foreign_keys_to(conn, referred_tables)
+    if left:
+        raise RuntimeError("Foreign keys still reference " + ', '.join(referred_tables) + ": "
+                           + ', '.join(f"{table}.{column}" for table, _, column in left))
@@ -1,7 +1,7 @@
 from datetime import datetime
 from app import db, login_manager
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+import passwords
 
 
 # The user_loader function is now implemented in app.py
@@ -14,8 +14,11 @@ class RegistrationCode(db.Model):
     role = db.Column(db.String(20), nullable=False)  # student, teacher
     is_used = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    used_by = db.Column(db.Integer)  # Generic ID field without foreign key constraint
-    # This will be either a user.id or teacher.id depending on the role
+    used_by = db.Column(db.Integer)  # user.id of the account registered with this code
+
+    __table_args__ = (
+        db.Index('ix_registration_code_role_used_created_at', 'role', 'is_used', 'created_at'),
+    )
 
 
 class User(UserMixin, db.Model):
@@ -23,7 +26,8 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
-    role = db.Column(db.String(20), nullable=False)  # admin, student
+    role = db.Column(db.String(20), nullable=False)  # admin, student, teacher
+    account_type = db.Column(db.String(20), nullable=False, default='user')  # user, teacher (see Teacher)
     first_name = db.Column(db.String(64))
     last_name = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -37,13 +41,26 @@ class User(UserMixin, db.Model):
                                   foreign_keys='Attendance.student_id')
 
     # Teacher relationship
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_user_role_class_name', 'role', 'class_name'),
+        db.Index('ix_user_teacher_id', 'teacher_id'),
+    )
+    __mapper_args__ = {'polymorphic_on': account_type, 'polymorphic_identity': 'user'}
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.check_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
+
+    def get_id(self):
+        # Typed so the session records which kind of account it belongs to (see identity.py)
+        return f"user:{self.id}"
 
 
 class Announcement(db.Model):
@@ -54,6 +71,12 @@ class Announcement(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     file_url = db.Column(db.String(255))
 
+    author = db.relationship('User', backref='announcements', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_announcement_created_at_id', 'created_at', 'id'),
+    )
+
 
 class Assignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -61,7 +84,7 @@ class Assignment(db.Model):
     description = db.Column(db.Text)
     due_date = db.Column(db.DateTime)
     file_url = db.Column(db.String(255))
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'))
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     class_name = db.Column(db.String(20))  # Added field for class
     subject = db.Column(db.String(50))     # Added field for subject
@@ -71,31 +94,59 @@ class Assignment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Per-student rows for class assignments stored once (ASSIGNMENT_STORAGE = 'normalized');
+    # such assignments have no student_id of their own
+    submissions = db.relationship('AssignmentSubmission', backref='assignment', lazy=True,
+                                  cascade='all, delete-orphan')
 
-class Teacher(UserMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_assignment_student_due_date', 'student_id', 'due_date'),
+        db.Index('ix_assignment_teacher_created_at', 'teacher_id', 'created_at'),
+        db.Index('ix_assignment_class_due_date', 'class_name', 'due_date'),
+    )
+
+
+class AssignmentSubmission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(64), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256))
-    first_name = db.Column(db.String(64))
-    last_name = db.Column(db.String(64))
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, submitted, graded
+    grade = db.Column(db.String(5))
+    feedback = db.Column(db.Text)
+    file_url = db.Column(db.String(255))
+    submitted_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    registration_code_used = db.Column(db.String(20))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('assignment_id', 'student_id', name='uq_submission_assignment_student'),
+        db.Index('ix_assignment_submission_student_id', 'student_id'),
+    )
+
+
+class Teacher(User):
+    """Teachers share the user table (single-table inheritance), so usernames and emails are
+    unique across every account and login is one lookup. User.query returns teachers too;
+    filter on User.account_type == 'user' for students and admins only."""
     subject = db.Column(db.String(100))
     qualification = db.Column(db.String(100))
-    role = db.Column(db.String(20), default='teacher')
 
     # Relationships
-    students = db.relationship('User', backref='assigned_teacher', lazy=True,
-                               foreign_keys='User.teacher_id')
-    assignments_given = db.relationship('Assignment', backref='teacher', lazy=True)
-    attendances_marked = db.relationship('Attendance', backref='marked_by_teacher', lazy=True)
+    students = db.relationship('User', backref=db.backref('assigned_teacher', remote_side='User.id'),
+                               lazy=True, foreign_keys='User.teacher_id')
+    assignments_given = db.relationship('Assignment', backref='teacher', lazy=True,
+                                        foreign_keys='Assignment.teacher_id')
+    attendances_marked = db.relationship('Attendance', backref='marked_by_teacher', lazy=True,
+                                         foreign_keys='Attendance.marked_by')
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    __mapper_args__ = {'polymorphic_identity': 'teacher'}
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+    def __init__(self, **kwargs):
+        kwargs.setdefault('role', 'teacher')
+        super().__init__(**kwargs)
+
+    def get_id(self):
+        return f"teacher:{self.id}"
 
 
 class StudentProgress(db.Model):
@@ -113,21 +164,50 @@ class TransferCertificate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     tc_number = db.Column(db.String(50), unique=True)
+    admission_number = db.Column(db.String(64))  # The student's username; what tc_retrieval looks TCs up by
     issue_date = db.Column(db.DateTime, default=datetime.utcnow)
     reason = db.Column(db.Text)
     file_url = db.Column(db.String(255))
     status = db.Column(db.String(20), default='pending')  # pending, approved, issued
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    student = db.relationship('User', backref=db.backref('transfer_certificates', lazy=True), lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_tc_student_status_created_at', 'student_id', 'status', 'created_at'),
+        db.Index('ix_tc_status_created_at', 'status', 'created_at'),
+        db.Index('ix_tc_admission_status_created_at', 'admission_number', 'status', 'created_at'),
+    )
+
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='present')  # present, absent, late
-    marked_by = db.Column(db.Integer, db.ForeignKey('teacher.id'))
+    marked_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # One mark per student per day; attendance writes upsert on this key
+        db.Index('uq_attendance_student_date', 'student_id', 'date', unique=True),
+    )
+
+
+class AttendanceRollup(db.Model):
+    """Monthly attendance totals per student, kept in step with Attendance by attendance.record_attendance."""
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    days = db.Column(db.Integer, nullable=False, default=0)  # Days marked: present + late + absent
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'month', name='uq_attendance_rollup_student_month'),
+    )
+
 
 class Banner(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -137,9 +217,16 @@ class Banner(db.Model):
     link_url = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
     order = db.Column(db.Integer, default=0)
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.JSON)  # [{url, width, height, format}] generated at upload time
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_banner_is_active_order', 'is_active', 'order'),
+    )
+
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -163,9 +250,17 @@ class Media(db.Model):
     is_featured = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     video_platform = db.Column(db.String(50))  # youtube, facebook, etc.
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.JSON)  # [{url, width, height, format}] of the photo or video thumbnail
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_media_type_active_category_created_at', 'media_type', 'is_active', 'gallery_category', 'created_at'),
+        db.Index('ix_media_type_active_created_at', 'media_type', 'is_active', 'created_at'),
+    )
+
 
 class Content(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -185,9 +280,16 @@ class PopupBanner(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     start_date = db.Column(db.DateTime)
     end_date = db.Column(db.DateTime)
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.JSON)  # [{url, width, height, format}] generated at upload time
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_popup_banner_is_active_created_at', 'is_active', 'created_at'),
+    )
+
 
 class GalleryCategory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -204,8 +306,16 @@ class GalleryItem(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('gallery_category.id'))
     is_featured = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.JSON)  # [{url, width, height, format}] generated at upload time
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_gallery_item_category_active_created_at', 'category_id', 'is_active', 'created_at'),
+        db.Index('ix_gallery_item_active_created_at', 'is_active', 'created_at'),
+    )
+
 
 class FeeStructure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -221,6 +331,11 @@ class FeeStructure(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_fee_structure_year_active_class_type', 'academic_year', 'is_active', 'class_name', 'fee_type'),
+        db.Index('ix_fee_structure_active_year', 'is_active', 'academic_year'),
+    )
+
 
 class PublicDisclosure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -233,6 +348,10 @@ class PublicDisclosure(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_public_disclosure_category_active_order', 'category', 'is_active', 'display_order'),
+    )
+
 
 class ContactMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -244,4 +363,33 @@ class ContactMessage(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     response = db.Column(db.Text)
     responded_at = db.Column(db.DateTime)
-    responded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
\ No newline at end of file
+    responded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # image_variants, video_thumbnail, inspect_upload
+    payload = db.Column(db.JSON, default=dict)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.JSON)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+
+class UploadBlob(db.Model):
+    """One stored upload file, shared by every row whose URL points at it (see uploads.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    url = db.Column(db.String(255), nullable=False)  # /uploads/blobs/<first two hex digits>/<sha256><ext>
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # URL columns referencing it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,114 @@
+import json
+import base64
+import binascii
+from datetime import datetime, date
+
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query."""
+
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """Serialize the sort key of the last row on a page into an opaque URL-safe token."""
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            encoded.append({'dt': value.isoformat()})
+        elif isinstance(value, date):
+            encoded.append({'d': value.isoformat()})
+        else:
+            encoded.append(value)
+    raw = json.dumps(encoded, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Returns None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            return None
+
+        decoded = []
+        for value in values:
+            if isinstance(value, dict) and 'dt' in value:
+                decoded.append(datetime.fromisoformat(value['dt']))
+            elif isinstance(value, dict) and 'd' in value:
+                decoded.append(date.fromisoformat(value['d']))
+            else:
+                decoded.append(value)
+        return decoded
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def _cursor_fits(order_by, values):
+    """True if `values` has one value of the right type for each sort column.
+
+    Cursors come from the query string, so a hand-made one could otherwise put, say, a
+    list where the database expects a timestamp and fail the query.
+    """
+    if len(values) != len(order_by):
+        return False
+    for (column, _), value in zip(order_by, values):
+        try:
+            expected = column.type.python_type
+        except NotImplementedError:
+            return False
+        if expected is date:
+            # A datetime is also a date; a Date column must get a plain date
+            if type(value) is not date:
+                return False
+        elif expected is int:
+            if type(value) is not int:
+                return False
+        elif not isinstance(value, expected):
+            return False
+    return True
+
+
+def keyset_paginate(query, order_by, key, cursor=None, per_page=20):
+    """Return the page of `query` that follows `cursor`.
+
+    `order_by` is a list of (column, descending) pairs that together form a unique sort
+    key, and `key` extracts the matching values from a row. Rows are seeked with a
+    WHERE clause on the sort key instead of OFFSET, so every page costs the same no
+    matter how deep into the result set it is.
+    """
+    values = decode_cursor(cursor)
+    if values is not None and _cursor_fits(order_by, values):
+        clauses = []
+        for i, (column, descending) in enumerate(order_by):
+            equal_prefix = [order_by[j][0] == values[j] for j in range(i)]
+            step = column < values[i] if descending else column > values[i]
+            clauses.append(and_(*equal_prefix, step))
+        query = query.filter(or_(*clauses))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order_by])
+    rows = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return KeysetPage(rows, next_cursor, per_page)
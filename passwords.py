@@ -0,0 +1,42 @@
+"""Password hashing with a configurable algorithm and cost.
+
+PASSWORD_HASH_METHOD takes any werkzeug method string, e.g. "scrypt:32768:8:1"
+(n, r, p) or "pbkdf2:sha256:600000" (iterations). Hashes made with other settings
+keep working and are upgraded the next time their owner logs in. Use
+`python bench_login.py` to see what each setting costs per gunicorn worker.
+"""
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+def hash_method():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD
+    return DEFAULT_METHOD
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or hash_method())
+
+
+def check_password(password_hash, password):
+    if not password_hash:
+        return False
+    return check_password_hash(password_hash, password)
+
+
+@lru_cache(maxsize=32)
+def _canonical_method(method):
+    # werkzeug fills in defaults ("pbkdf2" -> "pbkdf2:sha256:1000000"); compare what it would store
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash, method=None):
+    """True if `password_hash` was made with different parameters than the configured ones."""
+    if not password_hash:
+        return False
+    return password_hash.split('$', 1)[0] != _canonical_method(method or hash_method())
@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from functools import wraps
+
+from flask import request, current_app
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Fixed-window request counters per key, kept in process (so per worker)."""
+
+    def __init__(self, limit, window=60, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._windows = {}  # key -> (window start, count)
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit=None):
+        """Count a request for `key`; returns seconds to wait if it is over the limit, else 0."""
+        limit = limit or self.limit
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._windows.get(key, (now, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            if count >= limit:
+                return max(1, int(self.window - (now - start)))
+            if len(self._windows) >= self.max_keys and key not in self._windows:
+                self._prune(now)
+            self._windows[key] = (start, count + 1)
+            return 0
+
+    def _prune(self, now):
+        expired = [key for key, (start, _) in self._windows.items() if now - start >= self.window]
+        for key in expired or list(self._windows)[:len(self._windows) // 10 or 1]:
+            del self._windows[key]
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+
+
+def rate_limited(limiter, config_key, on_limit, methods=('POST',)):
+    """Limit `methods` requests to a view per client IP to app.config[config_key] per window.
+
+    Over the limit, `on_limit(retry_after)` builds the response; it is sent as a 429
+    with a Retry-After header. A limit of 0 turns the check off. The client IP is
+    remote_addr, which app.py's ProxyFix takes from X-Forwarded-For (PROXY_FIX_X_FOR hops).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limit = current_app.config.get(config_key)
+            if limit and request.method in methods:
+                retry_after = limiter.hit((request.endpoint, request.remote_addr), limit)
+                if retry_after:
+                    logger.info(f"Rate limit hit on {request.endpoint} by {request.remote_addr}")
+                    response = current_app.make_response(on_limit(retry_after))
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
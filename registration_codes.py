@@ -0,0 +1,68 @@
+import secrets
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import RegistrationCode
+
+logger = logging.getLogger(__name__)
+
+# No 0/O or 1/I, so printed codes can be typed back in without guessing
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 8
+MAX_BATCH = 1000
+
+# Rounds of drawing replacements for codes that turned out to be taken
+MAX_ATTEMPTS = 5
+
+
+def new_code(length=CODE_LENGTH):
+    return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+
+
+def generate_codes(role, count, length=CODE_LENGTH):
+    """Create `count` unused registration codes for `role` and return them.
+
+    Codes come from the secrets CSPRNG. Each round draws the codes still missing,
+    drops the ones already in the table with a single IN query, and inserts the rest
+    in one executemany inside a savepoint; if a concurrent insert wins the race the
+    unique index rejects the round and it is drawn again. The caller commits.
+    """
+    if not 1 <= count <= MAX_BATCH:
+        raise ValueError(f"Can generate between 1 and {MAX_BATCH} codes at a time")
+
+    codes = []
+    for _ in range(MAX_ATTEMPTS):
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            candidates.add(new_code(length))
+        taken = set(db.session.scalars(select(RegistrationCode.code).where(RegistrationCode.code.in_(candidates))))
+        fresh = sorted(candidates - taken)
+        if taken:
+            logger.info(f"Registration codes: {len(taken)} collision(s), drawing replacements")
+
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(RegistrationCode), [
+                    {'code': code, 'role': role, 'is_used': False, 'created_at': now} for code in fresh])
+        except IntegrityError:
+            logger.info('Registration codes: lost an insert race, drawing again')
+            continue
+        codes.extend(fresh)
+        if len(codes) == count:
+            return codes
+    raise RuntimeError(f"Could not generate {count} unique registration codes")
+
+
+def codes_query(role=None, used=None):
+    """RegistrationCode query filtered by role ('student'/'teacher') and used state (True/False/None)."""
+    query = RegistrationCode.query
+    if role:
+        query = query.filter(RegistrationCode.role == role)
+    if used is not None:
+        query = query.filter(RegistrationCode.is_used == used)
+    return query
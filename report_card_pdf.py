@@ -0,0 +1,118 @@
+"""Render report cards (and the printable registration-code sheet) to PDF bytes.
+
+A deliberately small PDF writer (text only, built-in Helvetica/Courier fonts) so report
+cards need no extra dependency and the same input always produces the same bytes. This
+module imports nothing from the app, which keeps it cheap to load in the worker
+processes that report_cards.py renders with.
+"""
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+LINE_HEIGHT = 16
+
+
+def _pdf_text(text):
+    # The standard fonts only cover Latin-1; anything else becomes '?'
+    text = str(text if text is not None else '').encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _truncate(text, length):
+    text = str(text or '')
+    return text if len(text) <= length else text[:length - 3] + '...'
+
+
+def _layout(card):
+    """One (x, font, size, text) per line, or a list of them for table rows."""
+    lines = [
+        (MARGIN, 'F2', 18, card['school_name']),
+        (MARGIN, 'F2', 14, f"Report Card - {card['term_label']} {card['academic_year']}"),
+        (MARGIN, 'F1', 11, ''),
+        (MARGIN, 'F1', 11, f"Student: {card['student_name']}"),
+        (MARGIN, 'F1', 11, f"Admission no.: {card['admission_number']}"),
+        (MARGIN, 'F1', 11, f"Class: {card['class_name'] or '-'}"),
+        (MARGIN, 'F1', 11, ''),
+        [(MARGIN, 'F2', 11, 'Subject'), (300, 'F2', 11, 'Grade'), (360, 'F2', 11, 'Remarks')],
+    ]
+    for subject in card['subjects']:
+        lines.append([(MARGIN, 'F1', 11, _truncate(subject['subject'], 40)),
+                      (300, 'F1', 11, subject['grade']),
+                      (360, 'F1', 11, _truncate(subject['remarks'], 36))])
+    if not card['subjects']:
+        lines.append((MARGIN, 'F1', 11, 'No grades recorded for this term.'))
+
+    lines.append((MARGIN, 'F1', 11, ''))
+    attendance = card['attendance']
+    if attendance['days']:
+        lines.append((MARGIN, 'F1', 11,
+                      f"Attendance: {attendance['present'] + attendance['late']} of {attendance['days']} days "
+                      f"({attendance['rate']}%), late {attendance['late']} times"))
+    else:
+        lines.append((MARGIN, 'F1', 11, 'Attendance: no days recorded.'))
+    return lines
+
+
+def _pages(lines):
+    pages, current, y = [], [], PAGE_HEIGHT - MARGIN
+    for line in lines:
+        cells = line if isinstance(line, list) else [line]
+        if y < MARGIN:
+            pages.append(current)
+            current, y = [], PAGE_HEIGHT - MARGIN
+        size = max(cell[2] for cell in cells)
+        y -= size + (LINE_HEIGHT - 11)
+        for x, font, font_size, text in cells:
+            if text:
+                current.append(f"BT /{font} {font_size} Tf {x} {y} Td ({_pdf_text(text)}) Tj ET")
+    pages.append(current)
+    return pages
+
+
+def render_report_card(card):
+    """PDF bytes for one card dict, as built by report_cards.report_card_data()."""
+    return _document(_pages(_layout(card)))
+
+
+def render_code_sheet(codes, title, subtitle=''):
+    """PDF bytes of registration codes laid out three to a row, for printing and cutting up."""
+    lines = [(MARGIN, 'F2', 16, title), (MARGIN, 'F1', 10, subtitle), (MARGIN, 'F1', 11, '')]
+    for start in range(0, len(codes), 3):
+        lines.append([(MARGIN + 170 * column, 'F3', 14, code)
+                      for column, code in enumerate(codes[start:start + 3])])
+        lines.append((MARGIN, 'F1', 11, ''))
+    return _document(_pages(lines))
+
+
+def _document(pages):
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    fonts = "/F1 3 0 R /F2 4 0 R"
+    if any('/F3 ' in command for commands in pages for command in commands):
+        # Only added when used, so report cards stay byte-for-byte the same
+        objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold /Encoding /WinAnsiEncoding >>")
+        fonts += f" /F3 {len(objects)} 0 R"
+    page_numbers = []
+    for commands in pages:
+        stream = '\n'.join(commands).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                        "/Resources << /Font << %s >> >> /Contents %d 0 R >>"
+                        % (PAGE_WIDTH, PAGE_HEIGHT, fonts, len(objects))).encode())
+        page_numbers.append(len(objects))
+    kids = ' '.join(f"{number} 0 R" for number in page_numbers)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_numbers)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
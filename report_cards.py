@@ -0,0 +1,267 @@
+"""Batch report cards from StudentProgress.
+
+    python report_cards.py 2024-2025 first_term                    # whole school
+    python report_cards.py 2024-2025 first_term --class 5A -o 5A.zip
+
+The dashboard queues the same work as a 'report_cards' job (see jobs.py), so
+rendering runs in worker.py rather than in a web request, and the archive is kept in
+upload storage (see storage.py) where any instance can serve it. Grades for the term
+and the year's attendance (from the monthly rollups) are loaded for every student in
+a few queries, rendered to PDF in a process pool, and written into a zip archive as
+they finish. Each card is cached under instance/report_cards/ by a hash of its input,
+so re-running after a few grades changed only re-renders the affected students.
+"""
+import os
+import re
+import sys
+import json
+import glob
+import uuid
+import hashlib
+import zipfile
+import tempfile
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from sqlalchemy import select, func
+from werkzeug.utils import secure_filename
+
+from app import app, db
+from jobs import job
+from models import User, StudentProgress, AttendanceRollup
+from storage import get_storage
+from report_card_pdf import render_report_card
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout in report_card_pdf.py changes, so cached cards are re-rendered
+CARD_VERSION = 1
+
+TERM_LABELS = {'first_term': 'First Term', 'second_term': 'Second Term', 'third_term': 'Third Term'}
+
+# Rendering in a pool only pays off once there are a few cards to spread around
+MIN_CARDS_FOR_POOL = 8
+
+ACADEMIC_YEAR_PATTERN = re.compile(r'^(\d{4})-(\d{4})$')
+
+
+def parse_academic_year(academic_year):
+    """The first calendar year of '2024-2025'. Raises ValueError for anything else."""
+    match = ACADEMIC_YEAR_PATTERN.match(academic_year or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise ValueError(f"Academic year must look like 2024-2025, not '{academic_year}'")
+    return int(match.group(1))
+
+
+def academic_year_months(academic_year):
+    """('2024-04', '2025-03') for '2024-2025' with the default April start."""
+    first_year = parse_academic_year(academic_year)
+    start_month = current_app.config.get('ACADEMIC_YEAR_START_MONTH', 4)
+    end_year, end_month = (first_year, 12) if start_month == 1 else (first_year + 1, start_month - 1)
+    return f"{first_year}-{start_month:02d}", f"{end_year}-{end_month:02d}"
+
+
+def report_card_data(academic_year, term, class_name=None):
+    """One plain dict per student, everything the PDF needs. Three queries whatever the class size."""
+    students = User.query.filter_by(role='student')
+    if class_name:
+        students = students.filter_by(class_name=class_name)
+    students = students.order_by(User.class_name, User.last_name, User.first_name, User.id).all()
+    student_ids = [student.id for student in students]
+
+    subjects = {}
+    for row in db.session.execute(
+        select(StudentProgress.student_id, StudentProgress.subject, StudentProgress.grade, StudentProgress.remarks)
+        .where(StudentProgress.academic_year == academic_year, StudentProgress.term == term,
+               StudentProgress.student_id.in_(student_ids))
+        .order_by(StudentProgress.student_id, StudentProgress.subject, StudentProgress.id)
+    ):
+        subjects.setdefault(row.student_id, []).append(
+            {'subject': row.subject, 'grade': row.grade, 'remarks': row.remarks})
+
+    first_month, last_month = academic_year_months(academic_year)
+    attendance = {row.student_id: row for row in db.session.execute(
+        select(AttendanceRollup.student_id, func.sum(AttendanceRollup.present).label('present'),
+               func.sum(AttendanceRollup.late).label('late'), func.sum(AttendanceRollup.absent).label('absent'),
+               func.sum(AttendanceRollup.days).label('days'))
+        .where(AttendanceRollup.student_id.in_(student_ids),
+               AttendanceRollup.month >= first_month, AttendanceRollup.month <= last_month)
+        .group_by(AttendanceRollup.student_id)
+    )}
+
+    school_name = current_app.config.get('SCHOOL_NAME', 'SchoolHub')
+    cards = []
+    for student in students:
+        totals = attendance.get(student.id)
+        days = totals.days if totals else 0
+        present, late = (totals.present, totals.late) if totals else (0, 0)
+        cards.append({
+            'student_id': student.id,
+            'student_name': ' '.join(filter(None, [student.first_name, student.last_name])) or student.username,
+            'admission_number': student.username,
+            'class_name': student.class_name,
+            'academic_year': academic_year,
+            'term': term,
+            'term_label': TERM_LABELS.get(term, term),
+            'school_name': school_name,
+            'subjects': subjects.get(student.id, []),
+            'attendance': {'days': days, 'present': present, 'late': late,
+                           'absent': totals.absent if totals else 0,
+                           'rate': round(100.0 * (present + late) / days, 1) if days else None},
+        })
+    return cards
+
+
+def card_digest(card):
+    payload = json.dumps([CARD_VERSION, card], sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def card_filename(card):
+    name = secure_filename(f"{card['student_name']}_{card['student_id']}.pdf")
+    return f"{secure_filename(card['class_name'] or 'no_class')}/{name}"
+
+
+def _cache_dir(card):
+    return os.path.join(current_app.instance_path, 'report_cards', secure_filename(card['academic_year']),
+                        secure_filename(card['term']))
+
+
+def _cache_path(card, digest):
+    return os.path.join(_cache_dir(card), f"{card['student_id']}-{digest}.pdf")
+
+
+def _store(card, digest, pdf):
+    os.makedirs(_cache_dir(card), exist_ok=True)
+    # Drop this student's cards for older inputs
+    for stale in glob.glob(os.path.join(_cache_dir(card), f"{card['student_id']}-*.pdf")):
+        os.remove(stale)
+    path = _cache_path(card, digest)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(pdf)
+    os.replace(path + '.tmp', path)
+
+
+def generate_report_cards(cards, workers=None):
+    """Yield (archive filename, PDF bytes) for each card, rendering only cards whose input changed."""
+    pending = []
+    for card in cards:
+        digest = card_digest(card)
+        path = _cache_path(card, digest)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                yield card_filename(card), f.read()
+        else:
+            pending.append((card, digest))
+    logger.info(f"Report cards: {len(cards) - len(pending)} cached, {len(pending)} to render")
+
+    if len(pending) < MIN_CARDS_FOR_POOL:
+        rendered = (render_report_card(card) for card, _ in pending)
+        executor = None
+    else:
+        workers = workers or current_app.config.get('REPORT_CARD_WORKERS') or os.cpu_count()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        rendered = executor.map(render_report_card, [card for card, _ in pending], chunksize=16)
+    try:
+        for (card, digest), pdf in zip(pending, rendered):
+            _store(card, digest, pdf)
+            yield card_filename(card), pdf
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+class _ZipSink:
+    """Write-only file object that hands back whatever the zip writer produced so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files):
+    """Yield a zip archive of (filename, bytes) pairs chunk by chunk, without buffering it whole."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename, data in files:
+            archive.writestr(filename, data)
+            yield sink.take()
+    yield sink.take()
+
+
+def archive_filename(academic_year, term, class_name=None):
+    return secure_filename(f"report_cards_{class_name or 'all'}_{academic_year}_{term}.zip")
+
+
+def write_archive(cards, path, workers=None):
+    """Write the zip of `cards` to `path`, replacing it only once it is complete."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            for chunk in stream_zip(generate_report_cards(cards, workers)):
+                f.write(chunk)
+        os.replace(path + '.tmp', path)
+    finally:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+
+
+@job('report_cards')
+def build_report_cards(academic_year, term, class_name=None, requested_by=None):
+    """Job handler: render a class's (or the whole school's) cards into an archive in upload storage.
+
+    Each run gets its own key, so two jobs for the same class never share a file.
+    """
+    cards = report_card_data(academic_year, term, class_name)
+    key = f"report_cards/{uuid.uuid4().hex}/{archive_filename(academic_year, term, class_name)}"
+    fd, path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        write_archive(cards, path)
+        get_storage().put_file(key, path, content_type='application/zip')
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {'archive': key, 'cards': len(cards)}
+
+
+def _academic_year_arg(value):
+    try:
+        parse_academic_year(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate report cards as a zip of PDFs.')
+    parser.add_argument('academic_year', type=_academic_year_arg, help='e.g. 2024-2025')
+    parser.add_argument('term', choices=sorted(TERM_LABELS))
+    parser.add_argument('--class', dest='class_name', help='only this class (default: whole school)')
+    parser.add_argument('--workers', type=int, help='render processes (default: all cores)')
+    parser.add_argument('-o', '--output', help='zip file to write (default: report_cards_<year>_<term>.zip)')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        cards = report_card_data(args.academic_year, args.term, args.class_name)
+        output = args.output or f"report_cards_{args.academic_year}_{args.term}.zip"
+        write_archive(cards, output, args.workers)
+    print(f"Wrote {len(cards)} report cards to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Resumable, chunked uploads for files too large to send in one request.
+
+An offset-based protocol in the spirit of tus (https://tus.io):
+
+    POST   /dashboard/uploads/resumable         {"filename": "sports-day.mp4", "size": 734003200}
+           -> 201 {"id": ..., "offset": 0, "chunk_size": ...}
+    PATCH  /dashboard/uploads/resumable/<id>    body: the next chunk of at most chunk_size bytes
+           headers: Upload-Offset: <bytes already sent>, Upload-Checksum: sha256 <base64 digest of the chunk>
+           -> 204 with the new Upload-Offset
+    HEAD   /dashboard/uploads/resumable/<id>    -> Upload-Offset / Upload-Length, to resume after a dropped connection
+    DELETE /dashboard/uploads/resumable/<id>    -> cancel
+
+Chunks are written straight onto the end of a partial file under RESUMABLE_UPLOAD_FOLDER
+and hashed as they arrive. A chunk whose checksum does not match, or whose connection
+drops part way, is cut off again, so the offset on disk only ever covers verified data.
+Once the offset reaches the size, the upload is submitted with the form (MediaForm's
+upload_id) and finish_upload() copies the file into the blob store; the partial file is
+removed once that form's transaction commits.
+
+Partial files live on the local disk of the instance that received them; behind a load
+balancer, route an upload's requests to one instance, or use direct uploads to object
+storage (see storage.py) instead.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import fcntl
+import hashlib
+import logging
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+from uploads import store_stream
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadSessionError(ValueError):
+    """A resumable upload request that cannot be honoured; `status` is the HTTP status to answer with."""
+    status = 400
+
+
+class UploadNotFound(UploadSessionError):
+    status = 404
+
+
+class OffsetMismatch(UploadSessionError):
+    status = 409
+
+    def __init__(self, offset):
+        super().__init__(f'Upload-Offset does not match; the upload is at byte {offset}.')
+        self.offset = offset
+
+
+class ChecksumMismatch(UploadSessionError):
+    status = 460  # As in tus: the chunk was discarded and must be sent again
+
+
+def _paths(upload_id):
+    if not _UPLOAD_ID.match(upload_id or ''):
+        raise UploadNotFound('No such upload.')
+    folder = current_app.config['RESUMABLE_UPLOAD_FOLDER']
+    return os.path.join(folder, f'{upload_id}.json'), os.path.join(folder, f'{upload_id}.part')
+
+
+def create_upload(user_id, filename, size):
+    """Start an upload of `size` bytes and return its state (see get_upload())."""
+    if not isinstance(size, int) or size <= 0:
+        raise UploadSessionError('size must be a positive number of bytes.')
+    if size > current_app.config['RESUMABLE_UPLOAD_MAX_SIZE']:
+        raise UploadSessionError(f"Files may be at most {current_app.config['RESUMABLE_UPLOAD_MAX_SIZE']} bytes.")
+    _, extension = os.path.splitext(secure_filename(filename or ''))
+
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(upload_id)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    open(part_path, 'xb').close()
+    state = {'id': upload_id, 'user_id': user_id, 'filename': filename, 'extension': extension.lower(),
+             'size': size, 'created_at': time.time()}
+    with open(meta_path, 'x') as f:
+        json.dump(state, f)
+    logger.info(f"Started resumable upload {upload_id} of {size} bytes for user {user_id}")
+    return dict(state, offset=0)
+
+
+def get_upload(upload_id, user_id):
+    """{id, filename, extension, size, offset, ...} of one of a user's uploads."""
+    meta_path, part_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            state = json.load(f)
+        offset = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        raise UploadNotFound('No such upload.')
+    if state['user_id'] != user_id:
+        raise UploadNotFound('No such upload.')
+    return dict(state, offset=offset)
+
+
+def _parse_checksum(header):
+    algorithm, _, encoded = (header or '').strip().partition(' ')
+    if algorithm.lower() not in CHECKSUM_ALGORITHMS or not encoded:
+        raise UploadSessionError(f"Upload-Checksum must be '<{'|'.join(CHECKSUM_ALGORITHMS)}> <base64 digest>'.")
+    try:
+        return algorithm.lower(), base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        raise UploadSessionError('Upload-Checksum digest is not valid base64.')
+
+
+def append_chunk(upload_id, user_id, offset, stream, checksum):
+    """Append one chunk read from `stream` at `offset` and return the new offset.
+
+    The chunk is verified against `checksum` (an Upload-Checksum header value); if it does
+    not match, or the client disconnects part way, the partial file is cut back to `offset`.
+    """
+    state = get_upload(upload_id, user_id)
+    if offset is None:
+        raise UploadSessionError('Upload-Offset is required.')
+    algorithm, expected = _parse_checksum(checksum)
+    _, part_path = _paths(upload_id)
+    limit = current_app.config['RESUMABLE_UPLOAD_CHUNK_SIZE']
+
+    with open(part_path, 'r+b', buffering=0) as part:
+        # One writer at a time; a concurrent retry of the same chunk then sees the new offset
+        fcntl.flock(part, fcntl.LOCK_EX)
+        current = os.fstat(part.fileno()).st_size
+        if offset != current:
+            raise OffsetMismatch(current)
+
+        part.seek(offset)
+        digest, written = hashlib.new(algorithm), 0
+        try:
+            while chunk := stream.read(1024 * 1024):
+                written += len(chunk)
+                if written > limit or offset + written > state['size']:
+                    raise UploadSessionError(f'Chunks may be at most {limit} bytes and must not pass the file size.')
+                digest.update(chunk)
+                part.write(chunk)
+            if digest.digest() != expected:
+                raise ChecksumMismatch('Upload-Checksum does not match the chunk; send it again.')
+            os.fsync(part.fileno())
+        except BaseException:
+            # Includes werkzeug's ClientDisconnected when the connection drops mid-chunk
+            part.truncate(offset)
+            raise
+    return offset + written
+
+
+def finish_upload(upload_id, user_id):
+    """Store a complete upload in the blob store and return its URL. The caller commits.
+
+    The partial file is removed only after that commit, so a form that fails to save can
+    be submitted again with the same upload.
+    """
+    state = get_upload(upload_id, user_id)
+    if state['offset'] != state['size']:
+        raise UploadSessionError(f"The upload is incomplete ({state['offset']} of {state['size']} bytes).")
+    meta_path, part_path = _paths(upload_id)
+    with open(part_path, 'rb') as part:
+        url = store_stream(part, state['extension'])
+    db.session.info.setdefault('finished_resumable_uploads', set()).update((meta_path, part_path))
+    logger.info(f"Finished resumable upload {upload_id} as {url}")
+    return url
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_finished(db_session):
+    _remove(*db_session.info.pop('finished_resumable_uploads', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_finished(db_session):
+    db_session.info.pop('finished_resumable_uploads', None)
+
+
+def cancel_upload(upload_id, user_id):
+    get_upload(upload_id, user_id)
+    _remove(*_paths(upload_id))
+
+
+def expire_uploads(max_age):
+    """Delete uploads that have not received a chunk for `max_age` seconds. Returns how many were removed."""
+    folder = current_app.config['RESUMABLE_UPLOAD_FOLDER']
+    if not os.path.isdir(folder):
+        return 0
+    cutoff, removed = time.time() - max_age, 0
+    for name in os.listdir(folder):
+        upload_id, extension = os.path.splitext(name)
+        if extension == '.part' and _UPLOAD_ID.match(upload_id) and os.path.getmtime(os.path.join(folder, name)) < cutoff:
+            _remove(*_paths(upload_id))
+            removed += 1
+            logger.info(f"Expired resumable upload {upload_id}")
+    return removed
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,21 +1,51 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, \
+    Response, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
-import os
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy import case
+from sqlalchemy.orm import joinedload
 from app import db, app
+from cache import cached_page
+from feeds import build_json_feed, build_atom_feed
+from pagination import keyset_paginate
+from image_variants import remove_variants, image_sources
+from storage import get_storage
+from uploads import save_upload, release_upload, send_upload, new_direct_upload, is_direct_upload
+from resumable_uploads import (create_upload, get_upload, append_chunk, finish_upload, cancel_upload,
+                               UploadSessionError, OffsetMismatch)
+from jobs import enqueue
+from upload_tasks import enqueue_media_processing  # also registers the upload job handlers
+from assignments import create_class_assignment, student_submission, class_work, work_for
+from dashboard_summary import dashboard_summary
+from attendance_analytics import student_rates, class_rates, monthly_rates
+from report_cards import parse_academic_year, TERM_LABELS
+from exports import stream_export, export_filename, EXPORTS, FORMATS, MIMETYPES
+from tc_lookup import find_approved_tc, normalize_admission_number
+from rate_limit import RateLimiter, rate_limited
+from registration_codes import generate_codes, codes_query, MAX_BATCH as MAX_CODE_BATCH
+from report_card_pdf import render_code_sheet
+from bulk_import import queue_import, COLUMNS as IMPORT_COLUMNS
+from attendance import record_attendance, parse_compact_payload, class_names, teacher_class_names, class_students
 from models import User, Announcement, Banner, Document, Media, Content, Assignment, Attendance, StudentProgress, \
     TransferCertificate, PopupBanner, GalleryCategory, GalleryItem, FeeStructure, PublicDisclosure, ContactMessage, \
-    RegistrationCode, Teacher
+    RegistrationCode, Teacher, AssignmentSubmission, Job
 from forms import (LoginForm, RegistrationForm, AnnouncementForm, ContactForm,
                    BannerForm, DocumentForm, MediaForm, ContentForm, AssignmentForm, AttendanceForm,
                    StudentProgressForm, SubmitAssignmentForm, TCRequestForm, PopupBannerForm, GalleryCategoryForm,
                    GalleryItemForm, FeeStructureForm, PublicDisclosureForm, ContactResponseForm, RegistrationCodeForm,
-                   PasswordChangeForm, TeacherRegistrationForm)
+                   PasswordChangeForm, TeacherRegistrationForm, BulkImportForm, GradeAssignmentForm)
+import os
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+TC_STATUSES = ('pending', 'approved', 'issued')
+
+# Per-IP limit on the public TC lookup; the requests per minute come from TC_RETRIEVAL_RATE_LIMIT
+tc_retrieval_limiter = RateLimiter(limit=10, window=60)
+
 # Create blueprints with URL prefixes
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 main_bp = Blueprint('main', __name__)  # No prefix for main as it contains root routes
@@ -30,6 +60,26 @@ def register_blueprints(app):
     logger.info("Blueprints registered successfully")
 
 
+@main_bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """413: JSON for the upload APIs; form posts go back to the form with a message."""
+    limit = request.max_content_length
+    message = f'The upload is too large; requests may be at most {limit // (1024 * 1024)} MB.' if limit \
+        else 'The upload is too large.'
+    if request.is_json or request.path.startswith('/dashboard/uploads/') or \
+            request.accept_mimetypes.best == 'application/json':
+        return jsonify(error=message), 413
+    flash(message, 'danger')
+    return redirect(request.referrer or request.url)
+
+
+# Uploaded files, from whichever storage backend is configured; content-hashed names are cached as immutable
+# (see uploads.py)
+@main_bp.route('/static/uploads/<path:filename>')
+def uploaded_file(filename):
+    return send_upload(filename)
+
+
 # Diagnostic route
 @main_bp.route('/ping')
 def ping():
@@ -39,24 +89,14 @@ def ping():
 
 # Main routes
 @main_bp.route('/')
+@cached_page(Announcement, Banner, PopupBanner)
 def home():
     logger.info("Home route accessed")
     try:
         announcements = Announcement.query.order_by(Announcement.created_at.desc()).limit(3).all()
         banners = Banner.query.filter_by(is_active=True).order_by(Banner.order.asc()).all()
 
-        # Debug information
-        all_banners = Banner.query.all()
-        logger.info(f"Total banners in database: {len(all_banners)}")
-        for banner in all_banners:
-            logger.info(
-                f"Banner ID: {banner.id}, Title: {banner.title}, Active: {banner.is_active}, Order: {banner.order}, Image URL: {banner.image_url}")
-            # Check if image file exists
-            import os
-            image_path = os.path.join(app.static_folder, banner.image_url.replace('/uploads/', 'uploads/'))
-            logger.info(f"Checking image path: {image_path}, exists: {os.path.exists(image_path)}")
-
-        logger.info(f"Retrieved {len(announcements)} announcements and {len(banners)} active banners for display")
+        logger.debug(f"Retrieved {len(announcements)} announcements and {len(banners)} active banners for display")
 
         # Check if there's an active popup banner - ONLY FOR HOMEPAGE
         show_popup = False
@@ -79,13 +119,7 @@ def home():
             if date_filtered_popups:
                 show_popup = True
                 popup = date_filtered_popups
-                logger.info(f"Active popup found: {popup.title}")
-                if popup.image_url:
-                    logger.info(f"Popup image URL: {popup.image_url}")
-                    # Check if image file exists
-                    import os
-                    image_path = os.path.join(app.static_folder, popup.image_url.replace('/uploads/', 'uploads/'))
-                    logger.info(f"Checking popup image path: {image_path}, exists: {os.path.exists(image_path)}")
+                logger.debug(f"Active popup found: {popup.title}")
         except Exception as popup_error:
             logger.error(f"Error getting popup banner: {str(popup_error)}")
 
@@ -133,11 +167,40 @@ def contact():
     return render_template('contact.html', form=form)
 
 
+def announcements_page(cursor=None):
+    """Return one keyset page of announcements, newest first, with authors loaded in the same query."""
+    query = Announcement.query.options(joinedload(Announcement.author))
+    return keyset_paginate(query,
+                           [(Announcement.created_at, True), (Announcement.id, True)],
+                           key=lambda a: (a.created_at, a.id),
+                           cursor=cursor,
+                           per_page=current_app.config['NEWS_PER_PAGE'])
+
+
 @main_bp.route('/news')
+@cached_page(Announcement, User)
 def news():
     logger.info("News route accessed")
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
-    return render_template('news.html', announcements=announcements, User=User)
+    page = announcements_page(request.args.get('cursor'))
+    return render_template('news.html', announcements=page.items, next_cursor=page.next_cursor)
+
+
+@main_bp.route('/news.json')
+@cached_page(Announcement, User)
+def news_json():
+    page = announcements_page(request.args.get('cursor'))
+    response = jsonify(build_json_feed(page))
+    response.mimetype = 'application/feed+json'
+    # No Last-Modified: an edited or deleted announcement would not move it. The content ETag
+    # from cached_page covers both.
+    return response
+
+
+@main_bp.route('/news.atom')
+@cached_page(Announcement, User)
+def news_atom():
+    page = announcements_page(request.args.get('cursor'))
+    return current_app.response_class(build_atom_feed(page), mimetype='application/atom+xml')
 
 
 # Dashboard routes
@@ -145,31 +208,16 @@ def news():
 @login_required
 def index():
     logger.info(f"Dashboard route accessed by user: {current_user.username}")
-    from datetime import datetime
-
-    # Log important debugging information
-    logger.info(f"Current user type: {type(current_user).__name__}")
-    if hasattr(current_user, 'role'):
-        logger.info(f"User role: {current_user.role}")
+    summary = dashboard_summary(current_user)
 
     # Check if it's a Teacher instance first
     if isinstance(current_user, Teacher):
-        logger.info(f"Rendering teacher dashboard for: {current_user.username}")
-        return render_template('dashboard/teacher.html', User=User, Assignment=Assignment,
-                               Attendance=Attendance, StudentProgress=StudentProgress,
-                               Teacher=Teacher, datetime=datetime)
+        return render_template('dashboard/teacher.html', summary=summary)
     # Then check regular user roles
-    elif hasattr(current_user, 'role') and current_user.role == 'admin':
-        from models import GalleryItem, PopupBanner
-        logger.info(f"Rendering admin dashboard for: {current_user.username}")
-        return render_template('dashboard/admin.html', User=User, Document=Document, Media=Media, Banner=Banner,
-                               Announcement=Announcement, TransferCertificate=TransferCertificate, Content=Content,
-                               PublicDisclosure=PublicDisclosure, GalleryItem=GalleryItem, PopupBanner=PopupBanner)
+    elif current_user.role == 'admin':
+        return render_template('dashboard/admin.html', summary=summary)
     else:
-        logger.info(f"Rendering student dashboard for: {current_user.username}")
-        return render_template('dashboard/student.html', StudentProgress=StudentProgress,
-                               Assignment=Assignment, TransferCertificate=TransferCertificate,
-                               User=User, Announcement=Announcement)
+        return render_template('dashboard/student.html', summary=summary)
 
 
 @dashboard_bp.route('/announcements/new', methods=['GET', 'POST'])
@@ -184,12 +232,7 @@ def new_announcement():
     if form.validate_on_submit():
         file_url = None
         if form.attachment.data:
-            attachment = form.attachment.data
-            filename = secure_filename(attachment.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'announcements', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            attachment.save(file_path)
-            file_url = f'/uploads/announcements/{filename}'
+            file_url = save_upload(form.attachment.data)
 
         announcement = Announcement(
             title=form.title.data,
@@ -199,6 +242,8 @@ def new_announcement():
         )
         db.session.add(announcement)
         db.session.commit()
+        if file_url:
+            enqueue('inspect_upload', url=file_url)
         flash('Announcement created successfully!', 'success')
         return redirect(url_for('main.news'))
     return render_template('dashboard/new_announcement.html', form=form)
@@ -221,14 +266,12 @@ def edit_announcement(id):
 
         # Handle attachment if provided
         if 'attachment' in request.files and request.files['attachment'].filename:
-            attachment = request.files['attachment']
-            filename = secure_filename(attachment.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'announcements', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            attachment.save(file_path)
-            announcement.file_url = f'/uploads/announcements/{filename}'
+            release_upload(announcement.file_url)
+            announcement.file_url = save_upload(request.files['attachment'])
 
         db.session.commit()
+        if 'attachment' in request.files and request.files['attachment'].filename:
+            enqueue('inspect_upload', url=announcement.file_url)
         flash('Announcement updated successfully!', 'success')
         return redirect(url_for('dashboard.manage_announcements'))
 
@@ -244,8 +287,9 @@ def manage_announcements():
         flash('You do not have permission to manage announcements.', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
-    return render_template('dashboard/manage_announcements.html', announcements=announcements)
+    page = announcements_page(request.args.get('cursor'))
+    return render_template('dashboard/manage_announcements.html', announcements=page.items,
+                           next_cursor=page.next_cursor)
 
 
 @dashboard_bp.route('/announcements/<int:id>/delete', methods=['POST'])
@@ -259,13 +303,8 @@ def delete_announcement(id):
     announcement = Announcement.query.get_or_404(id)
 
     try:
-        # Delete the attachment file if it exists
-        if announcement.file_url:
-            file_path = os.path.join(current_app.static_folder, announcement.file_url.lstrip('/'))
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Deleted announcement attachment: {file_path}")
-
+        # The attachment is deleted after commit unless another row still uses it
+        release_upload(announcement.file_url)
         db.session.delete(announcement)
         db.session.commit()
         flash('Announcement deleted successfully!', 'success')
@@ -289,18 +328,8 @@ def new_banner():
     if form.validate_on_submit():
         try:
             # Handle file upload
-            image = form.image.data
-            timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-            filename = secure_filename(f"{timestamp}_{image.filename}")
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'banners', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            image.save(file_path)
-
-            image_url = f'/uploads/banners/{filename}'
-
-            # Debug log
-            logger.info(f"Saved banner image to: {file_path}")
-            logger.info(f"Image URL set to: {image_url}")
+            image_url = save_upload(form.image.data)
+            logger.info(f"Saved banner image to: {image_url}")
 
             banner = Banner(
                 title=form.title.data,
@@ -312,6 +341,7 @@ def new_banner():
             )
             db.session.add(banner)
             db.session.commit()
+            enqueue('image_variants', model='Banner', id=banner.id, field='image_url')
             flash('Banner added successfully!', 'success')
             return redirect(url_for('dashboard.manage_banners'))
         except Exception as e:
@@ -332,21 +362,18 @@ def new_document():
     if form.validate_on_submit():
         try:
             # Handle file upload
-            doc_file = form.document.data
-            filename = secure_filename(doc_file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'documents', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            doc_file.save(file_path)
+            file_url = save_upload(form.document.data)
 
             document = Document(
                 title=form.title.data,
                 description=form.description.data,
                 document_type=form.document_type.data,
-                file_url=f'/uploads/documents/{filename}',
+                file_url=file_url,
                 is_public=form.is_public.data
             )
             db.session.add(document)
             db.session.commit()
+            enqueue('inspect_upload', url=document.file_url)
             flash('Document uploaded successfully!', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
@@ -356,6 +383,78 @@ def new_document():
     return render_template('dashboard/document_form.html', form=form, title='Upload Document')
 
 
+@dashboard_bp.route('/uploads/direct', methods=['POST'])
+@login_required
+def direct_upload():
+    """Presign a browser upload straight to object storage, for videos too large to send through the app.
+
+    {"filename": "sports-day.mp4", "content_type": "video/mp4"} -> {"url": "/uploads/incoming/...",
+    "post": {"url": ..., "fields": {...}}}. The page POSTs the file to post.url with the fields, then
+    submits the media form with direct_upload_url set to url.
+    """
+    if current_user.role != 'admin':
+        return jsonify(error='Admin privileges required.'), 403
+    if not get_storage().supports_direct_upload:
+        return jsonify(error='Direct uploads need object storage; upload the file with the form instead.'), 400
+
+    payload = request.get_json(silent=True) or {}
+    if not payload.get('filename'):
+        return jsonify(error='filename is required.'), 400
+    url, post = new_direct_upload(payload['filename'], payload.get('content_type'))
+    return jsonify(url=url, post=post, max_size=current_app.config['UPLOAD_DIRECT_MAX_SIZE'])
+
+
+def _resumable_upload_error(e):
+    response = jsonify(error=str(e))
+    response.status_code = e.status
+    if isinstance(e, OffsetMismatch):
+        response.headers['Upload-Offset'] = str(e.offset)
+    return response
+
+
+@dashboard_bp.route('/uploads/resumable', methods=['POST'])
+@login_required
+def start_resumable_upload():
+    """Start a chunked upload that survives dropped connections; see resumable_uploads.py for the protocol."""
+    if current_user.role != 'admin':
+        return jsonify(error='Admin privileges required.'), 403
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        upload = create_upload(current_user.id, payload.get('filename'), payload.get('size'))
+    except UploadSessionError as e:
+        return _resumable_upload_error(e)
+
+    response = jsonify(id=upload['id'], offset=0, size=upload['size'],
+                       chunk_size=current_app.config['RESUMABLE_UPLOAD_CHUNK_SIZE'])
+    response.status_code = 201
+    response.headers['Location'] = url_for('dashboard.resumable_upload', upload_id=upload['id'])
+    return response
+
+
+@dashboard_bp.route('/uploads/resumable/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+@login_required
+def resumable_upload(upload_id):
+    """GET/HEAD: how far an upload got. PATCH: append a chunk. DELETE: cancel."""
+    if current_user.role != 'admin':
+        return jsonify(error='Admin privileges required.'), 403
+
+    try:
+        if request.method == 'PATCH':
+            offset = append_chunk(upload_id, current_user.id, request.headers.get('Upload-Offset', type=int),
+                                  request.stream, request.headers.get('Upload-Checksum'))
+            return '', 204, {'Upload-Offset': str(offset)}
+        if request.method == 'DELETE':
+            cancel_upload(upload_id, current_user.id)
+            return '', 204
+        upload = get_upload(upload_id, current_user.id)
+    except UploadSessionError as e:
+        return _resumable_upload_error(e)
+
+    return jsonify(id=upload['id'], offset=upload['offset'], size=upload['size']), 200, {
+        'Upload-Offset': str(upload['offset']), 'Upload-Length': str(upload['size']), 'Cache-Control': 'no-store'}
+
+
 @dashboard_bp.route('/media/new', methods=['GET', 'POST'])
 @login_required
 def new_media():
@@ -386,7 +485,6 @@ def new_media():
             file_url = None
             video_platform = None
             selected_category = form.gallery_category.data
-            category_folder = secure_filename(selected_category.lower().replace(' ', '_'))
 
             # Handle different media types
             if form.media_type.data == 'video' and form.video_url.data:
@@ -404,17 +502,15 @@ def new_media():
                         video_id = file_url.split('watch?v=')[-1].split('&')[0]
                         logger.info(f"Extracted YouTube ID: {video_id}")
                         # Store the original URL as is, we'll extract ID in templates
+            elif is_direct_upload(form.direct_upload_url.data):
+                # Uploaded straight to object storage; the worker moves it into the blob store
+                file_url = form.direct_upload_url.data
+            elif form.upload_id.data:
+                # Sent in chunks beforehand; the media is only created now that the file is complete
+                file_url = finish_upload(form.upload_id.data, current_user.id)
             elif form.media_file.data:
                 # Handle media file upload
-                media_file = form.media_file.data
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                filename = secure_filename(f"{timestamp}-{media_file.filename}")
-
-                # Create folder with category name
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'media', category_folder, filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                media_file.save(file_path)
-                file_url = f'/uploads/media/{category_folder}/{filename}'
+                file_url = save_upload(form.media_file.data)
             else:
                 flash('Please provide either a video URL or upload a media file.', 'danger')
                 return render_template('dashboard/media_form.html', form=form, title='Upload Media')
@@ -422,16 +518,7 @@ def new_media():
             # Handle thumbnail if provided (for videos)
             thumbnail_url = None
             if form.thumbnail.data:
-                thumb_file = form.thumbnail.data
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                thumb_filename = secure_filename(f"{timestamp}-{thumb_file.filename}")
-
-                # Use same category folder for thumbnails
-                thumb_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails', category_folder,
-                                          thumb_filename)
-                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-                thumb_file.save(thumb_path)
-                thumbnail_url = f'/uploads/thumbnails/{category_folder}/{thumb_filename}'
+                thumbnail_url = save_upload(form.thumbnail.data)
 
             media = Media(
                 title=form.title.data,
@@ -446,6 +533,7 @@ def new_media():
             )
             db.session.add(media)
             db.session.commit()
+            enqueue_media_processing(media)
 
             logger.info(f"Media added: {media.file_url}, Type: {media.media_type}, Platform: {media.video_platform}")
             flash('Media uploaded successfully!', 'success')
@@ -466,6 +554,7 @@ def edit_media(id):
 
     media = Media.query.get_or_404(id)
     form = MediaForm(obj=media)
+    form.gallery_category.choices = [(c.name, c.name) for c in GalleryCategory.query.all()]
 
     if form.validate_on_submit():
         try:
@@ -477,28 +566,34 @@ def edit_media(id):
 
             # Update video URL if provided
             if form.media_type.data == 'video' and form.video_url.data:
+                release_upload(media.file_url)
                 media.file_url = form.video_url.data
                 media.video_platform = form.video_platform.data
 
             # Update file if provided
-            if form.media_file.data:
-                media_file = form.media_file.data
-                filename = secure_filename(media_file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'media', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                media_file.save(file_path)
-                media.file_url = f'/uploads/media/{filename}'
+            if is_direct_upload(form.direct_upload_url.data):
+                new_file_url = form.direct_upload_url.data
+            elif form.upload_id.data:
+                new_file_url = finish_upload(form.upload_id.data, current_user.id)
+            elif form.media_file.data:
+                new_file_url = save_upload(form.media_file.data)
+            else:
+                new_file_url = None
+            if new_file_url:
+                release_upload(media.file_url)
+                media.file_url = new_file_url
+                if not media.thumbnail_url:
+                    remove_variants(media)
 
             # Update thumbnail if provided
             if form.thumbnail.data:
-                thumb_file = form.thumbnail.data
-                thumb_filename = secure_filename(thumb_file.filename)
-                thumb_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails', thumb_filename)
-                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-                thumb_file.save(thumb_path)
-                media.thumbnail_url = f'/uploads/thumbnails/{thumb_filename}'
+                remove_variants(media)
+                release_upload(media.thumbnail_url)
+                media.thumbnail_url = save_upload(form.thumbnail.data)
 
             db.session.commit()
+            if new_file_url or form.thumbnail.data:
+                enqueue_media_processing(media)
             flash('Media updated successfully!', 'success')
             return redirect(url_for('dashboard.manage_media'))
         except Exception as e:
@@ -566,14 +661,13 @@ def edit_banner(id):
             banner.order = form.order.data
 
             if form.image.data:
-                image = form.image.data
-                filename = secure_filename(image.filename)
-                image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'banners', filename)
-                os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                image.save(image_path)
-                banner.image_url = f'/uploads/banners/{filename}'
+                remove_variants(banner)
+                release_upload(banner.image_url)
+                banner.image_url = save_upload(form.image.data)
 
             db.session.commit()
+            if form.image.data:
+                enqueue('image_variants', model='Banner', id=banner.id, field='image_url')
             flash('Banner updated successfully!', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
@@ -591,33 +685,19 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        # First check if it's a teacher (check Teacher model first)
-        teacher = Teacher.query.filter_by(username=form.username.data).first()
-        if teacher and teacher.check_password(form.password.data):
-            # Use remember=True to ensure the session cookie has proper duration
-            login_user(teacher, remember=True)
-            # Add a session marker to help identify the user type
-            from flask import session
-            session['user_type'] = 'teacher'
-            session['user_id'] = teacher.id
-
-            logger.info(f"Teacher {teacher.username} logged in successfully")
-            logger.info(f"User type after login: {type(current_user).__name__}")
-            next_page = request.args.get('next')
-            return redirect(next_page if next_page else url_for('dashboard.index'))
-
-        # Then check if it's a regular user
+        # Teachers, students and admins share one table, so this is a single indexed lookup
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
+            if user.password_needs_rehash():
+                # Hashing settings changed since this password was set; upgrade it while we have it
+                user.set_password(form.password.data)
+                db.session.commit()
+                logger.info(f"Rehashed password for {user.username}")
+
             # Use remember=True to ensure the session cookie has proper duration
             login_user(user, remember=True)
-            # Add a session marker to help identify the user type
-            from flask import session
-            session['user_type'] = 'user'
-            session['user_id'] = user.id
 
-            logger.info(f"User {user.username} with role {user.role} logged in successfully")
-            logger.info(f"User type after login: {type(current_user).__name__}")
+            logger.info(f"{type(user).__name__} {user.username} with role {user.role} logged in successfully")
             next_page = request.args.get('next')
             return redirect(next_page if next_page else url_for('dashboard.index'))
 
@@ -712,23 +792,8 @@ def register_teacher():
             flash('This registration code is not for teachers.', 'danger')
             return redirect(url_for('auth.register_student'))
 
-        # Check if username already exists for User or Teacher
-        existing_user = User.query.filter_by(username=form.username.data).first()
-        existing_teacher = Teacher.query.filter_by(username=form.username.data).first()
-
-        if existing_user or existing_teacher:
-            flash('Username already taken. Please choose a different one.', 'danger')
-            return render_template('auth/register_teacher.html', form=form)
-
-        # Check if email already exists for User or Teacher
-        existing_email_user = User.query.filter_by(email=form.email.data).first()
-        existing_email_teacher = Teacher.query.filter_by(email=form.email.data).first()
-
-        if existing_email_user or existing_email_teacher:
-            flash('Email already registered. Please use a different email.', 'danger')
-            return render_template('auth/register_teacher.html', form=form)
-
-        # Create a new Teacher object, NOT a User with role 'teacher'
+        # The form has already checked username and email against every account.
+        # A Teacher is stored in the user table with account_type 'teacher'
         teacher = Teacher(
             username=form.username.data,
             email=form.email.data,
@@ -753,7 +818,6 @@ def register_teacher():
         reg_code.is_used = True
         reg_code.used_by = teacher.id
 
-        # Make sure we specify used_by references a Teacher model, not User model
         db.session.commit()
 
         logger.info(f"Teacher created with ID: {teacher.id}")
@@ -809,40 +873,82 @@ def new_assignment():
             # Handle file upload if present
             file_url = None
             if form.file.data:
-                file = form.file.data
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'assignments', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                file.save(file_path)
-                file_url = f'/uploads/assignments/{filename}'
-
-            # Get students of the selected class
-            students = User.query.filter_by(role='student', class_name=form.class_name.data).all()
-
-            # Create an assignment for each student in the class
-            for student in students:
-                assignment = Assignment(
-                    title=form.title.data,
-                    description=form.description.data,
-                    due_date=form.due_date.data,
-                    file_url=file_url,
-                    teacher_id=current_user.id,
-                    student_id=student.id,
-                    class_name=form.class_name.data,
-                    subject=form.subject.data
-                )
-                db.session.add(assignment)
+                file_url = save_upload(form.file.data)
+
+            # Create the assignment for every student in the class in one statement
+            student_count = create_class_assignment(
+                title=form.title.data,
+                description=form.description.data,
+                due_date=form.due_date.data,
+                file_url=file_url,
+                teacher_id=current_user.id,
+                class_name=form.class_name.data,
+                subject=form.subject.data
+            )
 
             db.session.commit()
-            flash(f'Assignment created successfully for {len(students)} students in {form.class_name.data}!', 'success')
+            if file_url:
+                enqueue('inspect_upload', url=file_url)
+            flash(f'Assignment created successfully for {student_count} students in {form.class_name.data}!', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error creating assignment: {str(e)}")
             flash(f'Error creating assignment: {str(e)}', 'danger')
 
     return render_template('dashboard/assignment_form.html', form=form, title='New Assignment')
 
 
+def _own_assignment(assignment_id):
+    """The current teacher's assignment, or None after flashing why not."""
+    if not isinstance(current_user, Teacher):
+        flash('Access denied. Teacher privileges required.', 'danger')
+        return None
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.teacher_id != current_user.id:
+        flash('You can only view the work of your own assignments.', 'danger')
+        return None
+    return assignment
+
+
+@dashboard_bp.route('/assignments/<int:assignment_id>/work')
+@login_required
+def assignment_work(assignment_id):
+    assignment = _own_assignment(assignment_id)
+    if assignment is None:
+        return redirect(url_for('dashboard.index'))
+
+    # Each student's status, file and grade, whichever way ASSIGNMENT_STORAGE stored them
+    return render_template('dashboard/assignment_work.html', assignment=assignment, work=class_work(assignment),
+                           form=GradeAssignmentForm())
+
+
+@dashboard_bp.route('/assignments/<int:assignment_id>/grade/<int:student_id>', methods=['POST'])
+@login_required
+def grade_assignment(assignment_id, student_id):
+    assignment = _own_assignment(assignment_id)
+    if assignment is None:
+        return redirect(url_for('dashboard.index'))
+
+    work = work_for(assignment, student_id)
+    if work is None:
+        flash('This assignment was not given to that student.', 'danger')
+        return redirect(url_for('dashboard.assignment_work', assignment_id=assignment.id))
+
+    form = GradeAssignmentForm()
+    if form.validate_on_submit():
+        work.grade = form.grade.data
+        work.feedback = form.feedback.data
+        work.status = 'graded'
+        db.session.commit()
+        flash('Grade saved.', 'success')
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+    return redirect(url_for('dashboard.assignment_work', assignment_id=assignment.id))
+
+
 @dashboard_bp.route('/attendance/take', methods=['GET', 'POST'])
 @login_required
 def take_attendance():
@@ -852,27 +958,195 @@ def take_attendance():
         return redirect(url_for('dashboard.index'))
 
     form = AttendanceForm()
+    classes = teacher_class_names(current_user)
+    form.class_name.choices = [(c, c) for c in classes]
+    if request.method == 'GET':
+        form.class_name.data = request.args.get('class_name') or (classes[0] if classes else None)
+
     if form.validate_on_submit():
         try:
-            # Get all students
-            students = User.query.filter_by(role='student').all()
-            for student in students:
-                attendance = Attendance(
-                    student_id=student.id,
-                    date=form.date.data,
-                    status=request.form.get(f'status_{student.id}', 'absent'),
-                    marked_by=current_user.id
-                )
-                db.session.add(attendance)
+            statuses = {}
+            for key, value in request.form.items():
+                if key.startswith('status_') and key[len('status_'):].isdigit():
+                    statuses[int(key[len('status_'):])] = value
+            count = record_attendance(form.class_name.data, form.date.data, statuses, current_user.id)
             db.session.commit()
-            flash('Attendance marked successfully!', 'success')
+            flash(f'Attendance marked successfully for {count} students in {form.class_name.data}!', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error marking attendance: {str(e)}")
             flash('Error marking attendance. Please try again.', 'danger')
 
-    students = User.query.filter_by(role='student').all()
-    return render_template('dashboard/attendance_form.html', form=form, students=students, title='Take Attendance')
+    students = class_students(form.class_name.data) if form.class_name.data else []
+    return render_template('dashboard/attendance_form.html', form=form, students=students, classes=classes,
+                           title='Take Attendance')
+
+
+@dashboard_bp.route('/api/attendance', methods=['POST'])
+@login_required
+def attendance_api():
+    """Record a class's attendance from a compact JSON payload.
+
+    {"class_name": "5A", "date": "2024-06-03", "student_ids": [12, 13, 14], "codes": "PAL"}
+    Students of the class that are not listed are marked absent.
+    """
+    if not isinstance(current_user, Teacher):
+        return jsonify(error='Teacher privileges required.'), 403
+
+    payload = request.get_json(silent=True) or {}
+    try:
+        class_name = payload['class_name']
+        date = datetime.strptime(payload['date'], '%Y-%m-%d').date()
+        statuses = parse_compact_payload(payload)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f'Invalid payload: {str(e)}'), 400
+
+    if class_name not in teacher_class_names(current_user):
+        return jsonify(error=f'You do not take attendance for class {class_name}.'), 403
+
+    try:
+        count = record_attendance(class_name, date, statuses, current_user.id)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+
+    return jsonify(class_name=class_name, date=date.isoformat(), recorded=count)
+
+
+def attendance_analytics_data(args):
+    """Analytics for the current user, scoped by the class_name/start/end request args.
+
+    Admins see every class, teachers the classes they take attendance for, and
+    students only themselves. Raises PermissionError or ValueError for bad requests.
+    """
+    start = datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start') else None
+    end = datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else None
+
+    if current_user.role == 'student':
+        students = student_rates(student_id=current_user.id, start=start, end=end)
+        return {'student': students[0] if students else None,
+                'monthly': monthly_rates(student_id=current_user.id, start=start, end=end)}
+
+    if isinstance(current_user, Teacher):
+        allowed = set(teacher_class_names(current_user))
+    elif current_user.role == 'admin':
+        allowed = None
+    else:
+        raise PermissionError('Attendance analytics are not available for this account.')
+
+    class_name = args.get('class_name')
+    if class_name and allowed is not None and class_name not in allowed:
+        raise PermissionError(f'You do not take attendance for class {class_name}.')
+
+    classes = [row for row in class_rates(start=start, end=end) if allowed is None or row['class_name'] in allowed]
+    data = {'classes': classes, 'class_name': class_name, 'start': start, 'end': end}
+    if class_name:
+        data['students'] = student_rates(class_name=class_name, start=start, end=end)
+        data['monthly'] = monthly_rates(class_name=class_name, start=start, end=end)
+    elif allowed is None:
+        data['monthly'] = monthly_rates(start=start, end=end)
+    return data
+
+
+@dashboard_bp.route('/attendance/analytics')
+@login_required
+def attendance_analytics():
+    try:
+        data = attendance_analytics_data(request.args)
+    except PermissionError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('dashboard.index'))
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'danger')
+        return redirect(url_for('dashboard.attendance_analytics'))
+    return render_template('dashboard/attendance_analytics.html', **data)
+
+
+@dashboard_bp.route('/api/attendance/analytics')
+@login_required
+def attendance_analytics_api():
+    """GET ?class_name=5A&start=2024-06-01&end=2024-06-30 -> rates, streaks and flags as JSON."""
+    try:
+        data = attendance_analytics_data(request.args)
+    except PermissionError as e:
+        return jsonify(error=str(e)), 403
+    except ValueError:
+        return jsonify(error='Dates must be in YYYY-MM-DD format.'), 400
+    for key in ('start', 'end'):
+        if data.get(key):
+            data[key] = data[key].isoformat()
+    return jsonify(data)
+
+
+def _report_card_classes():
+    """Classes the current user may print report cards for (None for admins: all), or False if none."""
+    if isinstance(current_user, Teacher):
+        return teacher_class_names(current_user)
+    if current_user.role == 'admin':
+        return None
+    return False
+
+
+def _report_cards_page(allowed, **context):
+    years = [row[0] for row in db.session.query(StudentProgress.academic_year).distinct().order_by(
+        StudentProgress.academic_year.desc())]
+    return render_template('dashboard/report_cards.html', class_names=allowed or class_names(),
+                           academic_years=years, terms=TERM_LABELS, **context)
+
+
+@dashboard_bp.route('/report-cards')
+@login_required
+def report_cards():
+    """Pick a class and term, or with ?class_name=&academic_year=&term= queue the class's cards as a zip."""
+    allowed = _report_card_classes()
+    if allowed is False:
+        flash('Access denied. Teacher or admin privileges required.', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    class_name = request.args.get('class_name')
+    academic_year = request.args.get('academic_year')
+    term = request.args.get('term')
+    if not (academic_year and term in TERM_LABELS) or (allowed is not None and class_name not in allowed):
+        return _report_cards_page(allowed)
+    try:
+        parse_academic_year(academic_year)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return _report_cards_page(allowed), 400
+
+    # Rendering a class (or the whole school) takes a while, so the job worker builds the archive
+    queued = enqueue('report_cards', academic_year=academic_year, term=term, class_name=class_name or None,
+                     requested_by=current_user.id)
+    return redirect(url_for('dashboard.report_cards_job', job_id=queued.id))
+
+
+@dashboard_bp.route('/report-cards/jobs/<int:job_id>')
+@login_required
+def report_cards_job(job_id):
+    """Download a queued report card archive once it is built; until then show the job's status."""
+    allowed = _report_card_classes()
+    queued = db.session.get(Job, job_id)
+    if allowed is False or queued is None or queued.kind != 'report_cards' or (
+            allowed is not None and queued.payload.get('requested_by') != current_user.id):
+        abort(404)
+
+    if queued.status == 'done':
+        # Archives are in upload storage, so whichever instance serves this page can send it
+        key = (queued.result or {}).get('archive', '')
+        storage = get_storage()
+        if key.startswith('report_cards/') and storage.exists(key):
+            response = storage.send(key)
+            response.headers['Content-Disposition'] = f"attachment; filename={os.path.basename(key)}"
+            return response
+        flash('That report card archive is gone; please generate it again.', 'warning')
+        return redirect(url_for('dashboard.report_cards'))
+    if queued.status == 'failed':
+        flash('Generating the report cards failed. Please try again.', 'danger')
+        return redirect(url_for('dashboard.report_cards'))
+    # Still queued or running: the page reloads itself until the archive is ready
+    return _report_cards_page(allowed, job=queued), 200, {'Refresh': '5'}
 
 
 @dashboard_bp.route('/progress/record', methods=['GET', 'POST'])
@@ -915,19 +1189,29 @@ def submit_assignment(assignment_id):
         return redirect(url_for('dashboard.index'))
 
     assignment = Assignment.query.get_or_404(assignment_id)
+
+    # Class assignments stored once keep each student's work on a submission row
+    submission = None
+    if assignment.student_id is None:
+        submission = student_submission(assignment, current_user.id)
+        if submission is None:
+            flash('This assignment was not given to you.', 'danger')
+            return redirect(url_for('dashboard.student_assignments'))
+
     form = SubmitAssignmentForm()
 
     if form.validate_on_submit():
         try:
-            file = form.file.data
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'submissions', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-
-            assignment.status = 'submitted'
-            assignment.file_url = f'/uploads/submissions/{filename}'
+            file_url = save_upload(form.file.data)
+
+            target = submission or assignment
+            target.status = 'submitted'
+            release_upload(target.file_url)
+            target.file_url = file_url
+            if submission:
+                submission.submitted_at = datetime.utcnow()
             db.session.commit()
+            enqueue('inspect_upload', url=target.file_url)
             flash('Assignment submitted successfully!', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
@@ -949,6 +1233,7 @@ def request_tc():
         try:
             tc = TransferCertificate(
                 student_id=current_user.id,
+                admission_number=current_user.username,
                 reason=form.reason.data,
                 tc_number=f'TC{current_user.id}-{datetime.utcnow().strftime("%Y%m%d%H%M")}'
             )
@@ -978,17 +1263,8 @@ def new_popup_banner():
         try:
             image_url = None
             if form.image.data:
-                image = form.image.data
-                timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                filename = secure_filename(f"{timestamp}_{image.filename}")
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'popups', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                image.save(file_path)
-                image_url = f'/uploads/popups/{filename}'
-
-                # Debug log
-                logger.info(f"Saved popup banner image to: {file_path}")
-                logger.info(f"Image URL set to: {image_url}")
+                image_url = save_upload(form.image.data)
+                logger.info(f"Saved popup banner image to: {image_url}")
 
             banner = PopupBanner(
                 title=form.title.data,
@@ -1000,6 +1276,8 @@ def new_popup_banner():
             )
             db.session.add(banner)
             db.session.commit()
+            if image_url:
+                enqueue('image_variants', model='PopupBanner', id=banner.id, field='image_url')
             flash('Popup banner created successfully!', 'success')
             return redirect(url_for('dashboard.manage_popup_banners'))
         except Exception as e:
@@ -1086,12 +1364,8 @@ def check_app():
         item.is_featured = form.is_featured.data
 
         if form.image.data:
-            image = form.image.data
-            filename = secure_filename(image.filename)
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'gallery', filename)
-            os.makedirs(os.path.dirname(image_path), exist_ok=True)
-            image.save(image_path)
-            item.image_url = f'/uploads/gallery/{filename}'
+            release_upload(item.image_url)
+            item.image_url = save_upload(form.image.data)
 
         db.session.commit()
         flash('Gallery item updated successfully!', 'success')
@@ -1129,20 +1403,9 @@ def delete_gallery_item(id):
         # Debug log to track execution
         logger.info(f"Attempting to delete gallery item {id}: {item.title}")
 
-        # Delete the file if it exists
-        if item.image_url:
-            # Handle both formats: with or without leading slash
-            clean_path = item.image_url.lstrip('/')
-            file_path = os.path.join(current_app.static_folder, clean_path)
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Deleted file: {file_path}")
-                else:
-                    logger.warning(f"File not found at path: {file_path}")
-            except Exception as file_e:
-                logger.error(f"Failed to delete file: {str(file_e)}")
-                # Continue even if file deletion fails
+        # The file is deleted after commit unless another row still uses it
+        remove_variants(item)
+        release_upload(item.image_url)
 
         # Delete the database record
         db.session.delete(item)
@@ -1185,27 +1448,11 @@ def delete_media(id):
         # Debug log to track execution
         logger.info(f"Attempting to delete media {id}: {media.title}")
 
-        # Only delete local files, not external links (YouTube, Facebook)
-        if media.file_url and media.file_url.startswith('/uploads/') and not media.video_platform:
-            try:
-                file_path = os.path.join(current_app.static_folder, media.file_url.lstrip('/'))
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Deleted file: {file_path}")
-            except Exception as file_e:
-                logger.error(f"Failed to delete media file: {str(file_e)}")
-                # Continue even if file deletion fails
-
-        # Delete thumbnail if exists
-        if media.thumbnail_url and media.thumbnail_url.startswith('/uploads/'):
-            try:
-                thumb_path = os.path.join(current_app.static_folder, media.thumbnail_url.lstrip('/'))
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-                    logger.info(f"Deleted thumbnail: {thumb_path}")
-            except Exception as thumb_e:
-                logger.error(f"Failed to delete thumbnail: {str(thumb_e)}")
-                # Continue even if thumbnail deletion fails
+        # Local files are deleted after commit unless another row still uses them;
+        # external links (YouTube, Facebook) are left alone
+        remove_variants(media)
+        release_upload(media.file_url)
+        release_upload(media.thumbnail_url)
 
         db.session.delete(media)
         db.session.commit()
@@ -1247,14 +1494,12 @@ def edit_disclosure(id):
         disclosure.display_order = form.display_order.data
 
         if form.file.data:
-            file = form.file.data
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'disclosures', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-            disclosure.file_url = f'/uploads/disclosures/{filename}'
+            release_upload(disclosure.file_url)
+            disclosure.file_url = save_upload(form.file.data)
 
         db.session.commit()
+        if form.file.data:
+            enqueue('inspect_upload', url=disclosure.file_url)
         flash('Public disclosure updated successfully!', 'success')
         return redirect(url_for('dashboard.manage_disclosures'))
 
@@ -1307,14 +1552,13 @@ def edit_popup_banner(id):
         popup.end_date = form.end_date.data
 
         if form.image.data:
-            image = form.image.data
-            filename = secure_filename(image.filename)
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'popups', filename)
-            os.makedirs(os.path.dirname(image_path), exist_ok=True)
-            image.save(image_path)
-            popup.image_url = f'/uploads/popups/{filename}'
+            remove_variants(popup)
+            release_upload(popup.image_url)
+            popup.image_url = save_upload(form.image.data)
 
         db.session.commit()
+        if form.image.data:
+            enqueue('image_variants', model='PopupBanner', id=popup.id, field='image_url')
         flash('Popup banner updated successfully!', 'success')
         return redirect(url_for('dashboard.manage_popup_banners'))
 
@@ -1347,12 +1591,9 @@ def delete_popup_banner(id):
     popup = PopupBanner.query.get_or_404(id)
 
     try:
-        # Delete the image file if it exists
-        if popup.image_url:
-            image_path = os.path.join(current_app.static_folder, popup.image_url.lstrip('/'))
-            if os.path.exists(image_path):
-                os.remove(image_path)
-                logger.info(f"Deleted popup image file: {image_path}")
+        # The image is deleted after commit unless another row still uses it
+        remove_variants(popup)
+        release_upload(popup.image_url)
 
         # Delete the database record
         db.session.delete(popup)
@@ -1428,26 +1669,19 @@ def new_gallery_item():
 
     if form.validate_on_submit():
         try:
-            image = form.image.data
-            filename = secure_filename(f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{image.filename}")
-            category = GalleryCategory.query.get(form.category_id.data)
-            folder_name = secure_filename(category.name.lower().replace(' ', '_'))
-
-            # Create folder with category name if it doesn't exist
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'gallery', folder_name, filename)
-            os.makedirs(os.path.dirname(image_path), exist_ok=True)
-            image.save(image_path)
+            image_url = save_upload(form.image.data)
 
             item = GalleryItem(
                 title=form.title.data,
                 description=form.description.data,
-                image_url=f'/uploads/gallery/{folder_name}/{filename}',
+                image_url=image_url,
                 category_id=form.category_id.data,
                 is_featured=form.is_featured.data,
                 is_active=form.is_active.data
             )
             db.session.add(item)
             db.session.commit()
+            enqueue('image_variants', model='GalleryItem', id=item.id, field='image_url')
 
             logger.info(f"Gallery item added: {item.image_url}")
             flash('Gallery item added successfully!', 'success')
@@ -1471,12 +1705,7 @@ def new_fee_structure():
     if form.validate_on_submit():
         file_url = None
         if 'file' in request.files and request.files['file'].filename:
-            file = request.files['file']
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'fees', filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-            file_url = f'/uploads/fees/{filename}'
+            file_url = save_upload(request.files['file'])
 
         fee = FeeStructure(
             title=form.title.data,
@@ -1491,6 +1720,8 @@ def new_fee_structure():
         )
         db.session.add(fee)
         db.session.commit()
+        if file_url:
+            enqueue('inspect_upload', url=file_url)
         flash('Fee structure added successfully!', 'success')
         return redirect(url_for('dashboard.index'))
 
@@ -1510,12 +1741,7 @@ def new_disclosure():
         try:
             file_url = None
             if form.file.data:
-                file = form.file.data
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'disclosures', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                file.save(file_path)
-                file_url = f'/uploads/disclosures/{filename}'
+                file_url = save_upload(form.file.data)
 
             disclosure = PublicDisclosure(
                 title=form.title.data,
@@ -1527,6 +1753,8 @@ def new_disclosure():
             )
             db.session.add(disclosure)
             db.session.commit()
+            if file_url:
+                enqueue('inspect_upload', url=file_url)
             flash('Public disclosure added successfully!', 'success')
             return redirect(url_for('dashboard.manage_disclosures'))
         except Exception as e:
@@ -1539,6 +1767,7 @@ def new_disclosure():
 # Frontend Routes for Gallery
 @main_bp.route('/gallery/photos')
 @main_bp.route('/gallery/photos/<int:category_id>')
+@cached_page(GalleryCategory, GalleryItem)
 def gallery_photos(category_id=None):
     categories = GalleryCategory.query.all()
     selected_category = GalleryCategory.query.get(category_id) if category_id else None
@@ -1551,11 +1780,6 @@ def gallery_photos(category_id=None):
     else:
         photos = GalleryItem.query.filter_by(is_active=True).order_by(GalleryItem.created_at.desc()).all()
 
-    # Log image paths for debugging
-    for photo in photos:
-        logger.info(
-            f"Photo path: {photo.image_url}, Exists: {os.path.exists(os.path.join(app.static_folder, photo.image_url.lstrip('/')))}")
-
     return render_template('gallery_photos.html',
                            categories=categories,
                            selected_category=selected_category,
@@ -1564,6 +1788,7 @@ def gallery_photos(category_id=None):
 
 @main_bp.route('/gallery/videos')
 @main_bp.route('/gallery/videos/<int:category_id>')
+@cached_page(GalleryCategory, Media)
 def gallery_videos(category_id=None):
     categories = GalleryCategory.query.all()
     selected_category = GalleryCategory.query.get(category_id) if category_id else None
@@ -1588,6 +1813,7 @@ def gallery_videos(category_id=None):
 
 # Public Disclosure Routes
 @main_bp.route('/disclosure/<category>')
+@cached_page(PublicDisclosure)
 def disclosure(category):
     category_map = {
         'general': 'General Information',
@@ -1610,33 +1836,21 @@ def disclosure(category):
                            category_title=category_title)
 
 
+def _tc_retrieval_rate_limited(retry_after):
+    return render_template('tc_retrieval.html', tc=None,
+                           error=f"Too many requests. Please try again in {retry_after} seconds.")
+
+
 # TC Retrieval Route
 @main_bp.route('/tc-retrieval', methods=['GET', 'POST'])
+@rate_limited(tc_retrieval_limiter, 'TC_RETRIEVAL_RATE_LIMIT', _tc_retrieval_rate_limited)
 def tc_retrieval():
     error = None
     tc = None
 
     if request.method == 'POST':
-        admission_number = request.form.get('admission_number')
-
-        # Try to find TC by admission number in the TC number pattern
-        tc = TransferCertificate.query.filter(
-            TransferCertificate.tc_number.like(f'TC-{admission_number}-%'),
-            TransferCertificate.status == 'approved'
-        ).order_by(TransferCertificate.created_at.desc()).first()
-
-        # If not found by TC number pattern, try by student ID
-        if not tc:
-            # Find the user by admission number
-            user = User.query.filter_by(username=admission_number).first()
-
-            if user:
-                # Look for TC by student ID
-                tc = TransferCertificate.query.filter_by(
-                    student_id=user.id,
-                    status='approved'
-                ).order_by(TransferCertificate.created_at.desc()).first()
-
+        tc = find_approved_tc(request.form.get('admission_number'),
+                              miss_ttl=current_app.config['TC_NEGATIVE_CACHE_TTL'])
         if not tc:
             error = "No approved Transfer Certificate found for this admission number."
 
@@ -1649,9 +1863,16 @@ def inject_tc_retrieval_link():
     return dict(tc_retrieval_link=url_for('main.tc_retrieval'))
 
 
+# Expose responsive image sources (srcset per format) to templates
+@app.context_processor
+def inject_image_helpers():
+    return dict(image_sources=image_sources)
+
+
 # Fee Structure Route
 @main_bp.route('/fee-structure')
 @main_bp.route('/fee-structure/<academic_year>')
+@cached_page(FeeStructure)
 def fee_structure(academic_year=None):
     # Get all unique academic years
     academic_years = db.session.query(FeeStructure.academic_year).filter_by(
@@ -1691,16 +1912,14 @@ def admin_upload_tc(tc_id):
             tc_file = request.files.get('tc_file')
 
             if tc_file:
-                filename = secure_filename(
-                    f"TC-{student.username}-{datetime.utcnow().strftime('%Y%m%d%H%M')}.{tc_file.filename.split('.')[-1]}")
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tc', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                tc_file.save(file_path)
+                file_url = save_upload(tc_file)
 
                 # Update the existing TC record
                 tc.status = 'approved'
-                tc.file_url = f'/uploads/tc/{filename}'
+                release_upload(tc.file_url)
+                tc.file_url = file_url
                 db.session.commit()
+                enqueue('inspect_upload', url=tc.file_url)
 
                 flash('Transfer Certificate uploaded successfully!', 'success')
                 return redirect(url_for('dashboard.manage_tc'))
@@ -1723,34 +1942,31 @@ def new_tc():
 
     if request.method == 'POST':
         try:
-            admission_number = request.form.get('admission_number')
+            admission_number = normalize_admission_number(request.form.get('admission_number'))
             reason = request.form.get('reason')
             tc_file = request.files.get('tc_file')
 
             if tc_file and admission_number:
-                # Find student if exists, but don't require it
-                student = User.query.filter_by(username=admission_number).first()
+                # Find student if exists, but don't require it (teachers share the table, so skip them)
+                student = User.query.filter_by(username=admission_number, account_type='user').first()
 
                 # Generate a timestamp for the TC
                 timestamp = datetime.utcnow().strftime('%Y%m%d%H%M')
 
-                # Create a secure filename
-                filename = secure_filename(
-                    f"TC-{admission_number}-{timestamp}.{tc_file.filename.split('.')[-1]}")
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tc', filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                tc_file.save(file_path)
+                file_url = save_upload(tc_file)
 
                 # Create TC record
                 tc = TransferCertificate(
                     student_id=student.id if student else None,
                     reason=reason if reason else "Issued by administrator",
                     tc_number=f'TC-{admission_number}-{timestamp}',
+                    admission_number=admission_number,
                     status='approved',
-                    file_url=f'/uploads/tc/{filename}'
+                    file_url=file_url
                 )
                 db.session.add(tc)
                 db.session.commit()
+                enqueue('inspect_upload', url=tc.file_url)
                 flash('Transfer Certificate created and uploaded successfully!', 'success')
                 return redirect(url_for('dashboard.manage_tc'))
             else:
@@ -1766,13 +1982,45 @@ def new_tc():
 @dashboard_bp.route('/registration-codes')
 @login_required
 def manage_registration_codes():
+    """Codes newest first, a keyset page at a time, filtered by ?role= and ?used=yes|no."""
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    from models import Teacher
-    codes = RegistrationCode.query.order_by(RegistrationCode.created_at.desc()).all()
-    return render_template('dashboard/registration_codes.html', codes=codes, User=User, Teacher=Teacher)
+    role = request.args.get('role') if request.args.get('role') in ('student', 'teacher') else None
+    used = {'yes': True, 'no': False}.get(request.args.get('used'))
+    page = keyset_paginate(codes_query(role, used),
+                           [(RegistrationCode.created_at, True), (RegistrationCode.id, True)],
+                           key=lambda code: (code.created_at, code.id),
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['REGISTRATION_CODES_PER_PAGE'])
+
+    # Accounts that used the codes on this page, in one query
+    used_by_ids = {code.used_by for code in page.items if code.used_by}
+    users = {user.id: user for user in User.query.filter(User.id.in_(used_by_ids))} if used_by_ids else {}
+    return render_template('dashboard/registration_codes.html', codes=page.items, next_cursor=page.next_cursor,
+                           role=role, used=request.args.get('used'), users=users, User=User, Teacher=Teacher)
+
+
+@dashboard_bp.route('/registration-codes/sheet')
+@login_required
+def registration_code_sheet():
+    """Printable PDF of the newest unused codes, optionally for one ?role=."""
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    role = request.args.get('role') if request.args.get('role') in ('student', 'teacher') else None
+    codes = [code.code for code in codes_query(role, used=False).order_by(
+        RegistrationCode.created_at.desc(), RegistrationCode.id.desc()).limit(MAX_CODE_BATCH)]
+    return _code_sheet_response(codes, role)
+
+
+def _code_sheet_response(codes, role):
+    title = f"{current_app.config['SCHOOL_NAME']} - {role.title() if role else 'Registration'} codes"
+    pdf = render_code_sheet(codes, title, f"{len(codes)} unused codes, printed {datetime.utcnow():%Y-%m-%d}")
+    return Response(pdf, mimetype='application/pdf',
+                    headers={'Content-Disposition': f"attachment; filename={role or 'registration'}_codes.pdf"})
 
 
 @dashboard_bp.route('/registration-codes/delete/<int:id>')
@@ -1802,30 +2050,107 @@ def generate_registration_code():
 
     form = RegistrationCodeForm()
     if form.validate_on_submit():
-        import random
-        import string
-
-        # Generate a random code
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
-        # Create a new registration code
-        reg_code = RegistrationCode(
-            code=code,
-            role=form.role.data,
-            is_used=False
-        )
-
-        db.session.add(reg_code)
+        try:
+            codes = generate_codes(form.role.data, form.count.data)
+        except RuntimeError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('dashboard.generate_registration_code'))
         db.session.commit()
+        logger.info(f"{current_user.username} generated {len(codes)} {form.role.data} registration code(s)")
 
-        flash(f'Registration code generated: {code}', 'success')
-        return redirect(url_for('dashboard.manage_registration_codes'))
+        if len(codes) == 1:
+            flash(f'Registration code generated: {codes[0]}', 'success')
+            return redirect(url_for('dashboard.manage_registration_codes'))
+        # A batch goes straight to the printable sheet
+        return _code_sheet_response(codes, form.role.data)
 
     # Fetch recent codes for display
     codes = RegistrationCode.query.order_by(RegistrationCode.created_at.desc()).limit(5).all()
     return render_template('dashboard/generate_code.html', form=form, codes=codes, User=User)
 
 
+@dashboard_bp.route('/import/<kind>', methods=['GET', 'POST'])
+@login_required
+def bulk_import(kind):
+    """Import students, teachers or registration codes from a CSV/XLSX file in the job worker."""
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('dashboard.index'))
+    if kind not in IMPORT_COLUMNS:
+        abort(404)
+
+    form = BulkImportForm()
+    if form.validate_on_submit():
+        # Hashing thousands of passwords outlasts a request, so the job worker runs the import
+        queued = queue_import(kind, form.file.data, dry_run=form.dry_run.data, requested_by=current_user.id)
+        logger.info(f"Bulk import of {kind} queued by {current_user.username} as job {queued.id}")
+        return redirect(url_for('dashboard.bulk_import_job', job_id=queued.id))
+
+    return _bulk_import_page(kind, form)
+
+
+def _bulk_import_page(kind, form, **context):
+    required, optional = IMPORT_COLUMNS[kind]
+    return render_template('dashboard/bulk_import.html', form=form, kind=kind, required_columns=required,
+                           optional_columns=optional, **context)
+
+
+@dashboard_bp.route('/import/jobs/<int:job_id>')
+@login_required
+def bulk_import_job(job_id):
+    """Download an import's per-row results once the job is done; until then show the job's status."""
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('dashboard.index'))
+    queued = db.session.get(Job, job_id)
+    if queued is None or queued.kind != 'bulk_import':
+        abort(404)
+
+    payload = queued.payload
+    if queued.status == 'done' and queued.result.get('error'):
+        flash(queued.result['error'], 'danger')
+        return redirect(url_for('dashboard.bulk_import', kind=payload['import_type']))
+    storage = get_storage()
+    if queued.status in ('done', 'failed'):
+        # Generated passwords are only ever handed out here; a failed run still lists the rows it imported
+        if storage.exists(payload['results_key']):
+            response = storage.send(payload['results_key'])
+            response.headers['Content-Disposition'] = f"attachment; filename={payload['import_type']}_import_results.csv"
+            return response
+        flash('The import failed before importing anything. Please try again.', 'danger')
+        return redirect(url_for('dashboard.bulk_import', kind=payload['import_type']))
+    # Still queued or running: the page reloads itself until the results are ready
+    return _bulk_import_page(payload['import_type'], BulkImportForm(), job=queued), 200, {'Refresh': '5'}
+
+
+@dashboard_bp.route('/export/<name>')
+@login_required
+def export_data(name):
+    """Stream attendance/assignments/progress/messages as CSV or XLSX, filtered by ?from=&to=&class_name=."""
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('dashboard.index'))
+    fmt = request.args.get('format', 'csv')
+    if name not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        abort(400, 'Dates must be YYYY-MM-DD')
+    class_name = request.args.get('class_name') or None
+
+    try:
+        chunks = stream_export(name, fmt, start, end, class_name)
+    except RuntimeError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('dashboard.index'))
+    filename = secure_filename(export_filename(name, fmt, start, end, class_name))
+    return Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 # Admin Contact Message Management
 @dashboard_bp.route('/tc/manage')
 @login_required
@@ -1834,14 +2159,20 @@ def manage_tc():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    # Get all TC requests, ordered by creation date (newest first)
-    transfer_certificates = TransferCertificate.query.order_by(TransferCertificate.created_at.desc()).all()
-
-    # Get user information for each TC
-    for tc in transfer_certificates:
-        tc.student = User.query.get(tc.student_id)
-
-    return render_template('dashboard/manage_tc.html', transfer_certificates=transfer_certificates)
+    # Pending requests first, then newest first; with ?status= the (status, created_at) index serves the page
+    status = request.args.get('status') if request.args.get('status') in TC_STATUSES else None
+    query = TransferCertificate.query.options(joinedload(TransferCertificate.student))
+    if status:
+        query = query.filter(TransferCertificate.status == status)
+    pending_first = case((TransferCertificate.status == 'pending', 0), else_=1)
+    page = keyset_paginate(query,
+                           [(pending_first, False), (TransferCertificate.created_at, True),
+                            (TransferCertificate.id, True)],
+                           key=lambda tc: (0 if tc.status == 'pending' else 1, tc.created_at, tc.id),
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['TC_PER_PAGE'])
+    return render_template('dashboard/manage_tc.html', transfer_certificates=page.items,
+                           next_cursor=page.next_cursor, status=status, statuses=TC_STATUSES)
 
 
 @dashboard_bp.route('/messages')
@@ -1886,7 +2217,10 @@ def view_attendance():
         return redirect(url_for('dashboard.index'))
 
     attendances = Attendance.query.filter_by(student_id=current_user.id).order_by(Attendance.date.desc()).all()
-    return render_template('dashboard/view_attendance.html', attendances=attendances)
+    summary = student_rates(student_id=current_user.id)
+    return render_template('dashboard/view_attendance.html', attendances=attendances,
+                           summary=summary[0] if summary else None,
+                           monthly=monthly_rates(student_id=current_user.id))
 
 
 @dashboard_bp.route('/assignments')
@@ -1897,7 +2231,11 @@ def student_assignments():
         return redirect(url_for('dashboard.index'))
 
     assignments = Assignment.query.filter_by(student_id=current_user.id).order_by(Assignment.due_date.desc()).all()
-    return render_template('dashboard/student_assignments.html', assignments=assignments)
+    # Class assignments stored once, with this student's submission row and its assignment loaded together
+    submissions = AssignmentSubmission.query.options(joinedload(AssignmentSubmission.assignment)).join(
+        Assignment).filter(AssignmentSubmission.student_id == current_user.id).order_by(
+        Assignment.due_date.desc()).all()
+    return render_template('dashboard/student_assignments.html', assignments=assignments, submissions=submissions)
 
 
 @dashboard_bp.route('/tc/my')
@@ -1921,7 +2259,7 @@ def manage_users():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    users = User.query.order_by(User.created_at.desc()).all()
+    users = User.query.filter(User.account_type == 'user').order_by(User.created_at.desc()).all()
     teachers = Teacher.query.order_by(Teacher.created_at.desc()).all()
     return render_template('dashboard/manage_users.html', users=users, teachers=teachers)
 
@@ -1933,7 +2271,8 @@ def reset_user_password(id):
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    user = User.query.get_or_404(id)
+    # Teachers are managed through the /teachers/ routes
+    user = User.query.filter_by(id=id, account_type='user').first_or_404()
 
     if request.method == 'POST':
         # Generate a random password
@@ -1962,7 +2301,7 @@ def delete_user(id):
         flash('You cannot delete your own account!', 'danger')
         return redirect(url_for('dashboard.manage_users'))
 
-    user = User.query.get_or_404(id)
+    user = User.query.filter_by(id=id, account_type='user').first_or_404()
     db.session.delete(user)
     db.session.commit()
 
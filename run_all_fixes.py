@@ -19,10 +19,7 @@ fix_scripts = [
     "fix_file_paths.py",
     "fix_gallery_paths.py",
     "fix_media_table.py",
-    "update_db.py",
-    "update_db_gallery_item.py",
-    "update_db_media.py",
-    "update_db_video_platform.py"
+    "migrate.py"
 ]
 
 success_count = 0
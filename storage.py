@@ -0,0 +1,239 @@
+"""Where uploaded files are kept: local disk or an S3-compatible bucket.
+
+Upload URLs in the database are always /uploads/<key>. The backend in UPLOAD_STORAGE
+decides where <key> lives:
+
+'local' (default)
+    Files under UPLOAD_FOLDER, served by this app. Only the instance that wrote a file
+    can serve it, so this suits development and single-server deployments.
+'s3'
+    An S3-compatible bucket (AWS S3, MinIO, R2, ...) named by S3_BUCKET, reached at
+    S3_ENDPOINT_URL for anything but AWS. Every instance reads and writes the same
+    objects, and /static/uploads/<key> redirects to the object, at UPLOAD_PUBLIC_URL
+    when the bucket (or a CDN in front of it) is public and through a presigned URL
+    otherwise. Files are sent as multipart uploads of UPLOAD_MULTIPART_CHUNK_SIZE
+    parts, and browsers can upload large videos straight to the bucket with
+    presigned_post(). Credentials come from boto3's usual sources, such as the
+    AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables. Needs boto3.
+"""
+import os
+import shutil
+import logging
+import mimetypes
+import tempfile
+from contextlib import contextmanager
+
+from flask import current_app, send_from_directory, redirect
+
+logger = logging.getLogger(__name__)
+
+
+def upload_key(url):
+    """Storage key of an /uploads/... URL."""
+    return url[len('/uploads/'):]
+
+
+def get_storage():
+    """The storage backend configured for the current app, created on first use."""
+    storage = current_app.extensions.get('upload_storage')
+    if storage is None:
+        storage = current_app.extensions['upload_storage'] = create_storage(current_app.config)
+    return storage
+
+
+def create_storage(config):
+    backend = config.get('UPLOAD_STORAGE', 'local')
+    if backend == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if backend == 's3':
+        return S3Storage(config['S3_BUCKET'], prefix=config.get('S3_PREFIX', ''),
+                         endpoint_url=config.get('S3_ENDPOINT_URL'), region=config.get('S3_REGION'),
+                         public_url=config.get('UPLOAD_PUBLIC_URL'),
+                         chunk_size=config.get('UPLOAD_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024),
+                         presign_expires=config.get('UPLOAD_PRESIGN_EXPIRES', 3600))
+    raise ValueError(f"Unknown UPLOAD_STORAGE {backend!r}; use 'local' or 's3'")
+
+
+class LocalStorage:
+    """Files under a directory on this machine."""
+
+    supports_direct_upload = False
+
+    def __init__(self, root):
+        self.root = root
+        # Uploads are spooled on the same filesystem, so put_file() is a rename
+        self.temp_dir = os.path.join(root, 'blobs')
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put_file(self, key, file_path, content_type=None, cache_control=None):
+        """Move a finished local file to `key`. The file at `file_path` is consumed."""
+        destination = self.path(key)
+        if os.path.abspath(file_path) == os.path.abspath(destination):
+            return
+        os.chmod(file_path, 0o644)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(file_path, destination)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def size(self, key):
+        """Size in bytes, or None if there is no such file."""
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        """Yield (key, modified timestamp) for every file whose key starts with `prefix`."""
+        directory = os.path.dirname(self.path(prefix))
+        for current, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(current, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key, os.path.getmtime(path)
+
+    @contextmanager
+    def local_copy(self, key):
+        """A path to the file on local disk; files written next to it are kept."""
+        if not self.exists(key):
+            raise FileNotFoundError(self.path(key))
+        yield self.path(key)
+
+    def location(self, key):
+        """A path or URL tools such as ffmpeg can read the file from."""
+        return self.path(key)
+
+    def send(self, key, etag=None, max_age=0, immutable=False):
+        response = send_from_directory(self.root, key, conditional=True, etag=etag or True, max_age=max_age)
+        response.cache_control.immutable = immutable or None
+        return response
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, under an optional key prefix."""
+
+    supports_direct_upload = True
+    temp_dir = None  # Spool uploads in the system temp directory
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, public_url=None,
+                 chunk_size=8 * 1024 * 1024, presign_expires=3600):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("UPLOAD_STORAGE = 's3' needs the boto3 package.")
+        if not bucket:
+            raise ValueError("UPLOAD_STORAGE = 's3' needs S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.presign_expires = presign_expires
+        # MinIO and most other stand-ins only support path-style bucket addressing
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region, config=Config(
+            signature_version='s3v4', s3={'addressing_style': 'path' if endpoint_url else 'auto'}))
+        self.transfer = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size)
+        self._client_error = ClientError
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def put_file(self, key, file_path, content_type=None, cache_control=None):
+        """Upload a finished local file to `key` in parts. The file at `file_path` is consumed."""
+        extra = {'ContentType': content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'}
+        if cache_control:
+            extra['CacheControl'] = cache_control
+        self.client.upload_file(file_path, self.bucket, self._key(key), ExtraArgs=extra, Config=self.transfer)
+        os.remove(file_path)
+
+    def copy(self, source_key, key, cache_control=None):
+        """Copy an object inside the bucket, in parts, without downloading it."""
+        extra = {'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                 'MetadataDirective': 'REPLACE'}
+        if cache_control:
+            extra['CacheControl'] = cache_control
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(source_key)}, self.bucket, self._key(key),
+                         ExtraArgs=extra, Config=self.transfer)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return head['ContentLength'] if head else None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for entry in page.get('Contents', []):
+                yield entry['Key'][len(self.prefix):], entry['LastModified'].timestamp()
+
+    @contextmanager
+    def local_copy(self, key):
+        directory = tempfile.mkdtemp(prefix='upload-')
+        try:
+            path = os.path.join(directory, os.path.basename(key))
+            self.client.download_file(self.bucket, self._key(key), path, Config=self.transfer)
+            yield path
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{self._key(key)}"
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)},
+                                                  ExpiresIn=self.presign_expires)
+
+    def location(self, key):
+        # ffmpeg seeks with HTTP range requests instead of downloading the whole video
+        return self.url(key)
+
+    def send(self, key, etag=None, max_age=0, immutable=False):
+        response = redirect(self.url(key))
+        if self.public_url:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            response.cache_control.immutable = immutable or None
+        else:
+            # Let browsers reuse a presigned URL (and so their cached copy) while it is valid
+            response.cache_control.private = True
+            response.cache_control.max_age = min(max_age, self.presign_expires // 2)
+        return response
+
+    def presigned_post(self, key, max_size, content_type=None):
+        """Form fields and URL a browser can POST a file of up to `max_size` bytes to."""
+        fields, conditions = {}, [['content-length-range', 1, max_size]]
+        if content_type:
+            fields['Content-Type'] = content_type
+            conditions.append({'Content-Type': content_type})
+        return self.client.generate_presigned_post(self.bucket, self._key(key), Fields=fields,
+                                                   Conditions=conditions, ExpiresIn=self.presign_expires)
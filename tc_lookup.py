@@ -0,0 +1,39 @@
+from sqlalchemy import event
+
+from models import TransferCertificate
+from cache import TTLCache
+
+# Admission numbers with no approved TC, so repeated lookups right after results day
+# skip the database. Cleared per admission number when a TC is added or changed.
+tc_misses = TTLCache(ttl=60, max_entries=10000)
+
+
+def admission_number_from_tc_number(tc_number):
+    """'X' from admin-issued numbers 'TC-X-YYYYmmddHHMM', or None for other formats."""
+    if not tc_number or not tc_number.startswith('TC-') or tc_number.count('-') < 2:
+        return None
+    return tc_number[len('TC-'):].rsplit('-', 1)[0] or None
+
+
+def normalize_admission_number(value):
+    return (value or '').strip()
+
+
+def find_approved_tc(admission_number, miss_ttl=None):
+    """The latest approved TC for an admission number, in one query on
+    ix_tc_admission_status_created_at; None (remembered for `miss_ttl` seconds) if there is none."""
+    admission_number = normalize_admission_number(admission_number)
+    if not admission_number or tc_misses.get(admission_number):
+        return None
+    tc = TransferCertificate.query.filter_by(admission_number=admission_number, status='approved').order_by(
+        TransferCertificate.created_at.desc()).first()
+    if tc is None and miss_ttl != 0:
+        tc_misses.set(admission_number, True, ttl=miss_ttl)
+    return tc
+
+
+@event.listens_for(TransferCertificate, 'after_insert')
+@event.listens_for(TransferCertificate, 'after_update')
+def _forget_miss(mapper, connection, target):
+    if target.admission_number:
+        tc_misses.delete(target.admission_number)
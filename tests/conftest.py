@@ -0,0 +1,89 @@
+"""Fixtures shared by the tests.
+
+Database tests run once per backend: SQLite always, and PostgreSQL when a server is
+available, either the one at TEST_DATABASE_URL (the user needs CREATEDB) or a
+throwaway cluster started with pglite (`pip install -e '.[test]'`). pglite needs
+PostgreSQL's pg_ctl on PATH and a non-root user, because initdb refuses to run as
+root; without them the PostgreSQL cases are skipped.
+"""
+import os
+import uuid
+import getpass
+
+import pytest
+
+# app.py reads these at import: keep the default database in memory and the log quiet
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from app import app as main_app, db, database_engine_options
+
+
+@pytest.fixture(scope='session')
+def postgres_server():
+    """URL of a PostgreSQL server the tests may create databases on."""
+    if os.environ.get('TEST_DATABASE_URL'):
+        yield make_url(os.environ['TEST_DATABASE_URL']).set(drivername='postgresql+psycopg2')
+        return
+
+    try:
+        import pglite
+        from pglite.pglite import find_pg_ctl, read_config
+    except ImportError:
+        pytest.skip('PostgreSQL tests need TEST_DATABASE_URL or the pglite package')
+    if os.geteuid() == 0:
+        pytest.skip('pglite cannot initialise a cluster as root')
+    if not pglite.check_cluster() and find_pg_ctl() is None:
+        pytest.skip("PostgreSQL tests need pg_ctl on PATH for pglite")
+
+    pglite.init_cluster()
+    already_running = pglite.is_started()
+    pglite.start_cluster()
+    yield make_url(f"postgresql+psycopg2://{getpass.getuser()}@localhost:{read_config()['port']}/postgres")
+    if not already_running:
+        pglite.stop_cluster()
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request, tmp_path):
+    """A new, empty database on each backend."""
+    if request.param == 'sqlite':
+        yield f"sqlite:///{tmp_path / 'test.db'}"
+        return
+
+    server = request.getfixturevalue('postgres_server')
+    name = f"schoolhub_test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(server.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    with admin.connect() as conn:
+        conn.execute(text(f'CREATE DATABASE "{name}"'))
+    yield server.set(database=name).render_as_string(hide_password=False)
+    with admin.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+    admin.dispose()
+
+
+@pytest.fixture
+def app(database_url, tmp_path):
+    """An app configured like app.py but on `database_url`, with its context pushed.
+
+    The schema is not created; tests call migrate.upgrade() or db.create_all().
+    """
+    test_app = Flask('app', root_path=main_app.root_path, instance_path=str(tmp_path / 'instance'))
+    test_app.config.update(main_app.config)
+    test_app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI=database_url,
+                           SQLALCHEMY_ENGINE_OPTIONS=database_engine_options(database_url))
+    db.init_app(test_app)
+    with test_app.app_context():
+        yield test_app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def dialect(app):
+    return db.engine.dialect.name
@@ -0,0 +1,95 @@
+import random
+import threading
+from datetime import date
+
+import pytest
+
+from app import db
+from migrate import upgrade
+from models import User, Teacher, Attendance, AttendanceRollup
+from attendance import record_attendance, check_rollups
+
+
+@pytest.fixture
+def school(app):
+    upgrade()
+    teacher = Teacher(username='teacher1', email='teacher1@example.com', role='teacher')
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', role='student',
+                     class_name='5A' if i < 4 else '6B') for i in range(6)]
+    db.session.add_all([teacher] + students)
+    db.session.commit()
+    return teacher, students
+
+
+def _marks(day):
+    return dict(db.session.execute(db.select(Attendance.student_id, Attendance.status)
+                                   .where(Attendance.date == day)).all())
+
+
+def _rollup(student_id):
+    rollup = AttendanceRollup.query.filter_by(student_id=student_id, month='2024-06').one()
+    return rollup.present, rollup.late, rollup.absent, rollup.days
+
+
+def test_record_attendance_marks_the_class(school):
+    teacher, students = school
+    a, b, c, d = [student.id for student in students[:4]]
+    day = date(2024, 6, 3)
+
+    # Students left out get the default; ids from another class are ignored
+    assert record_attendance('5A', day, {a: 'present', b: 'late', students[5].id: 'present'}, teacher.id) == 4
+    db.session.commit()
+    assert _marks(day) == {a: 'present', b: 'late', c: 'absent', d: 'absent'}
+    assert check_rollups() == []
+
+
+def test_resubmitting_overwrites_marks_and_rollups(school):
+    teacher, students = school
+    a, b = students[0].id, students[1].id
+    first, second = date(2024, 6, 3), date(2024, 6, 4)
+
+    record_attendance('5A', first, {a: 'present', b: 'absent'}, teacher.id)
+    record_attendance('5A', second, {a: 'present', b: 'present'}, teacher.id)
+    db.session.commit()
+    record_attendance('5A', first, {a: 'late', b: 'absent'}, teacher.id)
+    db.session.commit()
+
+    assert Attendance.query.count() == 8
+    assert _marks(first)[a] == 'late'
+    assert _rollup(a) == (1, 1, 0, 2)
+    assert _rollup(b) == (1, 0, 1, 2)
+    assert check_rollups() == []
+
+
+def test_invalid_status_is_rejected(school):
+    teacher, students = school
+    with pytest.raises(ValueError):
+        record_attendance('5A', date(2024, 6, 3), {students[0].id: 'asleep'}, teacher.id)
+
+
+def test_concurrent_submissions_keep_rollups_consistent(app, school):
+    teacher, students = school
+    teacher_id, student_ids = teacher.id, [student.id for student in students[:4]]
+    errors = []
+
+    def submit(seed):
+        rng = random.Random(seed)
+        try:
+            with app.app_context():
+                for _ in range(8):
+                    day = date(2024, 6, rng.randint(3, 5))
+                    statuses = {student_id: rng.choice(['present', 'late', 'absent']) for student_id in student_ids}
+                    record_attendance('5A', day, statuses, teacher_id)
+                    db.session.commit()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert check_rollups() == []
+    assert all(_rollup(student_id)[3] == 3 for student_id in student_ids)
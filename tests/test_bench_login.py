@@ -0,0 +1,10 @@
+import bench_login
+from app import app as main_app
+
+
+def test_bench_login_runs(capsys, monkeypatch):
+    # The benchmark reconfigures the app it imports; put that back afterwards
+    for key in ('PASSWORD_HASH_METHOD', 'WTF_CSRF_ENABLED'):
+        monkeypatch.setitem(main_app.config, key, main_app.config[key])
+    assert bench_login.main(['--iterations', '1', '--method', 'pbkdf2:sha256:1000']) == 0
+    assert 'pbkdf2:sha256:1000' in capsys.readouterr().out
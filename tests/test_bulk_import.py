@@ -0,0 +1,71 @@
+import io
+import csv
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import bulk_import
+from app import db
+from jobs import run_job, _claim
+from migrate import upgrade
+from models import User, Job
+from storage import get_storage
+
+STUDENTS = 'username,email,first_name,last_name,class_name\n' + ''.join(
+    f'student{i},student{i}@example.com,First{i},Last{i},5A\n' for i in range(5))
+
+
+@pytest.fixture
+def import_app(app, tmp_path, monkeypatch):
+    app.config.update(UPLOAD_FOLDER=str(tmp_path / 'uploads'), PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+                      IMPORT_HASH_WORKERS=1)
+    monkeypatch.setattr(bulk_import, 'CHUNK_SIZE', 2)
+    upgrade()
+    return app
+
+
+def _results(key):
+    return list(csv.DictReader(io.StringIO(get_storage().open(key).read().decode())))
+
+
+def _run(queued):
+    assert _claim(queued.id, 'test')
+    run_job(db.session.get(Job, queued.id))
+    return db.session.get(Job, queued.id)
+
+
+def test_import_job_stores_the_results(import_app):
+    queued = bulk_import.queue_import('students', FileStorage(io.BytesIO(STUDENTS.encode()), 'students.csv'))
+    finished = _run(queued)
+
+    assert finished.status == 'done' and finished.result['imported'] == 5
+    results = _results(queued.payload['results_key'])
+    assert [result['status'] for result in results] == ['imported'] * 5
+    for result in results:
+        assert User.query.filter_by(username=result['username']).one().check_password(result['password'])
+    assert not get_storage().exists(queued.payload['key'])
+
+
+def test_a_retried_import_keeps_the_passwords_it_handed_out(import_app, monkeypatch):
+    queued = bulk_import.queue_import('students', FileStorage(io.BytesIO(STUDENTS.encode()), 'students.csv'))
+    account_values = bulk_import.BulkImport._account_values
+
+    def fail_on_the_third_chunk(self, row, password_hash):
+        if row['username'] == 'student4':
+            raise RuntimeError('worker killed')
+        return account_values(self, row, password_hash)
+
+    monkeypatch.setattr(bulk_import.BulkImport, '_account_values', fail_on_the_third_chunk)
+    assert _run(queued).status == 'queued'  # Retried later
+    first = _results(queued.payload['results_key'])
+    assert User.query.filter_by(role='student').count() == 4
+    # The second chunk's passwords were saved before it committed
+    assert [result['status'] for result in first] == ['imported', 'imported', 'importing', 'importing']
+
+    monkeypatch.setattr(bulk_import.BulkImport, '_account_values', account_values)
+    assert _run(queued).status == 'done'
+    second = _results(queued.payload['results_key'])
+    assert [result['status'] for result in second] == ['imported'] * 5
+    assert [result['password'] for result in second[:4]] == [result['password'] for result in first[:4]]
+    for result in second:
+        assert User.query.filter_by(username=result['username']).one().check_password(result['password'])
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import app as main_app, db, database_engine_options
+
+
+def test_sqlite_engine_options():
+    options = database_engine_options('sqlite:///schoolhub.db')
+    assert options['connect_args'] == {'timeout': main_app.config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    assert options['pool_pre_ping'] is True
+    assert 'pool_size' not in options
+
+
+def test_postgres_engine_options(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '2')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '120')
+    options = database_engine_options('postgresql+psycopg2://school@localhost/school')
+    assert (options['pool_size'], options['max_overflow'], options['pool_recycle']) == (3, 2, 120)
+    assert options['pool_timeout'] == 30
+    assert 'connect_args' not in options
+
+
+def test_engine_uses_the_options(app, dialect):
+    with db.engine.connect() as conn:
+        assert conn.execute(text('SELECT 1')).scalar() == 1
+    assert db.engine.pool._pre_ping
+    if dialect == 'postgresql':
+        assert db.engine.pool.size() == 5
+
+
+def test_sqlite_connections_use_wal_and_busy_timeout(app, dialect):
+    if dialect != 'sqlite':
+        pytest.skip('SQLite only')
+    with db.engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == main_app.config['SQLITE_BUSY_TIMEOUT']
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+
+
+def test_sqlite_writer_waits_for_the_lock(database_url):
+    if not database_url.startswith('sqlite'):
+        pytest.skip('SQLite only')
+    engine = create_engine(database_url, **database_engine_options(database_url))
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE counter (n INTEGER)'))
+
+    holding = threading.Event()
+
+    def hold_lock():
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO counter VALUES (1)'))
+            holding.set()
+            time.sleep(0.5)
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    holding.wait()
+    # Without busy_timeout this fails at once with "database is locked"
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO counter VALUES (2)'))
+    holder.join()
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM counter')).scalar() == 2
+    engine.dispose()
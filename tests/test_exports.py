@@ -0,0 +1,36 @@
+import io
+import csv
+
+import pytest
+
+from app import db
+from migrate import upgrade
+from models import ContactMessage
+from exports import stream_export
+
+HOSTILE = {'name': '=HYPERLINK("http://evil")', 'email': 'a@example.com', 'subject': '+1+2',
+           'message': '@SUM(1)', 'response': '-2+3'}
+
+
+@pytest.fixture
+def messages(app):
+    upgrade()
+    db.session.add_all([ContactMessage(**HOSTILE),
+                        ContactMessage(name='Asha', email='asha@example.com', subject='Fees', message='\tHi -')])
+    db.session.commit()
+
+
+def test_csv_export_escapes_formulas(messages):
+    rows = list(csv.DictReader(io.StringIO(''.join(stream_export('messages')))))
+    assert [rows[0][field] for field in HOSTILE] == ["'" + HOSTILE['name'], 'a@example.com', "'+1+2",
+                                                      "'@SUM(1)", "'-2+3"]
+    assert (rows[1]['name'], rows[1]['message']) == ('Asha', "'\tHi -")
+
+
+def test_xlsx_export_escapes_formulas(messages):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.load_workbook(io.BytesIO(b''.join(stream_export('messages', 'xlsx'))))
+    header, first, _ = workbook.active.iter_rows(values_only=True)
+    row = dict(zip(header, first))
+    assert row['name'] == "'" + HOSTILE['name']
+    assert all(cell.data_type != 'f' for line in workbook.active.iter_rows() for cell in line)
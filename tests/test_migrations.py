@@ -0,0 +1,113 @@
+import importlib
+
+from sqlalchemy import inspect, text, delete
+
+from app import db
+from migrate import upgrade, available_migrations, applied_versions, schema_migrations
+from migrations import repoint_foreign_keys, foreign_keys_to
+
+baseline = importlib.import_module('migrations.0001_legacy_columns')
+
+
+def schema_differences(conn):
+    """How the database's tables differ from models.py: a list of readable mismatches."""
+    inspector = inspect(conn)
+    differences = []
+    tables = set(inspector.get_table_names()) - {'schema_migrations'}
+    if tables != set(db.metadata.tables):
+        differences.append(('tables', sorted(tables ^ set(db.metadata.tables))))
+    for name, table in db.metadata.tables.items():
+        if name not in tables:
+            continue
+        columns = {column['name']: column for column in inspector.get_columns(name)}
+        for column in table.columns:
+            found = columns.pop(column.name, None)
+            if found is None:
+                differences.append((name, 'missing column', column.name))
+            elif found['type'].python_type is not column.type.python_type or \
+                    found['nullable'] != (column.nullable and not column.primary_key):
+                differences.append((name, column.name, str(found['type']), found['nullable']))
+        if columns:
+            differences.append((name, 'extra columns', sorted(columns)))
+
+        foreign_keys = {(tuple(fk['constrained_columns']), fk['referred_table'])
+                        for fk in inspector.get_foreign_keys(name)}
+        expected = {((fk.parent.name,), fk.column.table.name) for fk in table.foreign_keys}
+        if foreign_keys != expected:
+            differences.append((name, 'foreign keys', sorted(foreign_keys), sorted(expected)))
+
+        indexes = {index['name'] for index in inspector.get_indexes(name)} | \
+                  {constraint['name'] for constraint in inspector.get_unique_constraints(name)}
+        missing = {index.name for index in table.indexes} - indexes
+        if missing:
+            differences.append((name, 'missing indexes', sorted(missing)))
+    return differences
+
+
+def test_migrations_build_the_model_schema(app):
+    upgrade()
+    with db.engine.connect() as conn:
+        assert schema_differences(conn) == []
+        assert applied_versions(conn) == {version for version, _ in available_migrations()}
+
+
+def test_migrations_run_once(app, capsys):
+    upgrade()
+    upgrade()
+    assert 'Applied 0 migration(s)' in capsys.readouterr().out
+
+
+def test_migrations_accept_a_create_all_database(app):
+    # CREATE_TABLES=1 databases are built from the models, then migrated
+    db.create_all()
+    upgrade()
+    with db.engine.connect() as conn:
+        assert schema_differences(conn) == []
+
+
+def test_upgrade_from_the_original_schema(app):
+    with db.engine.begin() as conn:
+        baseline.metadata.create_all(conn)
+        conn.execute(text("INSERT INTO teacher (id, username, email, subject) "
+                          "VALUES (1, 't1', 't1@example.com', 'Science'), (2, 't2', 't2@example.com', 'Maths')"))
+        conn.execute(text("""INSERT INTO "user" (id, username, email, role, class_name, teacher_id)
+                             VALUES (1, 'admin', 'a@example.com', 'admin', NULL, NULL),
+                                    (2, 's1', 's1@example.com', 'student', '5A', 2),
+                                    (3, 's2', 's2@example.com', 'student', '5A', 1)"""))
+        conn.execute(text("INSERT INTO assignment (id, title, teacher_id, student_id) VALUES (1, 'Homework', 2, 2)"))
+        conn.execute(text("INSERT INTO attendance (student_id, date, status, marked_by) "
+                          "VALUES (2, '2024-06-03', 'present', 1)"))
+        conn.execute(text("INSERT INTO transfer_certificate (id, student_id, tc_number) "
+                          "VALUES (1, 2, 'TC-A-17-202406011200'), (2, 3, 'TC3-202406011200')"))
+
+    upgrade()
+
+    with db.engine.connect() as conn:
+        assert foreign_keys_to(conn, ['teacher', 'teacher_legacy']) == []
+        assert schema_differences(conn) == [('tables', ['teacher_legacy'])]
+        teachers = dict(conn.execute(text(
+            'SELECT u.username, t.username FROM "user" u JOIN "user" t ON t.id = u.teacher_id')).all())
+        assert teachers == {'s1': 't2', 's2': 't1'}
+        assert conn.execute(text(
+            'SELECT t.username FROM assignment a JOIN "user" t ON t.id = a.teacher_id')).scalar() == 't2'
+        assert conn.execute(text(
+            'SELECT t.username FROM attendance a JOIN "user" t ON t.id = a.marked_by')).scalar() == 't1'
+        assert set(conn.scalars(text("SELECT username FROM \"user\" WHERE account_type = 'teacher'"))) == {'t1', 't2'}
+        assert dict(conn.execute(text('SELECT id, admission_number FROM transfer_certificate')).all()) == \
+            {1: 'A-17', 2: 's2'}
+
+
+def test_teacher_foreign_keys_are_repaired(app):
+    # A database migrated before 0004 kept its foreign keys on "user" left them on teacher_legacy
+    upgrade()
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE TABLE teacher_legacy (id INTEGER PRIMARY KEY)'))
+        repoint_foreign_keys(conn, ['user'], 'teacher_legacy')
+        conn.execute(delete(schema_migrations).where(schema_migrations.c.version == '0009'))
+        assert foreign_keys_to(conn, ['teacher_legacy'])
+
+    upgrade()
+
+    with db.engine.connect() as conn:
+        assert foreign_keys_to(conn, ['teacher_legacy']) == []
+        assert schema_differences(conn) == [('tables', ['teacher_legacy'])]
@@ -0,0 +1,134 @@
+import io
+import os
+import json
+import base64
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+requests = pytest.importorskip('requests')
+
+from app import db
+from migrate import upgrade
+from models import Document, UploadBlob
+from storage import S3Storage, get_storage
+from uploads import adopt_upload, new_direct_upload, is_direct_upload, store_stream, collect_garbage, upload_key
+
+BUCKET = 'school-uploads'
+PART_SIZE = 5 * 1024 * 1024  # S3's smallest multipart part
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in (('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_SESSION_TOKEN', 'testing'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        boto3.client('s3').create_bucket(Bucket=BUCKET)
+        yield boto3.client('s3')
+
+
+@pytest.fixture
+def s3_app(app, s3):
+    app.config.update(UPLOAD_STORAGE='s3', S3_BUCKET=BUCKET, S3_PREFIX='uploads',
+                      UPLOAD_MULTIPART_CHUNK_SIZE=PART_SIZE)
+    upgrade()
+    return app
+
+
+def test_put_file_uploads_in_parts(s3, tmp_path):
+    storage = S3Storage(BUCKET, prefix='uploads', chunk_size=PART_SIZE)
+    data = os.urandom(2 * PART_SIZE + 1024)
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(data)
+
+    storage.put_file('blobs/ab/video.mp4', str(path), cache_control='public, max-age=60')
+
+    assert not path.exists()
+    head = s3.head_object(Bucket=BUCKET, Key='uploads/blobs/ab/video.mp4')
+    assert head['ETag'].strip('"').endswith('-3')  # three parts
+    assert head['ContentType'] == 'video/mp4'
+    assert head['CacheControl'] == 'public, max-age=60'
+    assert storage.open('blobs/ab/video.mp4').read() == data
+    assert storage.size('blobs/ab/video.mp4') == len(data)
+    assert storage.size('blobs/ab/missing.mp4') is None
+
+
+def test_presigned_post_accepts_a_browser_upload(s3):
+    storage = S3Storage(BUCKET, prefix='uploads')
+    post = storage.presigned_post('incoming/clip.mp4', max_size=1024, content_type='video/mp4')
+
+    response = requests.post(post['url'], data=post['fields'], files={'file': ('clip.mp4', b'x' * 100)})
+    assert response.status_code == 204
+    assert storage.exists('incoming/clip.mp4')
+
+    # moto does not enforce the policy, so check what S3 would
+    policy = json.loads(base64.b64decode(post['fields']['policy']))
+    assert ['content-length-range', 1, 1024] in policy['conditions']
+    assert {'Content-Type': 'video/mp4'} in policy['conditions']
+
+
+def test_adopt_upload_copies_into_the_store(s3_app, s3):
+    url, post = new_direct_upload('Sports Day.MP4', 'video/mp4')
+    assert url.startswith('/uploads/incoming/') and url.endswith('.mp4')
+    assert post['fields']['key'] == 'uploads/' + upload_key(url)
+    s3.put_object(Bucket=BUCKET, Key=post['fields']['key'], Body=b'video bytes')
+    assert is_direct_upload(url)
+
+    blob_url = adopt_upload(url)
+    db.session.add(Document(title='Sports day', document_type='video', file_url=blob_url))
+    db.session.commit()
+
+    assert blob_url.startswith('/uploads/blobs/')
+    assert get_storage().open(upload_key(blob_url)).read() == b'video bytes'
+    assert UploadBlob.query.filter_by(url=blob_url).one().ref_count == 1
+    # Same content through the form: one blob, two references
+    assert store_stream(io.BytesIO(b'video bytes'), '.mp4') == blob_url
+    db.session.commit()
+    assert UploadBlob.query.filter_by(url=blob_url).one().ref_count == 2
+
+
+def test_adopting_the_same_upload_twice(s3_app, s3):
+    url, post = new_direct_upload('clip.mp4')
+    s3.put_object(Bucket=BUCKET, Key=post['fields']['key'], Body=b'clip')
+
+    first = adopt_upload(url)
+    db.session.add(Document(title='first', document_type='video', file_url=first))
+    db.session.commit()
+    second = adopt_upload(url)
+    db.session.add(Document(title='second', document_type='video', file_url=second))
+    db.session.commit()
+
+    assert first == second
+    assert UploadBlob.query.filter_by(url=first).one().ref_count == 2
+
+    # Once adopted and unused, the incoming object is garbage
+    removed = collect_garbage(min_age=0)
+    assert removed == [upload_key(url)]
+    assert not is_direct_upload(url)
+    assert get_storage().exists(upload_key(first))
+
+
+def test_integrity_scan_and_variant_backfill_use_the_bucket(s3_app, s3):
+    from PIL import Image
+    from backfill_image_variants import backfill
+    from check_media_integrity import scan
+    from fix_file_paths import upload_exists, find_relocated_url
+    from models import Banner
+
+    image = io.BytesIO()
+    Image.new('RGB', (800, 400), 'green').save(image, 'PNG')
+    s3.put_object(Bucket=BUCKET, Key='uploads/banners/sports.png', Body=image.getvalue())
+    db.session.add_all([Banner(title='Found', image_url='/uploads/banners/sports.png'),
+                        Banner(title='Moved', image_url='/uploads/sports.png')])
+    db.session.commit()
+
+    assert upload_exists('/uploads/banners/sports.png') and not upload_exists('/uploads/sports.png')
+    assert find_relocated_url('/uploads/sports.png', 'banners') == '/uploads/banners/sports.png'
+    assert [(problem['url'], problem['status']) for problem in scan()] == [('/uploads/sports.png', 'relocatable')]
+
+    backfill()
+    variants = Banner.query.filter_by(title='Found').one().image_variants
+    assert variants and all(get_storage().exists(upload_key(variant['url'])) for variant in variants)
+    assert Banner.query.filter_by(title='Moved').one().image_variants is None
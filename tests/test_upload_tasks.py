@@ -0,0 +1,52 @@
+import io
+import os
+
+import pytest
+
+import upload_tasks
+from app import db
+from migrate import upgrade
+from models import Banner, Document, UploadBlob
+from storage import get_storage, upload_key
+from uploads import store_stream, check_refcounts
+
+
+@pytest.fixture
+def uploads_app(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    upgrade()
+    return app
+
+
+def test_infected_blob_is_cleared_from_every_row(uploads_app, monkeypatch):
+    monkeypatch.setattr(upload_tasks, 'scan_for_viruses', lambda path: True)
+    url = store_stream(io.BytesIO(b'%PDF-1.4 infected'), '.pdf')
+    assert store_stream(io.BytesIO(b'%PDF-1.4 infected'), '.pdf') == url
+    db.session.add_all([Document(title='Form', document_type='form', file_url=url),
+                        Banner(title='Banner', image_url=url, image_variants=[{'url': '/uploads/x-480w.webp'}])])
+    db.session.commit()
+    assert UploadBlob.query.filter_by(url=url).one().ref_count == 2
+
+    report = upload_tasks.inspect_upload(url)
+
+    assert report['infected'] is True and report['rows_cleared'] == 2
+    assert not get_storage().exists(upload_key(url))
+    assert os.listdir(os.path.join(uploads_app.instance_path, 'quarantine')) == [os.path.basename(url)]
+    document, banner = Document.query.one(), Banner.query.one()
+    assert (document.file_url, document.is_public) == ('', False)
+    assert (banner.image_url, banner.is_active, banner.image_variants) == ('', False, None)
+    assert UploadBlob.query.count() == 0
+    assert check_refcounts() == []
+
+
+def test_clean_upload_is_kept(uploads_app, monkeypatch):
+    monkeypatch.setattr(upload_tasks, 'scan_for_viruses', lambda path: False)
+    url = store_stream(io.BytesIO(b'%PDF-1.4 clean'), '.pdf')
+    db.session.add(Document(title='Form', document_type='form', file_url=url))
+    db.session.commit()
+
+    report = upload_tasks.inspect_upload(url)
+
+    assert report['infected'] is False and report['detected_type'] == 'pdf'
+    assert get_storage().exists(upload_key(url))
+    assert Document.query.one().file_url == url
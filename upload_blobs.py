@@ -0,0 +1,48 @@
+"""Maintain the content-addressed upload store (see uploads.py).
+
+    python upload_blobs.py check      # report blobs whose reference count disagrees with the database
+    python upload_blobs.py rebuild    # recount references (after imports, restores or manual edits)
+    python upload_blobs.py gc         # delete blob files no upload_blob row owns, direct uploads no row
+                                      # uses (adopted ones included), and abandoned resumable uploads
+
+`check` exits non-zero when it finds a mismatch, so it can run from cron. Run `gc`
+from cron too (hourly, say) when direct uploads are enabled: it is what deletes
+their incoming objects.
+"""
+import sys
+import argparse
+
+from app import app, db
+from uploads import check_refcounts, rebuild_refcounts, collect_garbage
+from resumable_uploads import expire_uploads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check, rebuild or garbage-collect the upload blob store.')
+    parser.add_argument('command', choices=['check', 'rebuild', 'gc'])
+    parser.add_argument('--min-age', type=int, default=3600,
+                        help='gc: only delete files older than this many seconds (default: 3600)')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if args.command == 'rebuild':
+            count = rebuild_refcounts()
+            db.session.commit()
+            print(f"Updated {count} upload blob(s).")
+            return 0
+
+        if args.command == 'gc':
+            removed = collect_garbage(args.min_age)
+            expired = expire_uploads(app.config['RESUMABLE_UPLOAD_EXPIRY'])
+            print(f"Deleted {len(removed)} orphaned file(s) and {expired} abandoned resumable upload(s).")
+            return 0
+
+        mismatches = check_refcounts()
+        for mismatch in mismatches:
+            print(f"{mismatch['url']}: expected {mismatch['expected']} reference(s), found {mismatch['actual']}")
+        print(f"{len(mismatches)} mismatched upload blob(s).")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
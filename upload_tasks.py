@@ -0,0 +1,199 @@
+"""Background jobs that post-process uploaded files.
+
+Dashboard routes save the raw upload and enqueue one of these jobs; the worker
+(`python worker.py`) picks them up so the admin request returns immediately.
+"""
+import os
+import re
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from flask import current_app
+
+from app import db
+from jobs import job, enqueue
+from models import Banner, PopupBanner, GalleryItem, Media
+from image_variants import apply_variants
+from storage import get_storage, upload_key
+from uploads import store_stream, adopt_upload, is_direct_upload, blob_hash, immutable_cache_control, quarantine_upload
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MODELS = {model.__name__: model for model in (Banner, PopupBanner, GalleryItem, Media)}
+
+# Leading bytes of the file types we accept as uploads
+SIGNATURES = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'PK\x03\x04', 'zip'),  # docx, xlsx, pptx
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'ole'),  # doc, xls, ppt
+]
+
+EXTENSION_TYPES = {
+    'pdf': 'pdf', 'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'gif': 'gif', 'webp': 'webp',
+    'docx': 'zip', 'xlsx': 'zip', 'pptx': 'zip', 'doc': 'ole', 'xls': 'ole', 'ppt': 'ole',
+    'mp4': 'mp4', 'mov': 'mp4', 'm4v': 'mp4',
+}
+
+
+def enqueue_media_processing(media):
+    """Queue the post-processing a newly saved Media upload needs."""
+    if is_direct_upload(media.file_url):
+        enqueue('adopt_upload', media_id=media.id)
+    elif media.thumbnail_url and media.thumbnail_url.startswith('/uploads/'):
+        enqueue('image_variants', model='Media', id=media.id, field='thumbnail_url')
+    elif media.file_url and media.file_url.startswith('/uploads/'):
+        if media.media_type == 'photo':
+            enqueue('image_variants', model='Media', id=media.id, field='file_url')
+        else:
+            enqueue('video_thumbnail', media_id=media.id)
+
+
+def build_variants(obj, url):
+    """Generate an image's variants from a local copy and store them next to it."""
+    storage = get_storage()
+    with storage.local_copy(upload_key(url)) as path:
+        apply_variants(obj, path, url)
+        stem, _ = os.path.splitext(path)
+        for variant in obj.image_variants or []:
+            storage.put_file(upload_key(variant['url']), f"{stem}-{variant['width']}w.{variant['format']}",
+                             cache_control=immutable_cache_control() if blob_hash(url) else None)
+
+
+@job('image_variants')
+def build_image_variants(model, id, field):
+    obj = db.session.get(IMAGE_MODELS[model], id)
+    if obj is None:
+        return {'skipped': 'record deleted'}
+    url = getattr(obj, field)
+    if not url or not url.startswith('/uploads/'):
+        return {'skipped': 'not a local upload'}
+
+    build_variants(obj, url)
+    db.session.commit()
+    return {'url': url, 'variants': len(obj.image_variants or [])}
+
+
+@job('video_thumbnail')
+def extract_video_thumbnail(media_id):
+    media = db.session.get(Media, media_id)
+    if media is None:
+        return {'skipped': 'record deleted'}
+    if media.thumbnail_url or not media.file_url or not media.file_url.startswith('/uploads/'):
+        return {'skipped': 'thumbnail not needed'}
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return {'skipped': 'ffmpeg is not installed'}
+
+    with tempfile.TemporaryDirectory() as directory:
+        frame_path = os.path.join(directory, 'thumbnail.jpg')
+        source = get_storage().location(upload_key(media.file_url))
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-ss', '1', '-i', source,
+                        '-frames:v', '1', '-vf', 'scale=1280:-2', frame_path],
+                       check=True, timeout=300)
+        with open(frame_path, 'rb') as frame:
+            thumbnail_url = store_stream(frame, '.jpg')
+
+    media.thumbnail_url = thumbnail_url
+    build_variants(media, thumbnail_url)
+    db.session.commit()
+    return {'thumbnail_url': thumbnail_url}
+
+
+@job('adopt_upload')
+def adopt_direct_upload(media_id):
+    """Move a Media file the browser uploaded straight to object storage into the blob store."""
+    media = db.session.get(Media, media_id)
+    if media is None:
+        return {'skipped': 'record deleted'}
+    if not is_direct_upload(media.file_url):
+        return {'skipped': 'not a direct upload'}
+
+    media.file_url = adopt_upload(media.file_url)
+    db.session.commit()
+    enqueue_media_processing(media)
+    return {'file_url': media.file_url}
+
+
+def detect_type(path):
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    for signature, kind in SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    return None
+
+
+def count_pdf_pages(path):
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages)
+    except ImportError:
+        # Best effort without pypdf: count page objects in uncompressed object tables
+        with open(path, 'rb') as f:
+            return len(re.findall(rb'/Type\s*/Page(?!s)', f.read())) or None
+    except Exception as e:
+        logger.warning(f"Could not count pages in {path}: {str(e)}")
+        return None
+
+
+def scan_for_viruses(path):
+    """Run ClamAV if it is installed. Returns True/False, or None when no scanner is available."""
+    scanner = shutil.which('clamdscan') or shutil.which('clamscan')
+    if not scanner:
+        return None
+    result = subprocess.run([scanner, '--no-summary', path], capture_output=True, timeout=300)
+    if result.returncode == 1:
+        return True
+    if result.returncode == 0:
+        return False
+    logger.error(f"Virus scanner failed on {path}: {result.stderr.decode(errors='replace')}")
+    return None
+
+
+@job('inspect_upload')
+def inspect_upload(url):
+    storage = get_storage()
+    key = upload_key(url)
+    if not storage.exists(key):
+        return {'skipped': 'file no longer exists'}
+
+    with storage.local_copy(key) as path:
+        detected = detect_type(path)
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        expected = EXTENSION_TYPES.get(extension)
+        report = {
+            'url': url,
+            'size': os.path.getsize(path),
+            'detected_type': detected,
+            'extension_matches': expected is None or expected == detected,
+        }
+        if not report['extension_matches']:
+            logger.warning(f"Upload {url} has extension .{extension} but looks like {detected}")
+
+        if detected == 'pdf':
+            report['pdf_pages'] = count_pdf_pages(path)
+
+        infected = scan_for_viruses(path)
+        report['infected'] = infected
+        if infected:
+            quarantine = os.path.join(current_app.instance_path, 'quarantine')
+            os.makedirs(quarantine, exist_ok=True)
+            shutil.copyfile(path, os.path.join(quarantine, os.path.basename(path)))
+
+    if report['infected']:
+        # The blob may be shared: every row using it is cleared along with the file
+        report['rows_cleared'] = quarantine_upload(url)
+        logger.error(f"Upload {url} failed the virus scan and was moved to {quarantine}; "
+                     f"{report['rows_cleared']} row(s) no longer use it")
+    return report
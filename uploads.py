@@ -0,0 +1,376 @@
+"""Content-addressed store for uploaded files, and serving them with long-lived caching.
+
+Every upload is hashed while it streams in and stored once, at
+/uploads/blobs/<first two hex digits>/<sha256><ext> in the storage backend (see
+storage.py), however many rows or models use it. An UploadBlob row counts the URL
+columns (see REFERENCES) pointing at each blob: save_upload() and retain_upload() add
+references, release_upload() drops them, and a blob's row and file (with its image
+variants) are deleted once the transaction that drops its last reference commits,
+unless another reference was added in the meantime. Large files can skip the app
+servers: new_direct_upload() lets the browser upload to object storage, and
+adopt_upload() then copies the file into the store.
+
+Because a blob's URL is derived from its content, send_upload() serves blobs with
+`Cache-Control: public, max-age=<UPLOAD_CACHE_MAX_AGE>, immutable`, the hash as a
+strong ETag, and Range support for video seeking. Files from before the store keep
+their URLs and must be revalidated; they are deleted when the last row using them is.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import contextlib
+
+from flask import current_app
+from sqlalchemy import event, select, update, func, null
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+from app import db
+from storage import get_storage, upload_key
+from models import (UploadBlob, Banner, PopupBanner, GalleryItem, Media, Document, FeeStructure, PublicDisclosure,
+                    Announcement, Assignment, AssignmentSubmission, TransferCertificate)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Every column that can hold an /uploads/... URL
+REFERENCES = [
+    (Banner, 'image_url'), (PopupBanner, 'image_url'), (GalleryItem, 'image_url'),
+    (Media, 'file_url'), (Media, 'thumbnail_url'), (Document, 'file_url'), (FeeStructure, 'file_url'),
+    (PublicDisclosure, 'file_url'), (Announcement, 'file_url'), (Assignment, 'file_url'),
+    (AssignmentSubmission, 'file_url'), (TransferCertificate, 'file_url'),
+]
+
+_INCOMING_URL = re.compile(r'^/uploads/incoming/[0-9a-f]{32}(\.[A-Za-z0-9]+)?$')
+
+# "-<width>w.<format>" after the stem of an image: the variants image_variants.py writes
+_VARIANT_KEY = re.compile(r'^-\d+w\.[a-z0-9]+$')
+
+_BLOB_URL = re.compile(r'^/uploads/blobs/[0-9a-f]{2}/([0-9a-f]{64})\.[A-Za-z0-9]+$')
+
+# Names that never change content: blobs, "<stem>-<16 hex>" names from before the store,
+# and the "-<width>w" variants image_variants.py writes next to either
+_IMMUTABLE_NAME = re.compile(r'(?:^blobs/[0-9a-f]{2}/|-)([0-9a-f]{64}|[0-9a-f]{16})(-\d+w)?\.[A-Za-z0-9]+$')
+
+
+def blob_hash(url):
+    """The sha256 of a blob URL, or None for any other URL."""
+    match = _BLOB_URL.match(url or '')
+    return match.group(1) if match else None
+
+
+def _blob_url(digest, extension):
+    return f"/uploads/blobs/{digest[:2]}/{digest}{extension}"
+
+
+def save_upload(file):
+    """Store a werkzeug FileStorage (or anything with .filename and .stream) and return its URL.
+
+    Adds one reference to the blob, creating it if this content is new. The caller commits;
+    on rollback the reference is dropped again and the file is left for `upload_blobs.py gc`.
+    """
+    _, extension = os.path.splitext(secure_filename(file.filename or ''))
+    return store_stream(file.stream, extension)
+
+
+def store_stream(stream, extension=''):
+    """Store the bytes of a binary stream as a blob and add one reference to it.
+
+    The stream is spooled to a local temporary file while it is hashed, then handed to
+    the storage backend (a rename on local disk, a multipart upload to S3).
+    """
+    storage = get_storage()
+    if storage.temp_dir:
+        os.makedirs(storage.temp_dir, exist_ok=True)
+
+    digest, size = hashlib.sha256(), 0
+    fd, temp_path = tempfile.mkstemp(dir=storage.temp_dir, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := stream.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        digest = digest.hexdigest()
+        blob = _add_reference(digest, extension.lower(), size)
+        if storage.exists(upload_key(blob.url)):
+            os.remove(temp_path)
+        else:
+            storage.put_file(upload_key(blob.url), temp_path, cache_control=immutable_cache_control())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return blob.url
+
+
+def immutable_cache_control():
+    """Cache-Control for objects whose content never changes, e.g. blobs and their variants."""
+    return f"public, max-age={current_app.config['UPLOAD_CACHE_MAX_AGE']}, immutable"
+
+
+def new_direct_upload(filename, content_type=None):
+    """Let a browser upload a large file straight to storage, bypassing the app servers.
+
+    Returns (url, presigned POST {url, fields}); the file lands under /uploads/incoming/
+    and is copied into the blob store by adopt_upload() once a row points at it. Only
+    storage backends with supports_direct_upload can do this.
+    """
+    _, extension = os.path.splitext(secure_filename(filename or ''))
+    url = f"/uploads/incoming/{uuid.uuid4().hex}{extension.lower()}"
+    post = get_storage().presigned_post(upload_key(url), current_app.config['UPLOAD_DIRECT_MAX_SIZE'],
+                                        content_type)
+    return url, post
+
+
+def is_direct_upload(url):
+    """True if `url` is a finished upload made through new_direct_upload()."""
+    return bool(_INCOMING_URL.match(url or '')) and get_storage().exists(upload_key(url))
+
+
+def adopt_upload(url):
+    """Copy a direct upload into the blob store and return its blob URL, with one reference.
+
+    The object is hashed as it streams from storage and copied inside the bucket, so it
+    never has to fit on the worker's disk. The caller points the row at the returned URL
+    and commits. The incoming object stays, so a URL submitted twice (a double-clicked
+    form, two rows) can be adopted again; collect_garbage() deletes it once no row
+    points at it.
+    """
+    storage = get_storage()
+    digest, size = hashlib.sha256(), 0
+    with contextlib.closing(storage.open(upload_key(url))) as stream:
+        while chunk := stream.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    digest = digest.hexdigest()
+    _, extension = os.path.splitext(url)
+    blob = _add_reference(digest, extension.lower(), size)
+    if not storage.exists(upload_key(blob.url)):
+        storage.copy(upload_key(url), upload_key(blob.url), cache_control=immutable_cache_control())
+    return blob.url
+
+
+def _add_reference(digest, extension, size):
+    """Add one reference to the blob with this content, creating its row if there is none.
+
+    The UPDATE goes first: it waits for a concurrent _remove_unreferenced() of the same
+    blob to finish, and finds no row if that deleted it. The row is then made again, and
+    the caller stores the file again, because it looks for the file only after this.
+    """
+    if not _change_references(digest, 1):
+        try:
+            with db.session.begin_nested():
+                blob = UploadBlob(sha256=digest, url=_blob_url(digest, extension), size=size, ref_count=1)
+                db.session.add(blob)
+            logger.info(f"Stored new upload blob {blob.url} ({size} bytes)")
+            return blob
+        except IntegrityError:
+            # Stored by a concurrent request in the meantime
+            _change_references(digest, 1)
+    blob = UploadBlob.query.filter_by(sha256=digest).one()
+    logger.info(f"Upload deduplicated against {blob.url}")
+    return blob
+
+
+def _change_references(digest, delta):
+    """Add `delta` to a blob's ref_count; returns False if the blob has no row."""
+    result = db.session.execute(update(UploadBlob).where(UploadBlob.sha256 == digest)
+                                .values(ref_count=UploadBlob.ref_count + delta))
+    return result.rowcount > 0
+
+
+def retain_upload(url, count=1):
+    """Record `count` more rows pointing at an upload, e.g. after copying its URL into them."""
+    if count < 0:
+        release_upload(url, -count)
+    elif count and blob_hash(url):
+        _change_references(blob_hash(url), count)
+
+
+def release_upload(url, count=1):
+    """Drop `count` references to an upload whose row is being deleted or given a new file.
+
+    Blobs left with no references are deleted after commit (see _remove_unreferenced).
+    Files from before the store are unlinked after commit unless some other row still
+    uses the same URL.
+    """
+    if not url or not url.startswith('/uploads/') or count <= 0:
+        return
+    digest = blob_hash(url)
+    if digest is None:
+        _unlink_after_commit(url)
+        return
+    _change_references(digest, -count)
+    remaining = db.session.scalar(select(UploadBlob.ref_count).where(UploadBlob.sha256 == digest))
+    if remaining is not None and remaining <= 0:
+        # The row stays at 0 until after commit, so a concurrent _add_reference() still finds it
+        _unlink_after_commit(url)
+
+
+def _unlink_after_commit(url):
+    db.session.info.setdefault('released_uploads', set()).add(url)
+
+
+def reference_counts(urls=None):
+    """{url: number of rows referencing it} over REFERENCES, optionally only for `urls`."""
+    counts = {}
+    for model, field in REFERENCES:
+        column = getattr(model, field)
+        query = select(column, func.count()).where(column.like('/uploads/%'))
+        if urls is not None:
+            query = query.where(column.in_(urls))
+        for url, count in db.session.execute(query.group_by(column)):
+            counts[url] = counts.get(url, 0) + count
+    return counts
+
+
+def check_refcounts():
+    """Blobs whose ref_count disagrees with the rows referencing them: [{url, expected, actual}].
+
+    `actual` is None for blob URLs stored in some row but missing from upload_blob.
+    """
+    expected = {url: count for url, count in reference_counts().items() if blob_hash(url)}
+    actual = dict(db.session.execute(select(UploadBlob.url, UploadBlob.ref_count)).all())
+    return [{'url': url, 'expected': expected.get(url, 0), 'actual': actual.get(url)}
+            for url in sorted(set(expected) | set(actual)) if expected.get(url, 0) != actual.get(url)]
+
+
+def rebuild_refcounts():
+    """Recount every blob's references from REFERENCES; blobs nobody uses are deleted after commit.
+
+    Returns the number of blobs changed. The caller commits.
+    """
+    changed = 0
+    for mismatch in check_refcounts():
+        url, count = mismatch['url'], mismatch['expected']
+        if mismatch['actual'] is None:
+            size = get_storage().size(upload_key(url))
+            if size is None:
+                logger.warning(f"Upload blob {url} is referenced but its file is missing")
+                continue
+            db.session.add(UploadBlob(sha256=blob_hash(url), url=url, size=size, ref_count=count))
+        else:
+            db.session.execute(update(UploadBlob).where(UploadBlob.url == url).values(ref_count=count))
+            if not count:
+                _unlink_after_commit(url)
+        changed += 1
+    return changed
+
+
+def quarantine_upload(url):
+    """Take an upload out of use, e.g. one that failed the virus scan, and delete it. Commits.
+
+    Every row pointing at the URL loses it: the column is cleared (set to '' where it
+    is required), the row's image variants are dropped and the row is hidden through its
+    is_active or is_public flag. The blob's row goes in the same transaction, so the reference counts
+    stay consistent, and the file and its variants are deleted after the commit. Returns
+    the number of rows changed.
+    """
+    changed = 0
+    for model, field in REFERENCES:
+        column = model.__table__.c[field]
+        values = {field: null() if column.nullable else ''}
+        if hasattr(model, 'image_variants'):
+            values['image_variants'] = null()
+        for flag in ('is_active', 'is_public'):
+            if hasattr(model, flag):
+                values[flag] = False
+        changed += db.session.execute(update(model).where(column == url).values(**values)).rowcount
+    db.session.execute(UploadBlob.__table__.delete().where(UploadBlob.url == url))
+    db.session.commit()
+    _remove_files(url)
+    return changed
+
+
+def collect_garbage(min_age=3600):
+    """Delete stored files nothing owns once they are `min_age` seconds old: blob files
+    without an UploadBlob row (e.g. from a request that rolled back) and direct uploads
+    no row points at, including those already adopted into the store. Blobs left at no
+    references (e.g. when deleting them after commit failed) are deleted too. Returns
+    the keys removed."""
+    storage = get_storage()
+    _remove_unreferenced(set(db.session.scalars(select(UploadBlob.url).where(UploadBlob.ref_count <= 0))))
+    known = {blob_hash(url) for url in db.session.scalars(select(UploadBlob.url))}
+    cutoff = time.time() - min_age
+    removed = []
+    for key, modified in storage.list('blobs/'):
+        if os.path.basename(key)[:64] not in known and modified < cutoff:
+            removed.append(key)
+    incoming = {key for key, modified in storage.list('incoming/') if modified < cutoff}
+    used = reference_counts([f"/uploads/{key}" for key in incoming]) if incoming else {}
+    removed.extend(key for key in incoming if f"/uploads/{key}" not in used)
+    for key in removed:
+        storage.delete(key)
+        logger.info(f"Deleted orphaned upload {key}")
+    return removed
+
+
+def _remove_files(url):
+    storage = get_storage()
+    key = upload_key(url)
+    stem, _ = os.path.splitext(key)
+    variants = [variant for variant, _ in storage.list(stem + '-') if _VARIANT_KEY.match(variant[len(stem):])]
+    for file_key in [key] + variants:
+        try:
+            storage.delete(file_key)
+            logger.info(f"Deleted unreferenced upload {file_key}")
+        except Exception as e:
+            logger.error(f"Failed to delete upload {file_key}: {str(e)}")
+
+
+@event.listens_for(Session, 'after_commit')
+def _unlink_released(db_session):
+    urls = db_session.info.pop('released_uploads', None)
+    if urls:
+        _remove_unreferenced(urls)
+
+
+def _remove_unreferenced(urls):
+    """Delete the files (and blob rows) of `urls` that nothing uses any more.
+
+    Each URL gets its own transaction on a fresh connection. A blob's row is deleted only
+    while its ref_count is still 0, and its files go before that deletion commits: the
+    DELETE holds the row (or, on SQLite, the database) until then, so a request adding a
+    reference at the same moment either got there first and the blob is kept, or waits
+    and then stores the blob again (see _add_reference). Failures are logged and left
+    for `upload_blobs.py gc`.
+    """
+    for url in urls:
+        try:
+            with db.engine.begin() as conn:
+                # Another request may have pointed a row at the same file since the reference was dropped
+                if any(conn.scalar(select(getattr(model, field)).where(getattr(model, field) == url).limit(1))
+                       for model, field in REFERENCES):
+                    continue
+                if blob_hash(url) and not conn.execute(UploadBlob.__table__.delete().where(
+                        UploadBlob.url == url, UploadBlob.ref_count <= 0)).rowcount:
+                    continue
+                _remove_files(url)
+        except Exception as e:
+            logger.error(f"Failed to delete released upload {url}: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_released(db_session):
+    db_session.info.pop('released_uploads', None)
+
+
+def send_upload(filename):
+    """Response for static/uploads/<filename>.
+
+    Local files are sent honouring If-None-Match, If-Range and Range; files in object
+    storage are a redirect to the object, so any instance can serve any upload.
+    """
+    match = _IMMUTABLE_NAME.search(filename)
+    if match is None:
+        # Human-readable names from before content hashing may be overwritten: let clients revalidate
+        return get_storage().send(filename)
+    return get_storage().send(filename, etag=match.group(1) + (match.group(2) or ''),
+                              max_age=current_app.config['UPLOAD_CACHE_MAX_AGE'], immutable=True)
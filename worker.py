@@ -0,0 +1,28 @@
+"""Background job worker.
+
+Run one or more of these next to gunicorn:
+
+    python worker.py            # poll forever
+    python worker.py --once     # drain the queue and exit
+"""
+import argparse
+
+from app import app
+from jobs import work
+import upload_tasks  # noqa: F401  (registers the upload job handlers)
+import report_cards  # noqa: F401  (registers the report card job handler)
+import bulk_import  # noqa: F401  (registers the bulk import job handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Process queued background jobs.')
+    parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='seconds to wait when idle')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        work(poll_interval=args.poll_interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()